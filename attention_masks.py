@@ -16,8 +16,8 @@ import gc
 
 from .sigmas  import get_sigmas
 
-from .helper  import initialize_or_scale, precision_tool, get_res4lyf_scheduler_list
-from .latents import get_orthogonal, get_collinear, get_edge_mask, checkerboard_variable
+from .helper  import initialize_or_scale, precision_tool, get_res4lyf_scheduler_list, tensor_hash, TensorCache, CastCache
+from .latents import get_orthogonal, get_collinear, get_edge_mask, get_edge_masks, checkerboard_variable
 from .res4lyf import RESplain
 from .beta.constants import MAX_STEPS
 
@@ -89,7 +89,19 @@ class CoreAttnMask:
 
 
 
+ATTN_MASK_CACHE = TensorCache(max_entries=8)   # generated masks, shared within a sampler call; cleared at its end by clear_attn_mask_caches()
+EDGE_MASK_CACHE = TensorCache(max_entries=32)
+
+def clear_attn_mask_caches():
+    """Release cached attention masks (mask states can be several GB at 2x latent resolution). Called by the sampler once a run ends."""
+    ATTN_MASK_CACHE.clear()
+    EDGE_MASK_CACHE.clear()
+
+
+
 class BaseAttentionMask:
+    GENERATED_ATTRS = ("attn_mask", "cross_self_mask", "self_attn_mask", "edge_width_list")
+    
     def __init__(self, mask_type="gradient", edge_width=0, edge_width_list=None, use_self_attn_mask_list=None, dtype=torch.float16):
         self.t                    = 1
         self.img_len              = 0
@@ -121,11 +133,14 @@ class BaseAttentionMask:
 
 
     def set_latent(self, latent):
-        if latent.ndim == 4:
-            self.b, self.c, self.h, self.w = latent.shape
+        self.set_latent_shape(latent.shape)
+        
+    def set_latent_shape(self, shape):
+        if len(shape) == 4:
+            self.b, self.c, self.h, self.w = shape
             
-        elif latent.ndim == 5:
-            self.b, self.c, self.t, self.h, self.w = latent.shape
+        elif len(shape) == 5:
+            self.b, self.c, self.t, self.h, self.w = shape
             
         #if not isinstance(self.model_config, comfy.supported_models.Stable_Cascade_C):
         self.h //= 2  # 16x16 PE      patch_size = 2  1024x1024 rgb -> 128x128 16ch latent -> 64x64 img
@@ -173,6 +188,45 @@ class BaseAttentionMask:
     def attn_mask_recast(self, dtype):
         if self.attn_mask.mask.dtype != dtype:
             self.attn_mask.mask = self.attn_mask.mask.to(dtype)
+    
+    def cache_key(self):
+        """
+        Everything generate() depends on: latent grid, region mask contents, text lengths, mask type and edge dilation.
+        Masks are hashed squeezed, as generate() may squeeze_/unsqueeze_ them in place between calls.
+        """
+        edge_width_list = self.edge_width_list if self.edge_width_list is not None else [self.edge_width] * self.num_regions
+        return (
+            type(self).__name__,
+            self.t, self.h, self.w,
+            tensor_hash(*[mask.squeeze() for mask in self.masks]),
+            tuple(self.context_lens),
+            tuple(tuple(context_lens) for context_lens in self.context_lens_list),
+            self.text_len,
+            self.text_off,
+            self.mask_type,
+            str(self.dtype),
+            self.edge_width,
+            tuple(edge_width_list),
+            tuple(self.use_self_attn_mask_list) if self.use_self_attn_mask_list is not None else None,
+        )
+    
+    def get_state(self):
+        return {attr: getattr(self, attr) for attr in self.GENERATED_ATTRS if hasattr(self, attr)}
+    
+    def set_state(self, state):
+        for attr, value in state.items():
+            if isinstance(value, CoreAttnMask):
+                value = copy.copy(value)    # own wrapper, so attn_mask_recast()/set_sigma_range() don't write into the cached state
+            setattr(self, attr, value)
+    
+    def generate_cached(self):
+        """Same as generate(), but reuses masks already built for an identical latent shape and region set."""
+        key   = self.cache_key()
+        state = ATTN_MASK_CACHE.get(key)
+        if state is None:
+            self.generate()
+            state = ATTN_MASK_CACHE.set(key, self.get_state())
+        self.set_state(state)
 
 
 
@@ -323,34 +377,16 @@ class FullAttentionMaskHiDream(BaseAttentionMask):
             img2txt_mask_sq = F.interpolate(self.masks[1].unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
             attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
         
-        if   self.edge_width > 0:
+        if self.edge_width != 0: # edge_width < 0: edge masks using cross-attn too
             edge_mask = torch.zeros_like(self.masks[0])
-            for mask in self.masks:
-                edge_mask_new = get_edge_mask(mask, dilation=abs(self.edge_width))
+            for edge_mask_new in self.get_edge_masks(self.masks, [abs(self.edge_width)] * self.num_regions):
                 edge_mask = fp_or(edge_mask, edge_mask_new)
-                #edge_mask = fp_or(edge_mask, get_edge_mask(mask, dilation=self.edge_width))
-                
-            img2txt_mask_sq = F.interpolate(edge_mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
-            attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
-            
-        elif self.edge_width < 0: # edge masks using cross-attn too
-            edge_mask = torch.zeros_like(self.masks[0])
-            for mask in self.masks:
-                edge_mask = fp_or(edge_mask, get_edge_mask(mask, dilation=abs(self.edge_width)))
                 
             img2txt_mask_sq = F.interpolate(edge_mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
             attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
         
         elif self.edge_width_list is not None:
-            edge_mask = torch.zeros_like(self.masks[0])
-            
-            for mask, edge_width in zip(self.masks, self.edge_width_list):
-                if edge_width != 0:
-                    edge_mask_new = get_edge_mask(mask, dilation=abs(edge_width))
-                    edge_mask     = fp_or(edge_mask, fp_and(edge_mask_new, mask)) #fp_and here is to ensure edge_mask only grows into the region for current mask
-                    
-                    img2txt_mask_sq = F.interpolate(edge_mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
-                    attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
+            attn_mask[text_off:, text_len:] = self.apply_edge_width_list(attn_mask[text_off:, text_len:], self.edge_width_list, dtype)
             
         if self.use_self_attn_mask_list is not None:
             for mask, use_self_attn_mask in zip(self.masks, self.use_self_attn_mask_list):
@@ -358,47 +394,7 @@ class FullAttentionMaskHiDream(BaseAttentionMask):
                     img2txt_mask_sq = F.interpolate(mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
                     attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
 
-        text_len_t5     = sum(sublist[0] for sublist in self.context_lens_list)
-        img2txt_mask_t5 = torch.empty((img_len, text_len_t5)).to(attn_mask)
-        offset_t5_start = 0
-        reg_num_slice   = 0
-        for context_len, mask_slice, edge_width in zip(self.context_lens, self.masks, self.edge_width_list):
-            if self.edge_width < 0: # edge masks using cross-attn too
-                mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(self.edge_width)))
-            if edge_width < 0: # edge masks using cross-attn too
-                mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(edge_width)))
-            
-            slice_len     = self.context_lens_list[reg_num_slice][0]
-            offset_t5_end = offset_t5_start + slice_len
-            
-            img2txt_mask_slice = F.interpolate(mask_slice.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, slice_len)
-            
-            img2txt_mask_t5[:, offset_t5_start:offset_t5_end] = img2txt_mask_slice
-            
-            offset_t5_start = offset_t5_end
-            reg_num_slice += 1
-        
-        text_len_llama     = sum(sublist[1] for sublist in self.context_lens_list)
-        img2txt_mask_llama = torch.empty((img_len, text_len_llama)).to(attn_mask)
-        offset_llama_start = 0
-        reg_num_slice      = 0
-        for context_len, mask_slice, edge_width in zip(self.context_lens, self.masks, self.edge_width_list):
-            if self.edge_width < 0: # edge masks using cross-attn too
-                mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(self.edge_width)))
-            if edge_width < 0: # edge masks using cross-attn too
-                mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(edge_width)))
-                
-            slice_len        = self.context_lens_list[reg_num_slice][1]
-            offset_llama_end = offset_llama_start + slice_len
-            
-            img2txt_mask_slice = F.interpolate(mask_slice.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, slice_len)
-            
-            img2txt_mask_llama[:, offset_llama_start:offset_llama_end] = img2txt_mask_slice
-            
-            offset_llama_start = offset_llama_end
-            reg_num_slice += 1
-        
-        img2txt_mask = torch.cat([img2txt_mask_t5, img2txt_mask_llama.repeat(1,2)], dim=-1)
+        img2txt_mask = self.gen_img2txt_mask(attn_mask, dtype)
         
         attn_mask[:-text_off , :-text_len ] = attn_mask[text_off:, text_len:].clone()
         attn_mask[:-text_off ,  -text_len:] = img2txt_mask
@@ -416,6 +412,46 @@ class FullAttentionMaskHiDream(BaseAttentionMask):
 
         #flat = [v for group in zip(*self.context_lens_list) for v in group]
 
+    def get_edge_masks(self, masks, dilations):
+        """Edge masks of all regions in one batched pass, cached per (mask set, dilations) as every batch item regenerates the same regions."""
+        key = (tensor_hash(*masks), tuple(dilations))
+        return EDGE_MASK_CACHE.get_or_set(key, lambda: get_edge_masks(masks, dilations))
+    
+    def apply_edge_width_list(self, self_attn_mask, edge_width_list, dtype):
+        h, w       = self.h, self.w
+        edge_masks = self.get_edge_masks(self.masks, [abs(int(edge_width)) for edge_width in edge_width_list])
+        edge_mask  = torch.zeros_like(self.masks[0])
+        
+        for mask, edge_width, edge_mask_new in zip(self.masks, edge_width_list, edge_masks):
+            if int(edge_width) != 0:
+                edge_mask = fp_or(edge_mask, fp_and(edge_mask_new, mask)) #fp_and here is to ensure edge_mask only grows into the region for current mask
+        
+        if any(int(edge_width) != 0 for edge_width in edge_width_list):
+            img2txt_mask_sq = F.interpolate(edge_mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, self.img_len)
+            self_attn_mask  = fp_or(self_attn_mask, img2txt_mask_sq)
+        
+        return self_attn_mask
+    
+    def get_cross_masks(self):
+        """Region masks for img <-> txt cross attention. Negative edge widths grow them by their edge masks."""
+        masks = list(self.masks)
+        if self.edge_width < 0: # edge masks using cross-attn too
+            edge_masks = self.get_edge_masks(masks, [abs(self.edge_width)] * len(masks))
+            masks      = [fp_or(mask, edge_mask) for mask, edge_mask in zip(masks, edge_masks)]
+        if any(edge_width < 0 for edge_width in self.edge_width_list):
+            edge_masks = self.get_edge_masks(masks, [abs(edge_width) if edge_width < 0 else 0 for edge_width in self.edge_width_list])
+            masks      = [fp_or(mask, edge_mask) if edge_width < 0 else mask for mask, edge_mask, edge_width in zip(masks, edge_masks, self.edge_width_list)]
+        return masks
+    
+    def gen_img2txt_mask(self, attn_mask, dtype):
+        h, w        = self.h, self.w
+        cross_masks = [F.interpolate(mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1) for mask in self.get_cross_masks()]
+        
+        img2txt_mask_t5    = torch.cat([mask.repeat(1, context_lens[0]) for mask, context_lens in zip(cross_masks, self.context_lens_list)], dim=-1).to(attn_mask)
+        img2txt_mask_llama = torch.cat([mask.repeat(1, context_lens[1]) for mask, context_lens in zip(cross_masks, self.context_lens_list)], dim=-1).to(attn_mask)
+        
+        return torch.cat([img2txt_mask_t5, img2txt_mask_llama.repeat(1,2)], dim=-1)
+
     def gen_edge_mask(self, block_idx):
         mask_type = self.mask_type
         dtype     = self.dtype     
@@ -432,21 +468,9 @@ class FullAttentionMaskHiDream(BaseAttentionMask):
             #attn_mask = self.attn_mask.mask.clone()
             attn_mask = torch.zeros_like(self.attn_mask.mask)
             attn_mask[text_off:, text_len:] = self.self_attn_mask.clone()
-            edge_mask = torch.zeros_like(self.masks[0])
-            
-            for mask, edge_width in zip(self.masks, self.edge_width_list):
-                #edge_width *= (block_idx/48)
-                edge_width *= torch.rand(1).item()
-                edge_width = int(edge_width)
-                if edge_width != 0:
-                    #edge_width *= (block_idx/48)
-                    #edge_width = int(edge_width)
-                    edge_mask_new = get_edge_mask(mask, dilation=abs(edge_width))
-                    edge_mask     = fp_or(edge_mask, fp_and(edge_mask_new, mask)) #fp_and here is to ensure edge_mask only grows into the region for current mask
-                    
-                    img2txt_mask_sq = F.interpolate(edge_mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
-                    
-                    attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
+            #edge_width_list = [int(edge_width * (block_idx/48)) for edge_width in self.edge_width_list]
+            edge_width_list = [int(edge_width * torch.rand(1).item()) for edge_width in self.edge_width_list]
+            attn_mask[text_off:, text_len:] = self.apply_edge_width_list(attn_mask[text_off:, text_len:], edge_width_list, dtype)
 
 
             if self.use_self_attn_mask_list is not None:
@@ -455,47 +479,7 @@ class FullAttentionMaskHiDream(BaseAttentionMask):
                         img2txt_mask_sq = F.interpolate(mask.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, img_len)
                         attn_mask[text_off:, text_len:] = fp_or(attn_mask[text_off:, text_len:], img2txt_mask_sq)
 
-            text_len_t5     = sum(sublist[0] for sublist in self.context_lens_list)
-            img2txt_mask_t5 = torch.empty((img_len, text_len_t5)).to(attn_mask)
-            offset_t5_start = 0
-            reg_num_slice   = 0
-            for context_len, mask_slice, edge_width in zip(self.context_lens, self.masks, self.edge_width_list):
-                if self.edge_width < 0: # edge masks using cross-attn too
-                    mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(self.edge_width)))
-                if edge_width < 0: # edge masks using cross-attn too
-                    mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(edge_width)))
-                
-                slice_len     = self.context_lens_list[reg_num_slice][0]
-                offset_t5_end = offset_t5_start + slice_len
-                
-                img2txt_mask_slice = F.interpolate(mask_slice.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, slice_len)
-                
-                img2txt_mask_t5[:, offset_t5_start:offset_t5_end] = img2txt_mask_slice
-                
-                offset_t5_start = offset_t5_end
-                reg_num_slice += 1
-            
-            text_len_llama     = sum(sublist[1] for sublist in self.context_lens_list)
-            img2txt_mask_llama = torch.empty((img_len, text_len_llama)).to(attn_mask)
-            offset_llama_start = 0
-            reg_num_slice      = 0
-            for context_len, mask_slice, edge_width in zip(self.context_lens, self.masks, self.edge_width_list):
-                if self.edge_width < 0: # edge masks using cross-attn too
-                    mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(self.edge_width)))
-                if edge_width < 0: # edge masks using cross-attn too
-                    mask_slice = fp_or(mask_slice, get_edge_mask(mask_slice, dilation=abs(edge_width)))
-                    
-                slice_len        = self.context_lens_list[reg_num_slice][1]
-                offset_llama_end = offset_llama_start + slice_len
-                
-                img2txt_mask_slice = F.interpolate(mask_slice.unsqueeze(0).to(torch.float16), (h, w), mode='nearest-exact').to(dtype).flatten().unsqueeze(1).repeat(1, slice_len)
-                
-                img2txt_mask_llama[:, offset_llama_start:offset_llama_end] = img2txt_mask_slice
-                
-                offset_llama_start = offset_llama_end
-                reg_num_slice += 1
-            
-            img2txt_mask = torch.cat([img2txt_mask_t5, img2txt_mask_llama.repeat(1,2)], dim=-1)
+            img2txt_mask = self.gen_img2txt_mask(attn_mask, dtype)
             
             attn_mask[:-text_off , :-text_len ] = attn_mask[text_off:, text_len:].clone()
             attn_mask[:-text_off ,  -text_len:] = img2txt_mask
@@ -524,6 +508,11 @@ class RegionalContext:
         self.pooled_output = None
         self.idle_device = idle_device
         self.work_device = work_device
+        self.cast_cache  = CastCache()
+    
+    def cast(self, name, like):
+        # regional tensor in like's dtype/device, converted once and reused across steps
+        return self.cast_cache.get(name, getattr(self, name), like.dtype, like.device)
     
     def add_region(self, context, pooled_output=None, clip_fea=None):
         if self.context is not None:
@@ -562,6 +551,7 @@ class RegionalContext:
         self.llama3_list.append(llama3)
 
     def clear_regions(self):
+        self.cast_cache.clear()
         if self.context is not None:
             del self.context
             self.context = None
@@ -775,3 +765,81 @@ class SplitAttentionMask(BaseAttentionMask):
         
         self.attn_mask = CoreAttnMask(attn_mask, mask_type=mask_type)
 
+    def generate_pooled(self, mask_hi, factor, mask_type=None, chunk_size=4096):
+        """
+        Derive the mask for the current latent size from mask_hi, which was generated at factor x the current h and w.
+        Both image token axes are average pooled; boolean masks keep tokens covered by at least half of their pooled window.
+        """
+        mask_type = self.mask_type if mask_type is None else mask_type
+        key       = self.cache_key() + ("pooled", tuple(mask_hi.shape), factor)
+        state     = ATTN_MASK_CACHE.get(key)
+        
+        if state is None:
+            text_len   = self.text_len
+            h_hi, w_hi = self.h * factor, self.w * factor
+            img_len_hi = mask_hi.shape[0]
+            
+            if self.t != 1 or img_len_hi != h_hi * w_hi:                # grid doesn't divide evenly, build it directly
+                self.generate(mask_type=mask_type)
+            else:
+                mask_hi = mask_hi.to(self.attn_mask.work_device if torch.cuda.is_available() else 'cpu')
+                
+                cross = mask_hi[:, :text_len].to(torch.float32).reshape(h_hi, w_hi, text_len).permute(2,0,1)
+                cross = F.avg_pool2d(cross, factor).permute(1,2,0).reshape(-1, text_len)
+                
+                self_cols = []                                          # pool columns in row chunks, the full self mask can be several GB as float
+                for row in range(0, img_len_hi, chunk_size):
+                    rows = mask_hi[row:row+chunk_size, text_len:].to(torch.float32).reshape(-1, h_hi, w_hi)
+                    self_cols.append(F.avg_pool2d(rows, factor).flatten(1))
+                self_attn = torch.cat(self_cols, dim=0)                 # img_len_hi, img_len
+                self_attn = self_attn.transpose(0,1).reshape(-1, h_hi, w_hi)
+                self_attn = F.avg_pool2d(self_attn, factor).flatten(1).transpose(0,1)
+                
+                attn_mask = torch.cat([cross, self_attn], dim=1)
+                attn_mask = attn_mask >= 0.5 if self.dtype == torch.bool else attn_mask.to(self.dtype)
+                
+                self.attn_mask = CoreAttnMask(attn_mask, mask_type=mask_type)
+                
+            state = ATTN_MASK_CACHE.set(key, self.get_state())
+            
+        self.set_state(state)
+
+
+
+
+def generate_regional_attn_mask(AttnMask, model_config, latent):
+    """
+    Generate AttnMask for latent, including the extra UNet resolution levels (mask_up, mask_down, mask_down2) for SDXL and SD1.5.
+    Results are cached by latent shape and region set, so repeat calls for other batch items are free. UNet levels below the
+    highest are pooled from it instead of being regenerated.
+    """
+    shape = latent.shape
+    
+    if isinstance(model_config, (comfy.supported_models.SDXL, comfy.supported_models.SD15)):
+        AttnMask.set_latent_shape((*shape[:-2], shape[-2] * 2, shape[-1] * 2))
+        AttnMask.generate_cached()
+        AttnMask.mask_up = AttnMask.attn_mask.mask
+        
+        AttnMask.set_latent_shape((*shape[:-2], shape[-2] // 2, shape[-1] // 2))
+        AttnMask.generate_pooled(AttnMask.mask_up, 4)
+        AttnMask.mask_down = AttnMask.attn_mask.mask
+        
+        if isinstance(model_config, comfy.supported_models.SD15):
+            AttnMask.set_latent_shape((*shape[:-2], shape[-2] // 4, shape[-1] // 4))
+            AttnMask.generate_pooled(AttnMask.mask_up, 8)
+            AttnMask.mask_down2 = AttnMask.attn_mask.mask
+        
+        AttnMask.set_latent_shape(shape)
+        AttnMask.generate_pooled(AttnMask.mask_up, 2)
+        
+    elif isinstance(model_config, comfy.supported_models.Stable_Cascade_C):
+        AttnMask.set_latent_shape((*shape[:-2], shape[-2] * 2, shape[-1] * 2))
+        # cascade concats 4 + 4 tokens (clip_text_pooled, clip_img)
+        AttnMask.context_lens = [context_len + 8 for context_len in AttnMask.context_lens] 
+        AttnMask.text_len     = sum(AttnMask.context_lens)
+        AttnMask.generate_cached()
+        
+    else:
+        AttnMask.set_latent_shape(shape)
+        AttnMask.generate_cached()
+
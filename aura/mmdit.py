@@ -652,7 +652,6 @@ class ReMMDiT(nn.Module):
             y0_style_pos_mask = transformer_options.get("y0_style_pos_mask")
             y0_style_pos_mask_edge = transformer_options.get("y0_style_pos_mask_edge")
 
-            y0_style_pos = y0_style_pos.to(dtype)
             x   = x_orig.clone().to(dtype)
             #x   = x.to(dtype)
             eps = eps.to(dtype)
@@ -662,7 +661,7 @@ class ReMMDiT(nn.Module):
             denoised = x - sigma * eps
             
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_pos)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_pos, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -825,7 +824,6 @@ class ReMMDiT(nn.Module):
             y0_style_neg_mask = transformer_options.get("y0_style_neg_mask")
             y0_style_neg_mask_edge = transformer_options.get("y0_style_neg_mask_edge")
             
-            y0_style_neg = y0_style_neg.to(dtype)
             x   = x.to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -834,7 +832,7 @@ class ReMMDiT(nn.Module):
             denoised = x - sigma * eps
 
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_neg)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_neg, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -13,7 +13,7 @@ import comfy
 from ..res4lyf              import RESplain
 from ..helper               import ExtraOptions, FrameWeightsManager
 from ..latents              import lagrange_interpolation, get_collinear, get_orthogonal, get_cosine_similarity, get_pearson_similarity, get_slerp_weight_for_cossim, get_slerp_ratio, slerp_tensor, get_edge_mask, normalize_zscore, compute_slerp_ratio_for_target, find_slerp_ratio_grid
-from ..style_transfer       import apply_scattersort_spatial, apply_adain_spatial
+from ..style_transfer       import apply_scattersort_spatial, apply_adain_spatial, clear_style_reference_caches
 
 from .rk_method_beta        import RK_Method_Beta
 from .rk_noise_sampler_beta import RK_NoiseSampler
@@ -241,6 +241,8 @@ def sample_rk_beta(
     if sampler_mode == "NULL":
         return x
     
+    clear_style_reference_caches()
+    
     EO             = ExtraOptions(extra_options)
     default_dtype  = EO("default_dtype", torch.float64)
     
@@ -633,7 +635,7 @@ def sample_rk_beta(
                 RK.update_transformer_options({'y0_style_pos_synweight': 0.0})
                 RK.update_transformer_options({'y0_style_pos_mask': None})
             else:
-                RK.update_transformer_options({'y0_style_pos':        LG.y0_style_pos.clone()})
+                RK.update_transformer_options({'y0_style_pos':        LG.y0_style_pos})
                 RK.update_transformer_options({'y0_style_pos_weight': LG.lgw_style_pos[step_sched]})
                 RK.update_transformer_options({'y0_style_pos_synweight': guides['synweight_style_pos']})
                 RK.update_transformer_options({'y0_style_pos_mask': LG.mask_style_pos})
@@ -662,7 +664,7 @@ def sample_rk_beta(
                 RK.update_transformer_options({'y0_style_neg_synweight': 0.0})
                 RK.update_transformer_options({'y0_style_neg_mask': None})
             else:
-                RK.update_transformer_options({'y0_style_neg':        LG.y0_style_neg.clone()})
+                RK.update_transformer_options({'y0_style_neg':        LG.y0_style_neg})
                 RK.update_transformer_options({'y0_style_neg_weight': LG.lgw_style_neg[step_sched]})
                 RK.update_transformer_options({'y0_style_neg_synweight': guides['synweight_style_neg']})
                 RK.update_transformer_options({'y0_style_neg_mask': LG.mask_style_neg})
@@ -2166,6 +2168,7 @@ def sample_rk_beta(
             state_info_out['data_cached']  = data_cached.to('cpu')
             state_info_out['data_x_prev_'] = data_x_prev_.to('cpu')
 
+    clear_style_reference_caches()
     return x
 
 def noise_fn(x, sigma, sigma_next, noise_sampler, cossim_iter=1):
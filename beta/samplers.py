@@ -21,6 +21,7 @@ from ..helper               import initialize_or_scale, get_res4lyf_scheduler_li
 from ..res4lyf              import RESplain
 from ..latents              import normalize_zscore, get_orthogonal
 from ..sigmas               import get_sigmas
+from ..attention_masks      import generate_regional_attn_mask, clear_attn_mask_caches
 #import ..models              # import ReFluxPatcher
 
 from .constants             import MAX_STEPS, IMPLICIT_TYPE_NAMES
@@ -30,31 +31,25 @@ from .rk_coefficients_beta  import get_default_sampler_name, get_sampler_name_li
 
 
 def copy_cond(conditioning):
+    # shallow copy: new lists and dicts, but the tensors are shared with the source conditioning. Nothing enforces this, so
+    # code working on the copy must replace entries (cond['x'] = ...), never write into a tensor in place (no x[...] = / x.mul_()).
     new_conditioning = []
     if type(conditioning[0][0]) == list:
         for i in range(len(conditioning)):
-            new_conditioning_i = []
-            for embedding, cond in conditioning[i]:
-                cond_copy = {}
-                for k, v in cond.items():
-                    if isinstance(v, torch.Tensor):
-                        cond_copy[k] = v.clone()
-                    else:
-                        cond_copy[k] = v  # ensure we're not copying huge shit like controlnets
-                new_conditioning_i.append([embedding.clone(), cond_copy])
-            new_conditioning.append(new_conditioning_i)
+            new_conditioning.append([[embedding, dict(cond)] for embedding, cond in conditioning[i]])
     else:
         for embedding, cond in conditioning:
-            cond_copy = {}
-            for k, v in cond.items():
-                if isinstance(v, torch.Tensor):
-                    cond_copy[k] = v.clone()
-                else:
-                    cond_copy[k] = v  # ensure we're not copying huge shit like controlnets
-            new_conditioning.append([embedding.clone(), cond_copy])
+            new_conditioning.append([embedding, dict(cond)])
             
     return new_conditioning
 
+def get_regional_cond(conditioning, model, regional_conds):
+    # regional bundle (contexts, masks, weight/floor schedules) is assembled once per callback per sampler call, then shared read-only by every batch item
+    callback = conditioning[0][1]['callback_regional']
+    if callback not in regional_conds:
+        regional_conds[callback] = callback(model)
+    return regional_conds[callback]
+
 
 class SharkGuider(CFGGuider):
     def __init__(self, model_patcher):
@@ -505,6 +500,9 @@ class SharkSampler:
             out_denoised_samples = []
             out_state_info       = []
             
+            regional_conds       = {}     # callback_regional -> assembled regional cond
+            regional_masks       = set()  # AttnMasks already generated for this latent
+            
             for batch_num in range(latent_image_batch['samples'].shape[0]):
                 latent_unbatch            = copy.deepcopy(latent_x)
                 latent_unbatch['samples'] = latent_image_batch['samples'][batch_num].clone().unsqueeze(0)
@@ -630,75 +628,29 @@ class SharkSampler:
                     
                     if pos_cond_tmp[0][1] is not None: 
                         if 'callback_regional' in pos_cond_tmp[0][1]:
-                            pos_cond_tmp = pos_cond_tmp[0][1]['callback_regional'](work_model)
+                            pos_cond_tmp = get_regional_cond(pos_cond_tmp, work_model, regional_conds)
                         
                         if 'AttnMask' in pos_cond_tmp[0][1]:
                             sampler.extra_options['AttnMask']   = pos_cond_tmp[0][1]['AttnMask']
                             sampler.extra_options['RegContext'] = pos_cond_tmp[0][1]['RegContext']
                             sampler.extra_options['RegParam']   = pos_cond_tmp[0][1]['RegParam']
                             
-                            if isinstance(model.model.model_config, (comfy.supported_models.SDXL, comfy.supported_models.SD15)):
-                                latent_up_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] * 2, latent_image['samples'].shape[-1] * 2), mode="nearest")
-                                sampler.extra_options['AttnMask'].set_latent(latent_up_dummy)
-                                sampler.extra_options['AttnMask'].generate()
-                                sampler.extra_options['AttnMask'].mask_up   = sampler.extra_options['AttnMask'].attn_mask.mask
-                                
-                                latent_down_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] // 2, latent_image['samples'].shape[-1] // 2), mode="nearest")
-                                sampler.extra_options['AttnMask'].set_latent(latent_down_dummy)
-                                sampler.extra_options['AttnMask'].generate()
-                                sampler.extra_options['AttnMask'].mask_down = sampler.extra_options['AttnMask'].attn_mask.mask
-                                
-                                if isinstance(model.model.model_config, comfy.supported_models.SD15):
-                                    latent_down_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] // 4, latent_image['samples'].shape[-1] // 4), mode="nearest")
-                                    sampler.extra_options['AttnMask'].set_latent(latent_down_dummy)
-                                    sampler.extra_options['AttnMask'].generate()
-                                    sampler.extra_options['AttnMask'].mask_down2 = sampler.extra_options['AttnMask'].attn_mask.mask
-                                    
-                            if isinstance(model.model.model_config, (comfy.supported_models.Stable_Cascade_C)):
-                                latent_up_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] * 2, latent_image['samples'].shape[-1] * 2), mode="nearest")
-                                sampler.extra_options['AttnMask'].set_latent(latent_up_dummy)
-                                # cascade concats 4 + 4 tokens (clip_text_pooled, clip_img)
-                                sampler.extra_options['AttnMask'].context_lens = [context_len + 8 for context_len in sampler.extra_options['AttnMask'].context_lens] 
-                                sampler.extra_options['AttnMask'].text_len = sum(sampler.extra_options['AttnMask'].context_lens)
-                            else:
-                                sampler.extra_options['AttnMask'].set_latent(latent_image['samples'])
-                            sampler.extra_options['AttnMask'].generate()
+                            if sampler.extra_options['AttnMask'] not in regional_masks:
+                                generate_regional_attn_mask(sampler.extra_options['AttnMask'], model.model.model_config, latent_image['samples'])
+                                regional_masks.add(sampler.extra_options['AttnMask'])
                             
                     if neg_cond[0][1] is not None: 
                         if 'callback_regional' in neg_cond[0][1]:
-                            neg_cond = neg_cond[0][1]['callback_regional'](work_model)
+                            neg_cond = get_regional_cond(neg_cond, work_model, regional_conds)
                         
                         if 'AttnMask' in neg_cond[0][1]:
                             sampler.extra_options['AttnMask_neg']   = neg_cond[0][1]['AttnMask']
                             sampler.extra_options['RegContext_neg'] = neg_cond[0][1]['RegContext']
                             sampler.extra_options['RegParam_neg']   = neg_cond[0][1]['RegParam']
                             
-                            if isinstance(model.model.model_config, (comfy.supported_models.SDXL, comfy.supported_models.SD15)):
-                                latent_up_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] * 2, latent_image['samples'].shape[-1] * 2), mode="nearest")
-                                sampler.extra_options['AttnMask_neg'].set_latent(latent_up_dummy)
-                                sampler.extra_options['AttnMask_neg'].generate()
-                                sampler.extra_options['AttnMask_neg'].mask_up   = sampler.extra_options['AttnMask_neg'].attn_mask.mask
-                                
-                                latent_down_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] // 2, latent_image['samples'].shape[-1] // 2), mode="nearest")
-                                sampler.extra_options['AttnMask_neg'].set_latent(latent_down_dummy)
-                                sampler.extra_options['AttnMask_neg'].generate()
-                                sampler.extra_options['AttnMask_neg'].mask_down = sampler.extra_options['AttnMask_neg'].attn_mask.mask
-                                
-                                if isinstance(model.model.model_config, comfy.supported_models.SD15):
-                                    latent_down_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] // 4, latent_image['samples'].shape[-1] // 4), mode="nearest")
-                                    sampler.extra_options['AttnMask_neg'].set_latent(latent_down_dummy)
-                                    sampler.extra_options['AttnMask_neg'].generate()
-                                    sampler.extra_options['AttnMask_neg'].mask_down2 = sampler.extra_options['AttnMask_neg'].attn_mask.mask
-                            
-                            if isinstance(model.model.model_config, (comfy.supported_models.Stable_Cascade_C)):
-                                latent_up_dummy = F.interpolate(latent_image['samples'].to(torch.float16), size=(latent_image['samples'].shape[-2] * 2, latent_image['samples'].shape[-1] * 2), mode="nearest")
-                                sampler.extra_options['AttnMask'].set_latent(latent_up_dummy)
-                                # cascade concats 4 + 4 tokens (clip_text_pooled, clip_img)
-                                sampler.extra_options['AttnMask'].context_lens = [context_len + 8 for context_len in sampler.extra_options['AttnMask'].context_lens] 
-                                sampler.extra_options['AttnMask'].text_len = sum(sampler.extra_options['AttnMask'].context_lens)
-                            else:
-                                sampler.extra_options['AttnMask_neg'].set_latent(latent_image['samples'])
-                            sampler.extra_options['AttnMask_neg'].generate()
+                            if sampler.extra_options['AttnMask_neg'] not in regional_masks:
+                                generate_regional_attn_mask(sampler.extra_options['AttnMask_neg'], model.model.model_config, latent_image['samples'])
+                                regional_masks.add(sampler.extra_options['AttnMask_neg'])
                     
                     
                     
@@ -878,7 +830,7 @@ class SharkSampler:
                         if latent_image.get('state_info', {}).get('last_rng', None) is None:
                             torch.manual_seed(seed)
 
-
+            clear_attn_mask_caches()
             gc.collect()
 
             # STACK SDE NOISES, SAVE STATE INFO
@@ -8,10 +8,11 @@ from torch import Tensor, nn
 from einops import rearrange, repeat
 import comfy.ldm.common_dit
 
-from ..helper import ExtraOptions
+from ..helper import ExtraOptions, get_cond_groups, get_module_pinv
 
+from ..flux.math import get_pe_cached
 from ..latents import tile_latent, untile_latent, gaussian_blur_2d, median_blur_2d
-from ..style_transfer import apply_scattersort_masked, apply_scattersort_tiled, adain_seq_inplace, adain_patchwise_row_batch_med, adain_patchwise_row_batch
+from ..style_transfer import apply_scattersort_masked, apply_scattersort_tiled, adain_seq_inplace, adain_patchwise_row_batch_med, adain_patchwise_row_batch, adain_patchwise, adain_patchwise_local
 
 from comfy.ldm.flux.layers import (
     EmbedND,
@@ -184,7 +185,7 @@ class ReChroma(nn.Module):
         txt = self.txt_in(txt)
 
         ids = torch.cat((txt_ids, img_ids), dim=1)
-        pe = self.pe_embedder(ids)
+        pe = get_pe_cached(self.pe_embedder, ids, transformer_options.get('original_shape'), txt_ids.shape[1])
         
         weight    = -1 * transformer_options.get("regional_conditioning_weight", 0.0)
         floor     = -1 * transformer_options.get("regional_conditioning_floor",  0.0)
@@ -421,13 +422,13 @@ class ReChroma(nn.Module):
         freqsep_highpass_weight= transformer_options.get("freqsep_highpass_weight")
         freqsep_mask           = transformer_options.get("freqsep_mask")
         
+        # cond and uncond share the mask and context length unless control, cross attn updates or a separate neg mask are in play
+        batch_cond = not EO("no_cond_batch")                                \
+                        and control is None and update_cross_attn is None   \
+                        and 'AttnMask_neg' not in transformer_options
+        
         out_list = []
-        for i in range(len(transformer_options['cond_or_uncond'])):
-            UNCOND = transformer_options['cond_or_uncond'][i] == 1
-            
-            if update_cross_attn is not None:
-                update_cross_attn['UNCOND'] = UNCOND
-                
+        for cond_group in get_cond_groups(transformer_options['cond_or_uncond'], batch_cond):
             img = x
             bs, c, h, w = x.shape
             patch_size  = 2
@@ -441,49 +442,59 @@ class ReChroma(nn.Module):
 
             img = rearrange(img, "b c (h ph) (w pw) -> b (h w) (c ph pw)", ph=patch_size, pw=patch_size) # img 1,9216,64     1,16,128,128 -> 1,4096,64
 
-            context_tmp = None
+            context_list = []
+            for i in cond_group:
+                UNCOND = transformer_options['cond_or_uncond'][i] == 1
+                
+                if update_cross_attn is not None:
+                    update_cross_attn['UNCOND'] = UNCOND
+                
+                context_tmp = None
             
-            if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
-                AttnMask = transformer_options['AttnMask']
-                mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
+                    AttnMask = transformer_options['AttnMask']
+                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
 
-                if weight == 0:
-                    context_tmp = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
-                    mask = None
-                else:
-                    context_tmp = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
+                    if weight == 0:
+                        context_tmp = transformer_options['RegContext'].cast('context', context)
+                        mask = None
+                    else:
+                        context_tmp = transformer_options['RegContext'].cast('context', context)
                 
-            if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
-                AttnMask = transformer_options['AttnMask_neg']
-                mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
+                if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
+                    AttnMask = transformer_options['AttnMask_neg']
+                    mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
 
-                if weight == 0:
-                    context_tmp = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
-                    mask = None
-                else:
-                    context_tmp = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
-
-            elif UNCOND and 'AttnMask' in transformer_options:
-                AttnMask = transformer_options['AttnMask']
-                mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
-                A       = context
-                B       = transformer_options['RegContext'].context
-                context_tmp = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
-
-            if context_tmp is None:
-                context_tmp = context[i][None,...].clone()
+                    if weight == 0:
+                        context_tmp = transformer_options['RegContext_neg'].cast('context', context)
+                        mask = None
+                    else:
+                        context_tmp = transformer_options['RegContext_neg'].cast('context', context)
+
+                elif UNCOND and 'AttnMask' in transformer_options:
+                    AttnMask = transformer_options['AttnMask']
+                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                    A       = context[i][None,...]
+                    B       = transformer_options['RegContext'].context
+                    context_tmp = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
+
+                if context_tmp is None:
+                    context_tmp = context[i][None,...].clone()
+                context_list.append(context_tmp)
+            
+            context_tmp = torch.cat(context_list)
 
             txt_ids      = torch.zeros((bs, context_tmp.shape[1], 3), device=img.device, dtype=img.dtype)      # txt_ids        1, 256,3
             img_ids_orig = self._get_img_ids(img, bs, h_len, w_len, 0, h_len, 0, w_len)                  # img_ids_orig = 1,9216,3
 
 
-            out_tmp = self.forward_blocks(img       [i][None,...].clone(), 
-                                        img_ids_orig[i][None,...].clone(), 
+            out_tmp = self.forward_blocks(img       [cond_group].clone(), 
+                                        img_ids_orig[cond_group].clone(), 
                                         context_tmp,
-                                        txt_ids     [i][None,...].clone(), 
-                                        timestep    [i][None,...].clone(), 
-                                        #y           [i][None,...].clone(),
-                                        guidance    [i][None,...].clone(),
+                                        txt_ids     [cond_group].clone(), 
+                                        timestep    [cond_group].clone(), 
+                                        #y           [cond_group].clone(),
+                                        guidance    [cond_group].clone(),
                                         control, 
                                         update_cross_attn=update_cross_attn,
                                         transformer_options=transformer_options,
@@ -491,7 +502,7 @@ class ReChroma(nn.Module):
                                         )  # context 1,256,4096   y 1,768
             out_list.append(out_tmp)
             
-        out = torch.stack(out_list, dim=0).squeeze(dim=1)
+        out = torch.cat(out_list, dim=0)
         
         eps = rearrange(out, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:,:,:h,:w]
         
@@ -513,7 +524,6 @@ class ReChroma(nn.Module):
             y0_style_pos_mask = transformer_options.get("y0_style_pos_mask")
             y0_style_pos_mask_edge = transformer_options.get("y0_style_pos_mask_edge")
 
-            y0_style_pos = y0_style_pos.to(dtype)
             x   = x_orig.clone().to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -522,7 +532,7 @@ class ReChroma(nn.Module):
             denoised = x - sigma * eps
             
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_pos)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_pos, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -646,7 +656,7 @@ class ReChroma(nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
                 
                 if transformer_options.get('y0_standard_guide') is not None:
@@ -685,7 +695,6 @@ class ReChroma(nn.Module):
             y0_style_neg_mask = transformer_options.get("y0_style_neg_mask")
             y0_style_neg_mask_edge = transformer_options.get("y0_style_neg_mask_edge")
             
-            y0_style_neg = y0_style_neg.to(dtype)
             x   = x_orig.clone().to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -694,7 +703,7 @@ class ReChroma(nn.Module):
             denoised = x - sigma * eps
 
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_neg)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_neg, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -720,7 +729,7 @@ class ReChroma(nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
 
             denoised_approx = self.Retrojector.unembed(denoised_embed)
@@ -867,41 +876,11 @@ class ReChroma(nn.Module):
                 #    denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or torch.norm(self.y0_adain_embed - y0_adain_embed) > 0:
-                    self.y0_adain_embed = y0_adain_embed
-                    
-                    f_s          = y0_adain_embed[0].clone()
-                    self.mu_s    = f_s.mean(dim=0, keepdim=True)
-                    f_s_centered = f_s - self.mu_s
-                    
-                    cov = (f_s_centered.T.double() @ f_s_centered.double()) / (f_s_centered.size(0) - 1)
-
-                    S_eig, U_eig = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    S_eig_sqrt    = S_eig.clamp(min=0).sqrt() # eigenvalues -> singular values
-                    
-                    whiten = U_eig @ torch.diag(S_eig_sqrt) @ U_eig.T
-                    self.y0_color  = whiten.to(f_s_centered)
-
-                for wct_i in range(eps.shape[0]):
-                    f_c          = denoised_embed[wct_i].clone()
-                    mu_c         = f_c.mean(dim=0, keepdim=True)
-                    f_c_centered = f_c - mu_c
-                    
-                    cov = (f_c_centered.T.double() @ f_c_centered.double()) / (f_c_centered.size(0) - 1)
-
-                    S_eig, U_eig  = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    inv_sqrt_eig  = S_eig.clamp(min=0).rsqrt() 
-                    
-                    whiten = U_eig @ torch.diag(inv_sqrt_eig) @ U_eig.T
-                    whiten = whiten.to(f_c_centered)
-
-                    f_c_whitened = f_c_centered @ whiten.T
-                    f_cs         = f_c_whitened @ self.y0_color.T + self.mu_s
-                    
-                    denoised_embed[wct_i] = f_cs
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
+                denoised_embed = self.StyleWCT.get(denoised_embed)
 
             
-            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ torch.linalg.pinv(W).T.to(denoised_embed)
+            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ get_module_pinv(self.img_in, W.dtype, denoised_embed.device).T.to(denoised_embed)
             denoised_approx = denoised_approx.to(eps)
             
             denoised_approx = rearrange(denoised_approx, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:,:,:h,:w]
@@ -1017,40 +996,10 @@ class ReChroma(nn.Module):
                 #    denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or torch.norm(self.y0_adain_embed - y0_adain_embed) > 0:
-                    self.y0_adain_embed = y0_adain_embed
-                    
-                    f_s          = y0_adain_embed[0].clone()
-                    self.mu_s    = f_s.mean(dim=0, keepdim=True)
-                    f_s_centered = f_s - self.mu_s
-                    
-                    cov = (f_s_centered.T.double() @ f_s_centered.double()) / (f_s_centered.size(0) - 1)
-
-                    S_eig, U_eig = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    S_eig_sqrt    = S_eig.clamp(min=0).sqrt() # eigenvalues -> singular values
-                    
-                    whiten = U_eig @ torch.diag(S_eig_sqrt) @ U_eig.T
-                    self.y0_color  = whiten.to(f_s_centered)
-
-                for wct_i in range(eps.shape[0]):
-                    f_c          = denoised_embed[wct_i].clone()
-                    mu_c         = f_c.mean(dim=0, keepdim=True)
-                    f_c_centered = f_c - mu_c
-                    
-                    cov = (f_c_centered.T.double() @ f_c_centered.double()) / (f_c_centered.size(0) - 1)
-
-                    S_eig, U_eig  = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    inv_sqrt_eig  = S_eig.clamp(min=0).rsqrt() 
-                    
-                    whiten = U_eig @ torch.diag(inv_sqrt_eig) @ U_eig.T
-                    whiten = whiten.to(f_c_centered)
-
-                    f_c_whitened = f_c_centered @ whiten.T
-                    f_cs         = f_c_whitened @ self.y0_color.T + self.mu_s
-                    
-                    denoised_embed[wct_i] = f_cs
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
+                denoised_embed = self.StyleWCT.get(denoised_embed)
 
-            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ torch.linalg.pinv(W).T.to(denoised_embed)
+            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ get_module_pinv(self.img_in, W.dtype, denoised_embed.device).T.to(denoised_embed)
             denoised_approx = denoised_approx.to(eps)
             
             denoised_approx = rearrange(denoised_approx, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:,:,:h,:w]
@@ -1132,274 +1081,12 @@ def median_blur_2d(img: torch.Tensor, kernel_size: int = 3) -> torch.Tensor:
     return median
 
 
-def adain_patchwise(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
-
-    B, C, H, W = content.shape
-    device     = content.device
-    dtype      = content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * sigma) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad    = kernel_size // 2
-    coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-    gauss  = torch.exp(-0.5 * (coords / sigma) ** 2)
-    gauss /= gauss.sum()
-    kernel_2d = (gauss[:, None] * gauss[None, :]).to(dtype=dtype)
-
-    weight = kernel_2d.view(1, 1, kernel_size, kernel_size)
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded   = F.pad(style,   (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    for i in range(H):
-        for j in range(W):
-            c_patch = content_padded[:, :, i:i + kernel_size, j:j + kernel_size]
-            s_patch =   style_padded[:, :, i:i + kernel_size, j:j + kernel_size]
-            w = weight.expand_as(c_patch)
-
-            c_mean =  (c_patch              * w).sum(dim=(-1, -2), keepdim=True)
-            c_std  = ((c_patch - c_mean)**2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-            s_mean =  (s_patch              * w).sum(dim=(-1, -2), keepdim=True)
-            s_std  = ((s_patch - s_mean)**2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-            normed =  (c_patch[:, :, pad:pad+1, pad:pad+1] - c_mean) / c_std
-            stylized = normed * s_std + s_mean
-            result[:, :, i, j] = stylized.squeeze(-1).squeeze(-1)
-
-    return result
-
-
-
-
-def adain_patchwise_row_batch(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
-
-    B, C, H, W = content.shape
-    device, dtype = content.device, content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * sigma) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad = kernel_size // 2
-    coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-    gauss = torch.exp(-0.5 * (coords / sigma) ** 2)
-    gauss = (gauss / gauss.sum()).to(dtype)
-    kernel_2d = (gauss[:, None] * gauss[None, :])
-
-    weight = kernel_2d.view(1, 1, kernel_size, kernel_size)
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded = F.pad(style, (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    for i in range(H):
-        c_row_patches = torch.stack([
-            content_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            for j in range(W)
-        ], dim=0)  # [W, B, C, k, k]
-
-        s_row_patches = torch.stack([
-            style_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            for j in range(W)
-        ], dim=0)
-
-        w = weight.expand_as(c_row_patches[0])
-
-        c_mean = (c_row_patches * w).sum(dim=(-1, -2), keepdim=True)
-        c_std  = ((c_row_patches - c_mean) ** 2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-        s_mean = (s_row_patches * w).sum(dim=(-1, -2), keepdim=True)
-        s_std  = ((s_row_patches - s_mean) ** 2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-        center = kernel_size // 2
-        central = c_row_patches[:, :, :, center:center+1, center:center+1]
-        normed = (central - c_mean) / c_std
-        stylized = normed * s_std + s_mean
-
-        result[:, :, i, :] = stylized.squeeze(-1).squeeze(-1).permute(1, 2, 0)  # [B,C,W]
-
-    return result
-
-
-
-
-
-
-
 def adain_patchwise_row_batch_medblur(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5, mask: torch.Tensor = None, use_median_blur: bool = False) -> torch.Tensor:
-    B, C, H, W = content.shape
-    device, dtype = content.device, content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * abs(sigma)) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad = kernel_size // 2
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded = F.pad(style, (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    scaling = torch.ones((B, 1, H, W), device=device, dtype=dtype)
-    sigma_scale = torch.ones((H, W), device=device, dtype=torch.float32)
-    if mask is not None:
-        with torch.no_grad():
-            padded_mask = F.pad(mask.float(), (pad, pad, pad, pad), mode="reflect")
-            blurred_mask = F.avg_pool2d(padded_mask, kernel_size=kernel_size, stride=1, padding=pad)
-            blurred_mask = blurred_mask[..., pad:-pad, pad:-pad]
-            edge_proximity = blurred_mask * (1.0 - blurred_mask)
-            scaling = 1.0 - (edge_proximity / 0.25).clamp(0.0, 1.0)
-            sigma_scale = scaling[0, 0]  # assuming single-channel mask broadcasted across B, C
-
-    if not use_median_blur:
-        coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-        base_gauss = torch.exp(-0.5 * (coords / sigma) ** 2)
-        base_gauss = (base_gauss / base_gauss.sum()).to(dtype)
-        gaussian_table = {}
-        for s in sigma_scale.unique():
-            sig = float((sigma * s + eps).clamp(min=1e-3))
-            gauss_local = torch.exp(-0.5 * (coords / sig) ** 2)
-            gauss_local = (gauss_local / gauss_local.sum()).to(dtype)
-            kernel_2d = gauss_local[:, None] * gauss_local[None, :]
-            gaussian_table[s.item()] = kernel_2d
-
-    for i in range(H):
-        row_result = torch.zeros(B, C, W, dtype=dtype, device=device)
-        for j in range(W):
-            c_patch = content_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            s_patch = style_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-
-            if use_median_blur:
-                c_flat = c_patch.reshape(B, C, -1)
-                s_flat = s_patch.reshape(B, C, -1)
-
-                c_median = c_flat.median(dim=-1, keepdim=True).values
-                s_median = s_flat.median(dim=-1, keepdim=True).values
-
-                c_std = (c_flat - c_median).abs().mean(dim=-1, keepdim=True) + eps
-                s_std = (s_flat - s_median).abs().mean(dim=-1, keepdim=True) + eps
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center, center].unsqueeze(-1)
-
-                normed = (central - c_median) / c_std
-                stylized = normed * s_std + s_median
-            else:
-                k = gaussian_table[float(sigma_scale[i, j].item())]
-                local_weight = k.view(1, 1, kernel_size, kernel_size).expand(B, C, kernel_size, kernel_size)
-
-                c_mean = (c_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                c_std = ((c_patch - c_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-                s_mean = (s_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                s_std = ((s_patch - s_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center:center+1, center:center+1]
-                normed = (central - c_mean) / c_std
-                stylized = normed * s_std + s_mean
-
-            local_scaling = scaling[:, :, i, j].view(B, 1, 1, 1)
-            stylized = central * (1 - local_scaling) + stylized * local_scaling
-
-            row_result[:, :, j] = stylized.squeeze(-1).squeeze(-1)
-        result[:, :, i, :] = row_result
-
-    return result
-
-
-
-
-
+    return adain_patchwise_local(content, style, sigma=sigma, kernel_size=kernel_size, eps=eps, mask=mask, use_median_blur=use_median_blur, median_norm=True)
 
 
 def adain_patchwise_row_batch_realmedblur(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5, mask: torch.Tensor = None, use_median_blur: bool = False, lowpass_weight=1.0, highpass_weight=1.0) -> torch.Tensor:
-    B, C, H, W = content.shape
-    device, dtype = content.device, content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * abs(sigma)) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad = kernel_size // 2
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded = F.pad(style, (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    scaling = torch.ones((B, 1, H, W), device=device, dtype=dtype)
-    sigma_scale = torch.ones((H, W), device=device, dtype=torch.float32)
-    if mask is not None:
-        with torch.no_grad():
-            padded_mask = F.pad(mask.float(), (pad, pad, pad, pad), mode="reflect")
-            blurred_mask = F.avg_pool2d(padded_mask, kernel_size=kernel_size, stride=1, padding=pad)
-            blurred_mask = blurred_mask[..., pad:-pad, pad:-pad]
-            edge_proximity = blurred_mask * (1.0 - blurred_mask)
-            scaling = 1.0 - (edge_proximity / 0.25).clamp(0.0, 1.0)
-            sigma_scale = scaling[0, 0]  # assuming single-channel mask broadcasted across B, C
-
-    if not use_median_blur:
-        coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-        base_gauss = torch.exp(-0.5 * (coords / sigma) ** 2)
-        base_gauss = (base_gauss / base_gauss.sum()).to(dtype)
-        gaussian_table = {}
-        for s in sigma_scale.unique():
-            sig = float((sigma * s + eps).clamp(min=1e-3))
-            gauss_local = torch.exp(-0.5 * (coords / sig) ** 2)
-            gauss_local = (gauss_local / gauss_local.sum()).to(dtype)
-            kernel_2d = gauss_local[:, None] * gauss_local[None, :]
-            gaussian_table[s.item()] = kernel_2d
-
-    for i in range(H):
-        row_result = torch.zeros(B, C, W, dtype=dtype, device=device)
-        for j in range(W):
-            c_patch = content_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            s_patch = style_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-
-            if use_median_blur:
-                # Median blur with residual restoration
-                unfolded_c = c_patch.reshape(B, C, -1)
-                unfolded_s = s_patch.reshape(B, C, -1)
-
-                c_median = unfolded_c.median(dim=-1, keepdim=True).values
-                s_median = unfolded_s.median(dim=-1, keepdim=True).values
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center, center].view(B, C, 1)
-                residual = central - c_median
-                stylized = lowpass_weight * s_median + residual * highpass_weight
-            else:
-                k = gaussian_table[float(sigma_scale[i, j].item())]
-                local_weight = k.view(1, 1, kernel_size, kernel_size).expand(B, C, kernel_size, kernel_size)
-
-                c_mean = (c_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                c_std = ((c_patch - c_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-                s_mean = (s_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                s_std = ((s_patch - s_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center:center+1, center:center+1]
-                normed = (central - c_mean) / c_std
-                stylized = normed * s_std + s_mean
-
-            local_scaling = scaling[:, :, i, j].view(B, 1, 1)
-            stylized = central * (1 - local_scaling) + stylized * local_scaling
-
-            row_result[:, :, j] = stylized.squeeze(-1)
-        result[:, :, i, :] = row_result
-
-    return result
-
-
-
-
-
-
+    return adain_patchwise_local(content, style, sigma=sigma, kernel_size=kernel_size, eps=eps, mask=mask, use_median_blur=use_median_blur, lowpass_weight=lowpass_weight, highpass_weight=highpass_weight)
 
 
 
@@ -10,9 +10,13 @@ from dataclasses import dataclass, field
 import copy
 import base64
 import pickle # used strictly for serializing conditioning in the ConditioningToBase64 and Base64ToConditioning nodes for API use. (Offloading T5 processing to another machine to avoid model shuffling.)
+import os
+import json
+import hashlib
 
 import comfy.supported_models
 import node_helpers
+import folder_paths
 import gc
 
 
@@ -439,12 +443,97 @@ class Conditioning_Recast64:
         return (cond_0, cond_1,)
 
 
+CONDITIONING_CACHE_DIR   = os.environ.get("RES4LYF_CONDITIONING_DIR")   # defaults to <output>/conditioning_cache
+CONDITIONING_FORMAT      = "res4lyf_conditioning"
+CONDITIONING_SAVE_DTYPES = {"original": None, "float16": torch.float16, "bfloat16": torch.bfloat16}
+
+def get_conditioning_cache_dir():
+    return CONDITIONING_CACHE_DIR or os.path.join(folder_paths.get_output_directory(), "conditioning_cache")
+
+def conditioning_to_skeleton(obj, tensors, tensor_keys):
+    """JSON-safe skeleton of a conditioning structure. Tensors are moved into `tensors` and referenced by key."""
+    if isinstance(obj, torch.Tensor):
+        if id(obj) not in tensor_keys:
+            tensor_keys[id(obj)] = str(len(tensors))
+            tensors[tensor_keys[id(obj)]] = obj
+        return {"__tensor__": tensor_keys[id(obj)]}
+    elif isinstance(obj, list):
+        return [conditioning_to_skeleton(item, tensors, tensor_keys) for item in obj]
+    elif isinstance(obj, tuple):
+        return {"__tuple__": [conditioning_to_skeleton(item, tensors, tensor_keys) for item in obj]}
+    elif isinstance(obj, dict):
+        if not all(isinstance(key, str) for key in obj):
+            raise TypeError("conditioning dict has non-string keys")
+        return {"__dict__": {key: conditioning_to_skeleton(value, tensors, tensor_keys) for key, value in obj.items()}}
+    elif obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    raise TypeError(f"cannot serialize {type(obj).__name__} in conditioning")
+
+def skeleton_to_conditioning(obj, tensors):
+    if isinstance(obj, list):
+        return [skeleton_to_conditioning(item, tensors) for item in obj]
+    elif isinstance(obj, dict):
+        if "__tensor__" in obj:
+            return tensors[obj["__tensor__"]]
+        elif "__tuple__" in obj:
+            return tuple(skeleton_to_conditioning(item, tensors) for item in obj["__tuple__"])
+        return {key: skeleton_to_conditioning(value, tensors) for key, value in obj["__dict__"].items()}
+    return obj
+
+def save_conditioning_safetensors(conditioning, dtype="original", cache_dir=None):
+    """
+    Write conditioning tensors (float ones cast to `dtype`) as safetensors into a content-addressed cache dir, 
+    and return the small JSON reference that goes into the workflow. Raises TypeError for non-serializable contents.
+    """
+    from safetensors.torch import save
+    
+    tensors, tensor_keys = {}, {}
+    skeleton    = conditioning_to_skeleton(conditioning, tensors, tensor_keys)
+    save_dtype  = CONDITIONING_SAVE_DTYPES[dtype]
+    orig_dtypes = {key: str(tensor.dtype).split('.')[-1] for key, tensor in tensors.items()}
+    tensors     = {key: tensor.detach().to("cpu", save_dtype if save_dtype is not None and tensor.is_floating_point() else tensor.dtype, copy=True).contiguous()
+                   for key, tensor in tensors.items()}
+    
+    data = save(tensors, metadata={"format": CONDITIONING_FORMAT, "skeleton": json.dumps(skeleton), "dtypes": json.dumps(orig_dtypes)})
+    digest = hashlib.sha256(data).hexdigest()
+    
+    cache_dir = cache_dir or get_conditioning_cache_dir()
+    path      = os.path.join(cache_dir, f"{digest}.safetensors")
+    if not os.path.isfile(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    
+    return json.dumps({CONDITIONING_FORMAT: digest, "dtype": dtype, "tensors": len(tensors), "bytes": len(data)})
+
+def load_conditioning_safetensors(digest, cache_dir=None):
+    """Inverse of save_conditioning_safetensors(). Tensors come back in their original dtypes. No pickle involved."""
+    from safetensors import safe_open
+    
+    if not all(c in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Invalid conditioning hash: {digest}")
+    path = os.path.join(cache_dir or get_conditioning_cache_dir(), f"{digest}.safetensors")
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Conditioning {digest} not found in cache: {path}")
+    
+    with safe_open(path, framework="pt") as f:
+        metadata    = f.metadata()
+        orig_dtypes = json.loads(metadata["dtypes"])
+        tensors     = {key: f.get_tensor(key).to(getattr(torch, orig_dtypes[key])) for key in f.keys()}
+    
+    return skeleton_to_conditioning(json.loads(metadata["skeleton"]), tensors)
+
+
+
 class ConditioningToBase64:
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "conditioning": ("CONDITIONING",),
+                "format":       (["base64", "safetensors"],              {"default": "base64",   "tooltip": "base64: whole conditioning inline in the string (portable). safetensors: tensors saved to the conditioning cache dir, string only holds the hash."}),
+                "dtype":        (list(CONDITIONING_SAVE_DTYPES.keys()), {"default": "original", "tooltip": "Precision for float tensors in safetensors format. Restored to the original dtype on load."}),
             },
             "hidden": {
                 "unique_id": "UNIQUE_ID",
@@ -459,11 +548,19 @@ class ConditioningToBase64:
     OUTPUT_IS_LIST = (True,)
     CATEGORY       = "RES4LYF/utilities"
 
-    def notify(self, unique_id=None, extra_pnginfo=None, conditioning=None):
+    def notify(self, unique_id=None, extra_pnginfo=None, conditioning=None, format="base64", dtype="original"):
+        
+        conditioning_string = None
+        if format == "safetensors":
+            try:
+                conditioning_string = save_conditioning_safetensors(conditioning, dtype)
+            except TypeError as e:
+                RESplain(f"ConditioningToBase64: {e}, falling back to base64")
         
-        conditioning_pickle = pickle.dumps(conditioning)
-        conditioning_base64 = base64.b64encode(conditioning_pickle).decode('utf-8')
-        text = [conditioning_base64]
+        if conditioning_string is None:
+            conditioning_pickle = pickle.dumps(conditioning)
+            conditioning_string = base64.b64encode(conditioning_pickle).decode('utf-8')
+        text = [conditioning_string]
         
         if unique_id is not None and extra_pnginfo is not None:
             if not isinstance(extra_pnginfo, list):
@@ -480,7 +577,7 @@ class ConditioningToBase64:
                     None,
                 )
                 if node:
-                    node["widgets_values"] = [text]
+                    node["widgets_values"] = [format, dtype, text]
 
         return {"ui": {"text": text}, "result": (text,)}
 
@@ -498,6 +595,11 @@ class Base64ToConditioning:
     CATEGORY     = "RES4LYF/utilities"
 
     def main(self, data):
+        data = data.strip()
+        if data.startswith("{"):
+            reference = json.loads(data)
+            return (load_conditioning_safetensors(reference[CONDITIONING_FORMAT]),)
+        
         conditioning_pickle = base64.b64decode(data)
         conditioning = pickle.loads(conditioning_pickle)
         return (conditioning,)
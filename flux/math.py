@@ -7,6 +7,10 @@ import comfy.model_management
 
 import math
 
+from ..helper import TensorCache
+
+ROPE_CACHE = TensorCache(max_entries=8)
+
 
 def attention(q: Tensor, k: Tensor, v: Tensor, pe: Tensor, mask=None) -> Tensor:
 
@@ -31,11 +35,18 @@ def rope(pos: Tensor, dim: int, theta: int) -> Tensor:
     scale = torch.linspace(0, (dim - 2) / dim, steps=dim//2, dtype=torch.float64, device=device)
     omega = 1.0 / (theta**scale)
     out = torch.einsum("...n,d->...nd", pos.to(dtype=torch.float32, device=device), omega)
-    out = torch.stack([torch.cos(out), -torch.sin(out), torch.sin(out), torch.cos(out)], dim=-1)
+    cos, sin = torch.cos(out), torch.sin(out)
+    out = torch.stack([cos, -sin, sin, cos], dim=-1)
     out = rearrange(out, "b n d (i j) -> b n d i j", i=2, j=2)
     return out.to(dtype=torch.float32, device=pos.device)
 
 
+def get_pe_cached(pe_embedder, ids: Tensor, *key) -> Tensor:
+    """pe_embedder(ids), memoized. key must pin down the id layout (grid h/w, text length, kontext refs...)."""
+    key = (type(pe_embedder).__name__, *key, tuple(ids.shape), pe_embedder.theta, tuple(pe_embedder.axes_dim), ids.device, ids.dtype)
+    return ROPE_CACHE.get_or_set(key, lambda: pe_embedder(ids))
+
+
 def apply_rope(xq: Tensor, xk: Tensor, freqs_cis: Tensor):
     xq_ = xq.float().reshape(*xq.shape[:-1], -1, 1, 2)
     xk_ = xk.float().reshape(*xk.shape[:-1], -1, 1, 2)
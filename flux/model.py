@@ -5,11 +5,12 @@ import torch.nn.functional as F
 from torch import Tensor, nn
 from typing import Optional, Callable, Tuple, Dict, List, Any, Union
 
-from ..helper import ExtraOptions
+from ..helper import ExtraOptions, get_cond_groups
 
 from dataclasses import dataclass
 import copy
 
+from .math import get_pe_cached
 from .layers import (
     DoubleStreamBlock,
     EmbedND,
@@ -378,61 +379,77 @@ class ReFlux(Flux):
 
             mask_zero = None
             
+            # cond and uncond share masks and context length unless style guides, recon, control, kontext, pulid or a separate neg mask are in play
+            batch_cond = not EO("no_cond_batch")                                            \
+                            and not y0_style_active and not RECON_MODE                      \
+                            and control is None and ref_latents is None                     \
+                            and update_cross_attn is None                                   \
+                            and 'AttnMask_neg' not in transformer_options                   \
+                            and not getattr(self, "pulid_data", None)
+            
             out_list = []
-            for cond_iter in range(len(transformer_options['cond_or_uncond'])):
-                UNCOND = transformer_options['cond_or_uncond'][cond_iter] == 1
-                
-                if update_cross_attn is not None:
-                    update_cross_attn['UNCOND'] = UNCOND
-
+            for cond_group in get_cond_groups(transformer_options['cond_or_uncond'], batch_cond):
                 bsz_style = y0_style.shape[0] if y0_style_active else 0
-                bsz       = 1 if RECON_MODE else bsz_style + 1
+                bsz       = len(cond_group) if RECON_MODE else bsz_style + len(cond_group)
 
-                img, t, y, context = clone_inputs(img_orig, t_orig, y_orig, context_orig, index=cond_iter)
+                img_list, t_list, y_list, context_list = [], [], [], []
+                for cond_iter in cond_group:
+                    UNCOND = transformer_options['cond_or_uncond'][cond_iter] == 1
                 
-                mask = None
-                if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
-                    AttnMask = transformer_options['AttnMask']
-                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
-                        mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
-
-                    if weight == 0:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
-                        mask = None
-                    else:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
-
-                if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
-                    AttnMask = transformer_options['AttnMask_neg']
-                    mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
-                        mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
-
-                    if weight == 0:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
-                        mask = None
-                    else:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
+                    if update_cross_attn is not None:
+                        update_cross_attn['UNCOND'] = UNCOND
 
-                elif UNCOND and 'AttnMask' in transformer_options:
-                    AttnMask = transformer_options['AttnMask']
-                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                    img, t, y, context = clone_inputs(img_orig, t_orig, y_orig, context_orig, index=cond_iter)
+                
+                    mask = None
+                    if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
+                        AttnMask = transformer_options['AttnMask']
+                        mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
+                            mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
+
+                        if weight == 0:
+                            context = transformer_options['RegContext'].cast('context', context)
+                            mask = None
+                        else:
+                            context = transformer_options['RegContext'].cast('context', context)
+
+                    if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
+                        AttnMask = transformer_options['AttnMask_neg']
+                        mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
+                            mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
+
+                        if weight == 0:
+                            context = transformer_options['RegContext_neg'].cast('context', context)
+                            mask = None
+                        else:
+                            context = transformer_options['RegContext_neg'].cast('context', context)
+
+                    elif UNCOND and 'AttnMask' in transformer_options:
+                        AttnMask = transformer_options['AttnMask']
+                        mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
                     
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
 
-                        mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
-                    if weight == 0:                                                                             # ADDED 5/23/2025
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)  # ADDED 5/26/2025 14:53
-                        mask = None
-                    else:
-                        A       = context
-                        B       = transformer_options['RegContext'].context
-                        context = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
+                            mask_zero[txt_slice, txt_slice] = mask[txt_slice, txt_slice]
+                        if weight == 0:                                                                             # ADDED 5/23/2025
+                            context = transformer_options['RegContext'].cast('context', context)  # ADDED 5/26/2025 14:53
+                            mask = None
+                        else:
+                            A       = context
+                            B       = transformer_options['RegContext'].context
+                            context = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
+
+                    img_list.append(img)
+                    t_list.append(t)
+                    y_list.append(y)
+                    context_list.append(context)
 
+                img, t, y, context = torch.cat(img_list), torch.cat(t_list), torch.cat(y_list), torch.cat(context_list)
 
                 if y0_style_active and not RECON_MODE:
                     if mask is None:
@@ -524,7 +541,8 @@ class ReFlux(Flux):
                 # txt_ids -> 1,414,3
                 txt_ids = torch.zeros((bsz, context.shape[-2], 3), device=img.device, dtype=x.dtype) 
                 ids     = torch.cat((txt_ids, img_ids), dim=-2)   # ids -> 1,4446,3       # flipped from hidream
-                rope    = self.pe_embedder(ids)                  # rope -> 1, 4446, 1, 64, 2, 2
+                ref_shapes = tuple(tuple(ref.shape) for ref in ref_latents) if ref_latents is not None else None
+                rope    = get_pe_cached(self.pe_embedder, ids, h_len, w_len, context.shape[-2], ref_shapes)   # rope -> 1, 4446, 1, 64, 2, 2
 
                 txt_init = self.txt_in(context)
                 txt_init_len = txt_init.shape[-2]                                       # 271
@@ -696,7 +714,6 @@ class ReFlux(Flux):
             y0_style_pos_mask = transformer_options.get("y0_style_pos_mask")
             y0_style_pos_mask_edge = transformer_options.get("y0_style_pos_mask_edge")
 
-            y0_style_pos = y0_style_pos.to(dtype)
             x   = x_orig.to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -705,7 +722,7 @@ class ReFlux(Flux):
             denoised = x - sigma * eps
             
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_pos)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_pos, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -829,7 +846,7 @@ class ReFlux(Flux):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
                 
                 if transformer_options.get('y0_standard_guide') is not None:
@@ -886,7 +903,6 @@ class ReFlux(Flux):
             y0_style_neg_mask = transformer_options.get("y0_style_neg_mask")
             y0_style_neg_mask_edge = transformer_options.get("y0_style_neg_mask_edge")
             
-            y0_style_neg = y0_style_neg.to(dtype)
             x   = x_orig.to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -895,7 +911,7 @@ class ReFlux(Flux):
             denoised = x - sigma * eps
 
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_neg)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_neg, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -921,7 +937,7 @@ class ReFlux(Flux):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
 
             elif transformer_options['y0_style_method'] == "WCT2":
@@ -3,6 +3,8 @@ import comfy.ops
 import torch.nn
 import torch.nn.functional as F
 
+from ..helper import get_pinv_cached
+
 ops = comfy.ops.manual_cast
 
 class ReReduxImageEncoder(torch.nn.Module):
@@ -47,7 +49,7 @@ class ReReduxImageEncoder(torch.nn.Module):
         cond_256 = cond[0][0].clone()
         
         if not hasattr(self, "W_pinv"):
-            self.W_pinv = torch.linalg.pinv(W.to(pinv_dtype).cuda()).to(W)
+            self.W_pinv = get_pinv_cached(self.redux_down.weight.data, pinv_dtype).to(W)
         
         #cond_256_embed = (cond_256 - b) @ torch.linalg.pinv(W.to(pinv_dtype)).T.to(dtype)
         cond_embed256 = (cond_256 - b.to(cond_256)) @ self.W_pinv.T.to(cond_256)
@@ -2,9 +2,13 @@ import torch
 import torch.nn.functional as F
 from typing import Optional, Callable, Tuple, Dict, Any, Union, TYPE_CHECKING, TypeVar, List
 
+import os
 import re
 import functools
 import copy
+import hashlib
+import weakref
+from collections import OrderedDict
 
 from comfy.samplers import SCHEDULER_NAMES
 
@@ -370,6 +374,12 @@ def conditioning_set_values(conditioning, values={}):
         c.append(n)
     return c
 
+def get_cond_groups(cond_or_uncond, batched=False):
+    """Batch indices to run through the model together. One group for all of cond/uncond when batched, else one per item."""
+    if batched and len(cond_or_uncond) > 1:
+        return [list(range(len(cond_or_uncond)))]
+    return [[i] for i in range(len(cond_or_uncond))]
+
 
 
 
@@ -851,3 +861,135 @@ def get_max_dtype(device='cpu'):
     return MAX_DTYPE
 
 
+
+
+# CACHE OPS
+
+TENSOR_HASH_NUMPY_DTYPES = {torch.bool, torch.uint8, torch.int8, torch.int16, torch.int32, torch.int64, torch.float16, torch.float32, torch.float64, torch.complex64, torch.complex128}
+
+def tensor_hash(*tensors):
+    """Content hash of one or more tensors (shape, dtype and raw bytes). None entries are hashed as a placeholder."""
+    h = hashlib.sha1()
+    for tensor in tensors:
+        if tensor is None:
+            h.update(b"none")
+            continue
+        tensor = tensor.detach()
+        h.update(str((tuple(tensor.shape), str(tensor.dtype))).encode())
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.view(torch.int16)
+        elif tensor.dtype not in TENSOR_HASH_NUMPY_DTYPES:      # float8 etc. have no numpy equivalent: hash the raw bytes
+            tensor = tensor.contiguous().reshape(-1).view(torch.uint8)
+        h.update(tensor.contiguous().cpu().numpy().tobytes())
+    return h.hexdigest()
+
+
+class TensorCache:
+    """Small bounded cache. Least recently used entries are evicted first once max_entries is exceeded."""
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.entries     = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return value
+
+    def get_or_set(self, key, fn):
+        if key in self.entries:
+            return self.get(key)
+        return self.set(key, fn())
+
+    def clear(self):
+        self.entries.clear()
+
+
+class CastCache:
+    """dtype/device converted copies of tensors, reused while the source is the same tensor object. Replacing the source
+    invalidates its entry; in-place edits are not tracked (inference tensors have no version counter), so clear() after them."""
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, name, tensor, dtype=None, device=None):
+        key   = (name, dtype, str(device))
+        entry = self.entries.get(key)
+        if entry is None or entry[0] is not tensor:
+            entry = self.entries[key] = (tensor, tensor.to(device=device, dtype=dtype))
+        return entry[1]
+
+    def clear(self):
+        self.entries.clear()
+
+
+SIGMAS_CACHE = TensorCache(max_entries=64)
+
+def get_sigmas_cached(model_sampling, params, calculate):
+    """Schedule memoized by (model_sampling type, hash of its sigma table, params). calculate() runs on a miss.
+    Every call returns a fresh copy, so callers may modify it in place."""
+    key    = (type(model_sampling).__qualname__, tensor_hash(getattr(model_sampling, "sigmas", None)), params)
+    sigmas = SIGMAS_CACHE.get(key)
+    if sigmas is None:
+        sigmas = SIGMAS_CACHE.set(key, calculate().detach())
+    return sigmas.clone()
+
+
+PINV_CACHE     = TensorCache(max_entries=16)
+PINV_CACHE_DIR = os.environ.get("RES4LYF_PINV_CACHE_DIR")   # set to persist inverses across sessions as safetensors
+
+def get_pinv_cached(W, dtype=torch.float64, cache_dir=None):
+    """torch.linalg.pinv(W.to(dtype)), computed on W's own device and cached by weight hash + dtype.
+    Held in memory for the session; if cache_dir (or RES4LYF_PINV_CACHE_DIR) is set, also persisted there as safetensors.
+    Hashing copies W to the host, so call this once per weight (see get_module_pinv), not per step."""
+    W   = W.detach().to(dtype)
+    key = (tensor_hash(W), str(dtype), str(W.device))
+    if key in PINV_CACHE:
+        return PINV_CACHE.get(key)
+    
+    cache_dir = cache_dir if cache_dir is not None else PINV_CACHE_DIR
+    path      = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"pinv_{key[0]}_{str(dtype).split('.')[-1]}.safetensors")
+        if os.path.isfile(path):
+            from safetensors.torch import load_file
+            return PINV_CACHE.set(key, load_file(path, device=str(W.device))["pinv"])
+    
+    W_inv = torch.linalg.pinv(W)
+    
+    if path is not None:
+        from safetensors.torch import save_file
+        os.makedirs(cache_dir, exist_ok=True)
+        save_file({"pinv": W_inv.contiguous().cpu()}, path)
+    return PINV_CACHE.set(key, W_inv)
+
+
+PINV_MODULE_MEMO = weakref.WeakKeyDictionary()   # module -> {(dtype, device): (weight identity, pinv)}
+
+def get_module_pinv(module, dtype=torch.float64, device=None):
+    """pinv of a Linear/Conv module's weight flattened to [C_out, -1], memoized on the module per dtype and target device.
+    Per-step callers only compare the weight's identity (storage pointer, device, dtype, shape); the pinv is resolved again
+    through get_pinv_cached() when the weight is replaced or moved. In-place edits are only seen outside inference mode:
+    inference tensors (ComfyUI builds models under torch.inference_mode()) have no version counter."""
+    weight   = module.weight
+    version  = None if weight.is_inference() else weight._version
+    identity = (weight.data_ptr(), weight.device, weight.dtype, tuple(weight.shape), version)
+    memo     = PINV_MODULE_MEMO.setdefault(module, {})
+    key      = (dtype, str(device if device is not None else weight.device))
+    entry    = memo.get(key)
+    if entry is None or entry[0] != identity:
+        W_inv = get_pinv_cached(weight.detach().reshape(weight.shape[0], -1), dtype)
+        entry = memo[key] = (identity, W_inv if device is None else W_inv.to(device))
+    return entry[1]
@@ -21,7 +21,8 @@ from comfy.ldm.modules.attention import optimized_attention, attention_pytorch
 import comfy.model_management
 import comfy.ldm.common_dit
 
-from ..helper  import ExtraOptions
+from ..helper  import ExtraOptions, get_cond_groups
+from ..flux.math import get_pe_cached
 from ..latents import slerp_tensor, interpolate_spd, tile_latent, untile_latent, gaussian_blur_2d, median_blur_2d
 from ..style_transfer import StyleMMDiT_Model, apply_scattersort_masked, apply_scattersort_tiled, adain_seq_inplace, adain_patchwise_row_batch_med, adain_patchwise_row_batch, adain_seq, apply_scattersort
 
@@ -218,28 +219,34 @@ class HDMOEFeedForwardSwiGLU(nn.Module):
         topk_weight = style_block(topk_weight, "topk_weight")
                 
         if y_shared.shape[0] > 1 and style_block.gate[0] and not HDModel.RECON_MODE:
-            topk_idx[0] = topk_idx[1]
+            topk_idx = topk_idx[1:2].expand_as(topk_idx).clone()      # every row (content and each style ref) takes the first style ref's routing
         tk_idx_flat = topk_idx.view(topk_idx.shape[0], -1) 
         
-        x = x.repeat_interleave(self.num_activated_experts, dim=-2)
-        y = torch.empty_like(x)
+        # sort token slots by expert once, run each expert on a contiguous slice, then scatter back into slot order
+        k = self.num_activated_experts
         
         if style_block.gate[0] and not HDModel.RECON_MODE and y_shared.shape[0] > 1:
-            for i, expert in enumerate(self.experts): # TODO: check for empty expert lists and continue if found to avoid CUBLAS errors
-                x_list = []
-                for b in range(x.shape[0]):
-                    x_sel = x[b][tk_idx_flat[b]==i]
-                    x_list.append(x_sel)
-                x_list = torch.stack(x_list, dim=0)
-                x_out = expert(x_list, style_block.FF_SEPARATE).to(x.dtype)
-                for b in range(y.shape[0]):
-                    y[b][tk_idx_flat[b]==i] = x_out[b]
+            order    = tk_idx_flat.argsort(dim=-1, stable=True)                             # b, l*k     stable: keeps token order within each expert
+            counts   = torch.bincount(tk_idx_flat[0], minlength=len(self.experts)).tolist() # routing is identical for every row here
+            x_sorted = torch.gather(x, 1, (order // k).unsqueeze(-1).expand(-1, -1, x.shape[-1]))
+            y_sorted = torch.empty_like(x_sorted)
+            start = 0
+            for expert, count in zip(self.experts, counts):
+                if count > 0:
+                    y_sorted[:, start:start+count] = expert(x_sorted[:, start:start+count], style_block.FF_SEPARATE).to(x.dtype)
+                start += count
+            y = torch.empty_like(y_sorted).scatter_(1, order.unsqueeze(-1).expand_as(y_sorted), y_sorted)
         else:
-            for i, expert in enumerate(self.experts): 
-                x_sel = x[tk_idx_flat == i, :]
-                if x_sel.shape[0] == 0:
-                    continue 
-                y[tk_idx_flat == i, :] = expert(x_sel).to(x.dtype)
+            order    = tk_idx_flat.reshape(-1).argsort(stable=True)
+            counts   = torch.bincount(tk_idx_flat.reshape(-1), minlength=len(self.experts)).tolist()
+            x_sorted = x.reshape(-1, x.shape[-1])[order // k]
+            y_sorted = torch.empty_like(x_sorted)
+            start = 0
+            for expert, count in zip(self.experts, counts):
+                if count > 0:
+                    y_sorted[start:start+count] = expert(x_sorted[start:start+count]).to(x.dtype)
+                start += count
+            y = torch.empty_like(y_sorted).index_copy_(0, order, y_sorted).view(x.shape[0], -1, x.shape[-1])
                 
         y = style_block(y, "separate")
 
@@ -817,75 +824,91 @@ class HDModel(nn.Module):
 
             mask_zero = None
             
+            # cond and uncond share masks and context length unless style guides, recon, control or a separate neg mask are in play
+            batch_cond = not EO("no_cond_batch")                                            \
+                            and not y0_style_active and not HDModel.RECON_MODE              \
+                            and control is None and update_cross_attn is None               \
+                            and 'AttnMask_neg' not in transformer_options
+            
             out_list = []
-            for cond_iter in range(len(transformer_options['cond_or_uncond'])):
-                UNCOND = transformer_options['cond_or_uncond'][cond_iter] == 1
-                
-                if update_cross_attn is not None:
-                    update_cross_attn['UNCOND'] = UNCOND
-
+            for cond_group in get_cond_groups(transformer_options['cond_or_uncond'], batch_cond):
                 bsz_style = y0_style.shape[0] if y0_style_active else 0
-                bsz       = 1 if HDModel.RECON_MODE else bsz_style + 1
+                bsz       = len(cond_group) if HDModel.RECON_MODE else bsz_style + len(cond_group)
 
-                img, t, y, context, llama3 = clone_inputs(img_orig, t_orig, y_orig, context_orig, llama3_orig, index=cond_iter)
+                img_list, t_list, y_list, context_list, llama3_list = [], [], [], [], []
+                for cond_iter in cond_group:
+                    UNCOND = transformer_options['cond_or_uncond'][cond_iter] == 1
                 
-                mask = None
-                if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
-                    AttnMask = transformer_options['AttnMask']
-                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
-                        #img_len = transformer_options['AttnMask'].img_len
-                        mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
-
-                    if weight == 0:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
-                        context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
-                        llama3  = transformer_options['RegContext'].llama3 .to(llama3 .dtype).to(llama3 .device)
-                        mask = None
-                    else:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
-                        llama3  = transformer_options['RegContext'].llama3 .to(llama3 .dtype).to(llama3 .device)
-
-                if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
-                    AttnMask = transformer_options['AttnMask_neg']
-                    mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
-                        img_len = transformer_options['AttnMask_neg'].img_len
-                        mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
-
-                    if weight == 0:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
-                        context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
-                        llama3  = transformer_options['RegContext_neg'].llama3 .to(llama3 .dtype).to(llama3 .device)
-                        mask = None
+                    if update_cross_attn is not None:
+                        update_cross_attn['UNCOND'] = UNCOND
 
-                    else:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
-                        llama3  = transformer_options['RegContext_neg'].llama3 .to(llama3 .dtype).to(llama3 .device)
-
-                elif UNCOND and 'AttnMask' in transformer_options:
-                    AttnMask = transformer_options['AttnMask']
-                    mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                    img, t, y, context, llama3 = clone_inputs(img_orig, t_orig, y_orig, context_orig, llama3_orig, index=cond_iter)
+                
+                    mask = None
+                    if not UNCOND and 'AttnMask' in transformer_options: # and weight != 0:
+                        AttnMask = transformer_options['AttnMask']
+                        mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
+                            #img_len = transformer_options['AttnMask'].img_len
+                            mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
+
+                        if weight == 0:
+                            context = transformer_options['RegContext'].cast('context', context)
+                            context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
+                            llama3  = transformer_options['RegContext'].cast('llama3',  llama3)
+                            mask = None
+                        else:
+                            context = transformer_options['RegContext'].cast('context', context)
+                            llama3  = transformer_options['RegContext'].cast('llama3',  llama3)
+
+                    if UNCOND and 'AttnMask_neg' in transformer_options: # and weight != 0:
+                        AttnMask = transformer_options['AttnMask_neg']
+                        mask = transformer_options['AttnMask_neg'].attn_mask.mask.to('cuda')
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
+                            img_len = transformer_options['AttnMask_neg'].img_len
+                            mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
+
+                        if weight == 0:
+                            context = transformer_options['RegContext_neg'].cast('context', context)
+                            context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
+                            llama3  = transformer_options['RegContext_neg'].cast('llama3',  llama3)
+                            mask = None
+
+                        else:
+                            context = transformer_options['RegContext_neg'].cast('context', context)
+                            llama3  = transformer_options['RegContext_neg'].cast('llama3',  llama3)
+
+                    elif UNCOND and 'AttnMask' in transformer_options:
+                        AttnMask = transformer_options['AttnMask']
+                        mask = transformer_options['AttnMask'].attn_mask.mask.to('cuda')
                     
-                    if mask_zero is None:
-                        mask_zero = torch.ones_like(mask)
-                        #img_len = transformer_options['AttnMask'].img_len
-                        mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
-                    if weight == 0:                                                                             # ADDED 5/23/2025
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)  # ADDED 5/26/2025 14:53
-                        context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
-                        llama3  = transformer_options['RegContext'].llama3 .to(llama3 .dtype).to(llama3 .device)
-                        mask = None
-                    else:
-                        A       = context
-                        B       = transformer_options['RegContext'].context
-                        context = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
-
-                        A       = llama3
-                        B       = transformer_options['RegContext'].llama3
-                        llama3  = A.repeat(1, 1, (B.shape[2] // A.shape[2]) + 1, 1)[:,:, :B.shape[2], :]
+                        if mask_zero is None:
+                            mask_zero = torch.ones_like(mask)
+                            #img_len = transformer_options['AttnMask'].img_len
+                            mask_zero[img_len:, img_len:] = mask[img_len:, img_len:]
+                        if weight == 0:                                                                             # ADDED 5/23/2025
+                            context = transformer_options['RegContext'].cast('context', context)  # ADDED 5/26/2025 14:53
+                            context = context.view(128, -1, context.shape[-1]).sum(dim=-2)                                    # 128 !!!
+                            llama3  = transformer_options['RegContext'].cast('llama3',  llama3)
+                            mask = None
+                        else:
+                            A       = context
+                            B       = transformer_options['RegContext'].context
+                            context = A.repeat(1,    (B.shape[1] // A.shape[1]) + 1, 1)[:,   :B.shape[1], :]
+
+                            A       = llama3
+                            B       = transformer_options['RegContext'].llama3
+                            llama3  = A.repeat(1, 1, (B.shape[2] // A.shape[2]) + 1, 1)[:,:, :B.shape[2], :]
+
+                    img_list.append(img)
+                    t_list.append(t)
+                    y_list.append(y)
+                    context_list.append(context)
+                    llama3_list.append(llama3)
+
+                img, t, y, context, llama3 = torch.cat(img_list), torch.cat(t_list), torch.cat(y_list), torch.cat(context_list), torch.cat(llama3_list)
 
                 if y0_style_active and not HDModel.RECON_MODE:
                     if mask is None:
@@ -937,7 +960,7 @@ class HDModel(nn.Module):
                 # txt_ids -> 1,414,3
                 txt_ids = torch.zeros(bsz,   contexts[-1].shape[1] + contexts[-2].shape[1] + contexts[0].shape[1],     3,    device=img_ids.device, dtype=img_ids.dtype)
                 ids     = torch.cat((img_ids, txt_ids), dim=-2)   # ids -> 1,4446,3
-                rope    = self.pe_embedder(ids)                  # rope -> 1, 4446, 1, 64, 2, 2
+                rope    = get_pe_cached(self.pe_embedder, ids, tuple(img_sizes[0]))   # rope -> 1, 4446, 1, 64, 2, 2
 
                 txt_init     = torch.cat([contexts[-1], contexts[-2]], dim=-2)     # shape[1] == 128, 143       then on another step/call it's 128, 128...??? cuz the contexts is now 1,128,2560
                 txt_init_len = txt_init.shape[-2]                                       # 271
@@ -1109,7 +1132,6 @@ class HDModel(nn.Module):
             y0_style_pos_mask = transformer_options.get("y0_style_pos_mask")
             y0_style_pos_mask_edge = transformer_options.get("y0_style_pos_mask_edge")
 
-            y0_style_pos = y0_style_pos.to(dtype)
             x   = x_orig.to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -1118,7 +1140,7 @@ class HDModel(nn.Module):
             denoised = x - sigma * eps
             
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_pos)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_pos, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -1242,7 +1264,7 @@ class HDModel(nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
                 
                 if transformer_options.get('y0_standard_guide') is not None:
@@ -1299,7 +1321,6 @@ class HDModel(nn.Module):
             y0_style_neg_mask = transformer_options.get("y0_style_neg_mask")
             y0_style_neg_mask_edge = transformer_options.get("y0_style_neg_mask_edge")
             
-            y0_style_neg = y0_style_neg.to(dtype)
             x   = x_orig.to(dtype)
             eps = eps.to(dtype)
             eps_orig = eps.clone()
@@ -1308,7 +1329,7 @@ class HDModel(nn.Module):
             denoised = x - sigma * eps
 
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_neg)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_neg, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -1334,7 +1355,7 @@ class HDModel(nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                self.StyleWCT.set(y0_adain_embed)
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
                 denoised_embed = self.StyleWCT.get(denoised_embed)
 
             elif transformer_options['y0_style_method'] == "WCT2":
@@ -1,7 +1,9 @@
 import torch
 import torch.nn.functional as F
 import math
+import os
 
+from concurrent.futures import ThreadPoolExecutor
 from torchvision import transforms
 
 from torch  import Tensor
@@ -14,6 +16,7 @@ import cv2
 from PIL import Image, ImageFilter, ImageEnhance
 
 import comfy
+import comfy.model_management
 
 # tensor -> PIL
 def tensor2pil(image):
@@ -24,28 +27,32 @@ def pil2tensor(image):
     return torch.from_numpy(np.array(image).astype(np.float32) / 255.0).unsqueeze(0)
 
 
-def freq_sep_fft(img, cutoff=5, sigma=10):
-    fft_img = torch.fft.fft2(img, dim=(-2, -1))
-    fft_shifted = torch.fft.fftshift(fft_img)
+FFT_LOW_PASS_CACHE = {}
 
-    _, _, h, w = img.shape
+def get_fft_low_pass_filter(h, w, sigma, device, dtype=torch.float64):
+    key = (h, w, float(sigma), str(device), dtype)
+    low_pass_filter = FFT_LOW_PASS_CACHE.get(key)
+    if low_pass_filter is None:
+        # freq domain -> meshgrid
+        y, x = torch.meshgrid(torch.arange(h, device=device), torch.arange(w, device=device), indexing="ij")
+        center_y, center_x = h // 2, w // 2
+        distance = torch.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
 
-    # freq domain -> meshgrid
-    y, x = torch.meshgrid(torch.arange(h, device=img.device), torch.arange(w, device=img.device))
-    center_y, center_x = h // 2, w // 2
-    distance = torch.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+        # smoother low-pass filter via gaussian filter
+        low_pass_filter = torch.exp(-distance**2 / (2 * sigma**2)).to(dtype)
+        FFT_LOW_PASS_CACHE[key] = low_pass_filter
+    return low_pass_filter
 
-    # smoother low-pass filter via gaussian filter
-    low_pass_filter = torch.exp(-distance**2 / (2 * sigma**2))
+def freq_sep_fft(img, cutoff=5, sigma=10):
+    _, _, h, w = img.shape
+    low_pass_filter = get_fft_low_pass_filter(h, w, sigma, img.device, img.dtype)
 
-    low_pass_filter = low_pass_filter.unsqueeze(0).unsqueeze(0)
+    fft_shifted  = torch.fft.fftshift(torch.fft.fft2(img, dim=(-2, -1)), dim=(-2, -1))
     low_pass_fft = fft_shifted * low_pass_filter
 
-    high_pass_fft = fft_shifted * (1 - low_pass_filter)
-
-    # inverse FFT -> return to spatial domain
-    low_pass_img  = torch.fft.ifft2(torch.fft.ifftshift( low_pass_fft), dim=(-2, -1)).real
-    high_pass_img = torch.fft.ifft2(torch.fft.ifftshift(high_pass_fft), dim=(-2, -1)).real
+    # inverse FFT -> return to spatial domain. the high band is the remainder, no second inverse FFT needed
+    low_pass_img  = torch.fft.ifft2(torch.fft.ifftshift(low_pass_fft, dim=(-2, -1)), dim=(-2, -1)).real
+    high_pass_img = img - low_pass_img
 
     return low_pass_img, high_pass_img
 
@@ -111,6 +118,63 @@ def rgb_to_lab(image):
 def lab_to_rgb(image):
     return kornia.color.lab_to_rgb(image)
 
+
+
+# fused frequency separation: every band is computed chunk by chunk on the device, without full-size intermediates
+
+FREQ_SEP_CHUNK_PIXELS = 2**24    # pixels per chunk of frames
+
+FREQ_SEP_METHODS = {    # method: (split(original, low_pass) -> high_pass,   merge(low_pass, high_pass) -> original)
+    "hard":   (hard_light_freq_sep,                                           hard_light_blend),
+    "linear": (linear_light_freq_sep,                                         linear_light_blend),
+    "vivid":  (lambda original, low_pass: hard_light_freq_sep(low_pass, original), lambda low_pass, high_pass: hard_light_blend(high_pass, low_pass)),
+}
+
+def freq_sep_chunks(*images):
+    """Yield aligned frame chunks of B×H×W×C images (None passes through, batch 1 broadcasts)."""
+    ref   = [img for img in images if img is not None]
+    B     = max(img.shape[0] for img in ref)
+    chunk = max(1, FREQ_SEP_CHUNK_PIXELS // (ref[0].shape[1] * ref[0].shape[2]))
+    for start in range(0, B, chunk):
+        yield [img if img is None or img.shape[0] == 1 else img[start:start+chunk] for img in images]
+
+def to_freq_sep_space(img, device, lab=False):
+    img = img.to(device, torch.float64)
+    if lab:
+        img = normalize_lab(rgb_to_lab(img.permute(0, 3, 1, 2))).permute(0, 2, 3, 1)
+    return img
+
+def from_freq_sep_space(img, like, lab=False):
+    if lab:
+        img = lab_to_rgb(denormalize_lab(img.permute(0, 3, 1, 2))).permute(0, 2, 3, 1)
+    return img.to(like.device, like.dtype)
+
+def frequency_separation(high_pass=None, original=None, low_pass=None, method="hard", lab=False, device=None):
+    """
+    Fill in whichever of high_pass/original is None from the other two, in float64 on `device`, one chunk of frames at a time.
+    lab=True blends in normalized LAB space. Returns (high_pass, original, low_pass) on the inputs' device and dtype.
+    """
+    device       = comfy.model_management.get_torch_device() if device is None else device
+    split, merge = FREQ_SEP_METHODS[method]
+    like         = next(img for img in (original, low_pass, high_pass) if img is not None)
+
+    high_chunks, original_chunks = [], []
+    for hp, orig, lp in freq_sep_chunks(high_pass, original, low_pass):
+        lp = to_freq_sep_space(lp, device, lab)
+        if hp is None:
+            hp = split(to_freq_sep_space(orig, device, lab), lp)
+            high_chunks.append(from_freq_sep_space(hp, like, lab))
+        else:
+            hp = to_freq_sep_space(hp, device, lab)
+        if orig is None:
+            original_chunks.append(from_freq_sep_space(merge(lp, hp), like, lab))
+
+    if high_pass is None:
+        high_pass = torch.cat(high_chunks, dim=0)
+    if original is None:
+        original  = torch.cat(original_chunks, dim=0)
+    return high_pass, original, low_pass
+
 # cv2_layer() and ImageMedianBlur adapted from: https://github.com/Nourepide/ComfyUI-Allor/
     
 def cv2_layer(tensor, function):
@@ -139,14 +203,125 @@ def cv2_layer(tensor, function):
             return torch.from_numpy(result_rgba)
 
     if shape_size == 3:
-        return torch.from_numpy(produce(tensor))
+        return produce(tensor)
     elif shape_size == 4:
-        return torch.stack([
-            produce(tensor[i]) for i in range(len(tensor))
-        ])
+        tensor = tensor.cpu()
+        if len(tensor) == 1:
+            return produce(tensor[0]).unsqueeze(0)
+        # cv2 releases the GIL, so frames run in parallel
+        with ThreadPoolExecutor(max_workers=min(len(tensor), CV2_LAYER_WORKERS)) as pool:
+            return torch.stack(list(pool.map(produce, tensor)))
     else:
         raise ValueError("Incompatible tensor dimension.")
+
+
+
+# batched torch filters, run on the comfy device. cv2_layer stays as the exact CPU path.
+
+CV2_LAYER_WORKERS    = os.cpu_count() or 1
+FILTER_CHUNK_ELEMS   = 2**27    # max elements of an unfolded median window block
+BLUR_KERNEL_CACHE    = {}
+
+CV2_SMALL_GAUSSIAN_KERNELS = {  # cv2.getGaussianKernel() uses fixed tables for ksize <= 7 when sigma <= 0
+    1: [1.],
+    3: [0.25, 0.5, 0.25],
+    5: [0.0625, 0.25, 0.375, 0.25, 0.0625],
+    7: [0.03125, 0.109375, 0.21875, 0.28125, 0.21875, 0.109375, 0.03125],
+}
+
+def get_filter_backend(device):
+    """torch on accelerators, cv2 (threaded over frames, bit-exact with the old nodes) on CPU."""
+    return "cv2" if torch.device(device).type == "cpu" else "torch"
+
+def get_blur_kernel_1d(kind, size, sigma=0.0, device="cpu", dtype=torch.float32):
+    """Normalized 1D "gaussian" or "box" kernel, cached per (kind, size, sigma, device, dtype). Gaussian matches cv2.getGaussianKernel."""
+    key = (kind, size, float(sigma), str(device), dtype)
+    kernel = BLUR_KERNEL_CACHE.get(key)
+    if kernel is None:
+        if kind == "box":
+            kernel = torch.full((size,), 1.0 / size, dtype=torch.float64)
+        elif sigma <= 0 and size in CV2_SMALL_GAUSSIAN_KERNELS:
+            kernel = torch.tensor(CV2_SMALL_GAUSSIAN_KERNELS[size], dtype=torch.float64)
+        else:
+            sigma  = sigma if sigma > 0 else 0.3 * ((size - 1) * 0.5 - 1) + 0.8
+            x      = torch.arange(size, dtype=torch.float64) - (size - 1) / 2
+            kernel = torch.exp(-x**2 / (2 * sigma**2))
+            kernel = kernel / kernel.sum()
+        kernel = kernel.to(device=device, dtype=dtype)
+        BLUR_KERNEL_CACHE[key] = kernel
+    return kernel
+
+def reflect_101_indices(n, p_lo, p_hi, device="cpu"):
+    """Source indices for padding a length n axis by (p_lo, p_hi) with cv2's BORDER_REFLECT_101, reflecting repeatedly
+    when the padding is wider than the axis (F.pad "reflect" requires padding < n)."""
+    idx = torch.arange(-p_lo, n + p_hi, device=device)
+    if n == 1:
+        return torch.zeros_like(idx)
+    idx = idx.remainder(2 * n - 2)
+    return torch.where(idx >= n, 2 * n - 2 - idx, idx)
+
+def separable_blur(img, kernel_1d, padding_mode="reflect"):
+    """Depthwise separable blur of a B×C×H×W tensor. "reflect" is cv2's default BORDER_REFLECT_101, for any image size."""
+    C    = img.shape[1]
+    k    = kernel_1d.shape[0]
+    p_lo = k // 2
+    p_hi = k - 1 - p_lo
+    H, W = img.shape[-2:]
+    if padding_mode == "reflect" and (max(p_lo, p_hi) >= H or max(p_lo, p_hi) >= W):
+        img = img[..., reflect_101_indices(H, p_lo, p_hi, img.device), :][..., reflect_101_indices(W, p_lo, p_hi, img.device)]
+    else:
+        img = F.pad(img, (p_lo, p_hi, p_lo, p_hi), mode=padding_mode)
+    img = F.conv2d(img, kernel_1d.view(1, 1, 1, k).expand(C, 1, 1, k), groups=C)
+    img = F.conv2d(img, kernel_1d.view(1, 1, k, 1).expand(C, 1, k, 1), groups=C)
+    return img
+
+def median_blur_torch(img, size):
+    """Median filter of a B×C×H×W tensor with replicated borders (as cv2.medianBlur), chunked over frames and rows."""
+    if size <= 1:
+        return img
+    B, C, H, W = img.shape
+    p_lo = size // 2
+    p_hi = size - 1 - p_lo
+    out  = torch.empty_like(img)
+    rows = max(1, FILTER_CHUNK_ELEMS // (C * W * size * size))
+    for b in range(B):
+        padded = F.pad(img[b:b+1].float(), (p_lo, p_hi, p_lo, p_hi), mode="replicate")
+        for y in range(0, H, rows):
+            y_end   = min(H, y + rows)
+            windows = padded[..., y : y_end + size - 1, :].unfold(2, size, 1).unfold(3, size, 1)
+            out[b:b+1, :, y:y_end] = windows.reshape(*windows.shape[:4], -1).median(dim=-1).values.to(img)
+    return out
+
+def filter_images(images, kind, size, sigma=0.0, device=None, backend=None):
+    """
+    Blur a B×H×W×C uint8 image batch with a "median", "gaussian" or "box" filter of odd kernel `size`.
+    backend "cv2" runs cv2 per frame in a thread pool, "torch" runs batched on `device`. Returns uint8 on the input's device.
+    """
+    if size < 1 or size % 2 == 0:
+        raise ValueError(f"Kernel size for {kind} blur must be a positive odd number, got {size}.")
     
+    device  = comfy.model_management.get_torch_device() if device is None else device
+    backend = get_filter_backend(device) if backend is None else backend
+
+    if backend == "cv2":
+        match kind:
+            case "median":
+                function = lambda x: cv2.medianBlur(x, size)
+            case "gaussian":
+                function = lambda x: cv2.GaussianBlur(x, (size, size), sigma)
+            case "box":
+                function = lambda x: cv2.blur(x, (size, size))
+        return cv2_layer(images, function).to(images.device)
+
+    x = images.to(device).permute(0, 3, 1, 2)
+    if kind == "median":
+        x = median_blur_torch(x, size)
+    else:
+        x = separable_blur(x.float(), get_blur_kernel_1d(kind, size, sigma, device))
+        x = x.round().clamp(0, 255).to(images.dtype)
+    return x.permute(0, 2, 3, 1).to(images.device)
+
+
 
 # adapted from https://github.com/cubiq/ComfyUI_essentials
 def image_resize(image,
@@ -304,6 +479,61 @@ class ImageRepeatTileToSize:
 
 # Rewrite of the WAS Film Grain node, much improved speed and efficiency (https://github.com/WASasquatch/was-node-suite-comfyui)
 
+FILM_GRAIN_CHUNK_PIXELS = 2**26    # supersampled pixels processed per chunk of frames
+
+EDGE_ENHANCE_MORE_KERNEL = torch.tensor([[-1., -1., -1.],
+                                         [-1.,  9., -1.],
+                                         [-1., -1., -1.]])
+
+def film_grain(img, density=0.1, intensity=1.0, highlights=1.0, supersample_factor=4, seed=-1, device=None):
+    """
+    Batched film grain on a B×H×W×C image tensor. Same model as the old per-frame PIL version: grayscale, supersample, 
+    replace a `density` fraction of pixels with random gray, blur, downsample, edge enhance, blend, brighten.
+    Frame i is seeded with seed+i (seed < 0 -> unseeded). Runs on the comfy device, in chunks of frames.
+    """
+    device = comfy.model_management.get_torch_device() if device is None else device
+    B, H, W, C = img.shape
+    supersample_factor = int(supersample_factor)
+    sH, sW  = H * supersample_factor, W * supersample_factor
+    hit_p   = 1 - math.exp(-density)    # chance a pixel is hit by density*N draws with replacement
+    chunk   = max(1, FILM_GRAIN_CHUNK_PIXELS // (sH * sW))
+    kernel  = EDGE_ENHANCE_MORE_KERNEL.to(device).view(1, 1, 3, 3)
+    
+    out = []
+    for start in range(0, B, chunk):
+        x = img[start:start+chunk].to(device, torch.float32)
+        n = x.shape[0]
+        
+        rgb  = x[..., :3]
+        gray = (rgb * rgb.new_tensor([0.299, 0.587, 0.114])).sum(dim=-1, keepdim=True).permute(0, 3, 1, 2)
+        gray = F.interpolate(gray, size=(sH, sW), mode="bilinear", align_corners=False)
+        
+        if seed < 0:
+            hits   = torch.rand_like(gray)
+            values = torch.randint(0, 256, gray.shape, device=device).to(gray) / 255.0
+        else:
+            hits   = torch.empty_like(gray)
+            values = torch.empty_like(gray)
+            for i in range(n):
+                generator = torch.Generator(device=device).manual_seed(seed + start + i)
+                hits  [i] = torch.rand   (gray.shape[1:], generator=generator, device=device)
+                values[i] = torch.randint(0, 256, gray.shape[1:], generator=generator, device=device) / 255.0
+        gray = torch.where(hits < hit_p, values, gray)
+        
+        noise = kornia.filters.gaussian_blur2d(gray, (3, 3), (0.125, 0.125), border_type="replicate")
+        if supersample_factor > 1:
+            noise = F.interpolate(noise, size=(H, W), mode="bicubic", align_corners=False, antialias=True)
+        noise = F.conv2d(F.pad(noise, (1, 1, 1, 1), mode="replicate"), kernel).clamp(0, 1)
+        noise = noise.permute(0, 2, 3, 1)
+        
+        grain = x.clone()
+        grain[..., :3] = (rgb + intensity * (noise - rgb)).clamp(0, 1) * highlights
+        out.append(grain.clamp(0, 1).to(img))
+    
+    return torch.cat(out, dim=0)
+
+
+
 class Film_Grain: 
     def __init__(self):
         pass
@@ -318,6 +548,9 @@ class Film_Grain:
                 "highlights":         ("FLOAT", {"default": 1.0, "min": 0.01, "max": 255.0, "step": 0.01}),
                 "supersample_factor": ("INT",   {"default": 4, "min": 1, "max": 8, "step": 1}),
                 "repeats":            ("INT",   {"default": 1, "min": 1, "max": 1000, "step": 1})
+            },
+            "optional": {
+                "seed":               ("INT",   {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
             }
         }
     RETURN_TYPES = ("IMAGE",)
@@ -325,50 +558,12 @@ class Film_Grain:
 
     CATEGORY = "RES4LYF/images"
 
-    def main(self, image, density, intensity, highlights, supersample_factor, repeats=1):
+    def main(self, image, density, intensity, highlights, supersample_factor, repeats=1, seed=-1):
         image = image.repeat(repeats, 1, 1, 1)
-        return (self.apply_film_grain(image, density, intensity, highlights, supersample_factor), )
+        return (self.apply_film_grain(image, density, intensity, highlights, supersample_factor, seed), )
 
-    def apply_film_grain(self, img, density=0.1, intensity=1.0, highlights=1.0, supersample_factor=4):
-
-        img_batch = img.clone()
-        img_list = []
-        for i in range(img_batch.shape[0]):
-            img = img_batch[i].unsqueeze(0)
-            img = tensor2pil(img)
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
-            # apply grayscale noise with specified density/intensity/highlights to PIL image
-            img_gray = img.convert('L')
-            original_size = img.size
-            img_gray = img_gray.resize(
-                ((img.size[0] * supersample_factor), (img.size[1] * supersample_factor)), Image.Resampling(2))
-            num_pixels = int(density * img_gray.size[0] * img_gray.size[1])
-
-            img_gray_tensor = torch.from_numpy(np.array(img_gray).astype(np.float32) / 255.0).to(device)
-            img_gray_flat = img_gray_tensor.view(-1)
-            num_pixels = int(density * img_gray_flat.numel())
-            indices = torch.randint(0, img_gray_flat.numel(), (num_pixels,), device=img_gray_flat.device)
-            values = torch.randint(0, 256, (num_pixels,), device=img_gray_flat.device, dtype=torch.float32) / 255.0
-            
-            img_gray_flat[indices] = values
-            img_gray = img_gray_flat.view(img_gray_tensor.shape)
-            
-            img_gray_np = (img_gray.cpu().numpy() * 255).astype(np.uint8)
-            img_gray = Image.fromarray(img_gray_np)
-
-            img_noise = img_gray.convert('RGB')
-            img_noise = img_noise.filter(ImageFilter.GaussianBlur(radius=0.125))
-            img_noise = img_noise.resize(original_size, Image.Resampling(1))
-            img_noise = img_noise.filter(ImageFilter.EDGE_ENHANCE_MORE)
-            img_final = Image.blend(img, img_noise, intensity)
-            enhancer = ImageEnhance.Brightness(img_final)
-            img_highlights = enhancer.enhance(highlights)
-            
-            img_list.append(pil2tensor(img_highlights).squeeze(dim=0))
-            
-        img_highlights = torch.stack(img_list, dim=0)
-        return img_highlights
+    def apply_film_grain(self, img, density=0.1, intensity=1.0, highlights=1.0, supersample_factor=4, seed=-1):
+        return film_grain(img, density, intensity, highlights, supersample_factor, seed)
 
 
 
@@ -387,6 +582,9 @@ class Image_Grain_Add:
                 #"highlights": ("FLOAT", {"default": 1.0, "min": 0.01, "max": 255.0, "step": 0.01}),
                 #"supersample_factor": ("INT", {"default": 4, "min": 1, "max": 8, "step": 1}),
                 #"repeats": ("INT", {"default": 1, "min": 1, "max": 1000, "step": 1})
+            },
+            "optional": {
+                "seed": ("INT", {"default": -1, "min": -1, "max": 0xffffffffffffffff}),
             }
         }
     RETURN_TYPES = ("IMAGE",)
@@ -394,53 +592,15 @@ class Image_Grain_Add:
 
     CATEGORY = "RES4LYF/images"
 
-    def main(self, image, weight=0.5, density=1.0, intensity=1.0, highlights=1.0, supersample_factor=1.0, repeats=1):
+    def main(self, image, weight=0.5, density=1.0, intensity=1.0, highlights=1.0, supersample_factor=1, repeats=1, seed=-1):
         image = image.repeat(repeats, 1, 1, 1)
-        image_grain = self.apply_film_grain(image, density, intensity, highlights, supersample_factor)
+        image_grain = self.apply_film_grain(image, density, intensity, highlights, supersample_factor, seed)
         
         return (image + weight * (hard_light_blend(image_grain, image) - image), )
 
 
-    def apply_film_grain(self, img, density=0.1, intensity=1.0, highlights=1.0, supersample_factor=4):
-
-        img_batch = img.clone()
-        img_list = []
-        for i in range(img_batch.shape[0]):
-            img = img_batch[i].unsqueeze(0)
-            img = tensor2pil(img)
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        
-            # apply grayscale noise with specified density/intensity/highlights to PIL image
-            img_gray = img.convert('L')
-            original_size = img.size
-            img_gray = img_gray.resize(
-                ((img.size[0] * supersample_factor), (img.size[1] * supersample_factor)), Image.Resampling(2))
-            num_pixels = int(density * img_gray.size[0] * img_gray.size[1])
-
-            img_gray_tensor = torch.from_numpy(np.array(img_gray).astype(np.float32) / 255.0).to(device)
-            img_gray_flat = img_gray_tensor.view(-1)
-            num_pixels = int(density * img_gray_flat.numel())
-            indices = torch.randint(0, img_gray_flat.numel(), (num_pixels,), device=img_gray_flat.device)
-            values = torch.randint(0, 256, (num_pixels,), device=img_gray_flat.device, dtype=torch.float32) / 255.0
-            
-            img_gray_flat[indices] = values
-            img_gray = img_gray_flat.view(img_gray_tensor.shape)
-            
-            img_gray_np = (img_gray.cpu().numpy() * 255).astype(np.uint8)
-            img_gray = Image.fromarray(img_gray_np)
-
-            img_noise = img_gray.convert('RGB')
-            img_noise = img_noise.filter(ImageFilter.GaussianBlur(radius=0.125))
-            img_noise = img_noise.resize(original_size, Image.Resampling(1))
-            img_noise = img_noise.filter(ImageFilter.EDGE_ENHANCE_MORE)
-            img_final = Image.blend(img, img_noise, intensity)
-            enhancer = ImageEnhance.Brightness(img_final)
-            img_highlights = enhancer.enhance(highlights)
-            
-            img_list.append(pil2tensor(img_highlights).squeeze(dim=0))
-            
-        img_highlights = torch.stack(img_list, dim=0)
-        return img_highlights
+    def apply_film_grain(self, img, density=0.1, intensity=1.0, highlights=1.0, supersample_factor=4, seed=-1):
+        return film_grain(img, density, intensity, highlights, supersample_factor, seed)
 
 
 
@@ -468,13 +628,7 @@ class Frequency_Separation_Hard_Light:
 
     def main(self, high_pass=None, original=None, low_pass=None):
 
-        if high_pass is None:
-            high_pass = hard_light_freq_sep(original.to(torch.float64).to('cuda'), low_pass.to(torch.float64).to('cuda'))
-        
-        if original is None:
-            original = hard_light_blend(low_pass.to(torch.float64).to('cuda'), high_pass.to(torch.float64).to('cuda'))
-
-        return (high_pass, original, low_pass,)
+        return frequency_separation(high_pass, original, low_pass, method="hard")
 
 
 class Frequency_Separation_Hard_Light_LAB:
@@ -500,31 +654,7 @@ class Frequency_Separation_Hard_Light_LAB:
 
     def main(self, high_pass=None, original=None, low_pass=None):
 
-        if original is not None:
-            lab_original = rgb_to_lab(original.to(torch.float64).permute(0, 3, 1, 2))
-            lab_original_normalized = normalize_lab(lab_original)
-        
-        if low_pass is not None:
-            lab_low_pass = rgb_to_lab(low_pass.to(torch.float64).permute(0, 3, 1, 2))
-            lab_low_pass_normalized = normalize_lab(lab_low_pass)
-
-        if high_pass is not None:
-            lab_high_pass = rgb_to_lab(high_pass.to(torch.float64).permute(0, 3, 1, 2))
-            lab_high_pass_normalized = normalize_lab(lab_high_pass)
-
-        #original_l = lab_original_normalized[:, :1, :, :]  
-        #low_pass_l = lab_low_pass_normalized[:, :1, :, :]  
-
-        if high_pass is None:
-            lab_high_pass_normalized = hard_light_freq_sep(lab_original_normalized.permute(0, 2, 3, 1), lab_low_pass_normalized.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
-            lab_high_pass = denormalize_lab(lab_high_pass_normalized)
-            high_pass = lab_to_rgb(lab_high_pass).permute(0, 2, 3, 1)
-        if original is None:
-            lab_original_normalized = hard_light_blend(lab_low_pass_normalized.permute(0, 2, 3, 1), lab_high_pass_normalized.permute(0, 2, 3, 1)).permute(0, 3, 1, 2)
-            lab_original = denormalize_lab(lab_original_normalized)
-            original = lab_to_rgb(lab_original).permute(0, 2, 3, 1)
-
-        return (high_pass, original, low_pass)
+        return frequency_separation(high_pass, original, low_pass, method="hard", lab=True)
     
     
 class Frame_Select:
@@ -665,13 +795,7 @@ class Frequency_Separation_Vivid_Light:
 
     def main(self, high_pass=None, original=None, low_pass=None):
 
-        if high_pass is None:
-            high_pass = hard_light_freq_sep(low_pass.to(torch.float64), original.to(torch.float64))
-        
-        if original is None:
-            original = hard_light_blend(high_pass.to(torch.float64), low_pass.to(torch.float64))
-
-        return (high_pass, original, low_pass,)
+        return frequency_separation(high_pass, original, low_pass, method="vivid")
 
 
 class Frequency_Separation_Linear_Light:
@@ -697,13 +821,7 @@ class Frequency_Separation_Linear_Light:
 
     def main(self, high_pass=None, original=None, low_pass=None):
 
-        if high_pass is None:
-            high_pass = linear_light_freq_sep(original.to(torch.float64).to('cuda'), low_pass.to(torch.float64).to('cuda'))
-        
-        if original is None:
-            original = linear_light_blend(low_pass.to(torch.float64).to('cuda'), high_pass.to(torch.float64).to('cuda'))
-
-        return (high_pass, original, low_pass,)
+        return frequency_separation(high_pass, original, low_pass, method="linear")
 
 
 class Frequency_Separation_FFT:
@@ -732,7 +850,13 @@ class Frequency_Separation_FFT:
     def main(self, high_pass=None, original=None, low_pass=None, cutoff=5.0, sigma=5.0):
 
         if high_pass is None:
-            low_pass, high_pass = freq_sep_fft(original.to(torch.float64), cutoff=cutoff, sigma=sigma)
+            device = comfy.model_management.get_torch_device()
+            low_chunks, high_chunks = [], []
+            for (img,) in freq_sep_chunks(original):
+                lp, hp = freq_sep_fft(img.to(device, torch.float64), cutoff=cutoff, sigma=sigma)
+                low_chunks .append(lp.to(original))
+                high_chunks.append(hp.to(original))
+            low_pass, high_pass = torch.cat(low_chunks, dim=0), torch.cat(high_chunks, dim=0)
         
         if original is None:
             original = low_pass + high_pass
@@ -765,25 +889,18 @@ class ImageSharpenFS:
     CATEGORY     = "RES4LYF/images"
 
     def main(self, images, method, type, intensity):
-        match type:
-            case "median":
-                IB = ImageMedianBlur()
-            case "gaussian":
-                IB = ImageGaussianBlur()
-            
-        match method:
-            case "hard":
-                FS = Frequency_Separation_Hard_Light()
-            case "linear":
-                FS = Frequency_Separation_Linear_Light()
-                
-        img_lp = IB.main(images, intensity)
+        device       = comfy.model_management.get_torch_device()
+        split, merge = FREQ_SEP_METHODS[method]
         
-        fs_hp, fs_orig, fs_lp = FS.main(None, images, *img_lp)
+        # blur -> high pass -> blend the high pass back over the original, fused per chunk
+        img_sharpened = []
+        for (img,) in freq_sep_chunks(images):
+            img_lp = filter_images((img * 255).to(torch.uint8), type, intensity - 1, device=device) / 255
+            img    = img   .to(device, torch.float64)
+            img_lp = img_lp.to(device, torch.float64)
+            img_sharpened.append(merge(img, split(img, img_lp)).to(images))
         
-        _, img_sharpened, _ = FS.main(high_pass=fs_hp, original=None, low_pass=images)
-        
-        return (img_sharpened,)
+        return (torch.cat(img_sharpened, dim=0),)
 
 
     
@@ -813,7 +930,7 @@ class ImageMedianBlur:
         img = images.clone().detach()
         img = (img * 255).to(torch.uint8)
 
-        return ((cv2_layer(img, lambda x: cv2.medianBlur(x, size)) / 255),)
+        return ((filter_images(img, "median", size) / 255),)
 
 
 
@@ -841,12 +958,13 @@ class ImageGaussianBlur:
         img = images.clone().detach()
         img = (img * 255).to(torch.uint8)
 
-        return ((cv2_layer(img, lambda x: cv2.GaussianBlur(x, (size, size), 0)) / 255),)
+        return ((filter_images(img, "gaussian", size) / 255),)
 
 
 
-def fast_smudge_blur_comfyui(img, kernel_size=51):
-    img = img.to('cuda').float()
+def fast_smudge_blur_comfyui(img, kernel_size=51, device=None):
+    device = comfy.model_management.get_torch_device() if device is None else device
+    img = img.to(device).float()
 
     # (b, h, w, c) to (b, c, h, w)
     img = img.permute(0, 3, 1, 2)
@@ -885,7 +1003,7 @@ class FastSmudgeBlur:
     CATEGORY     = "RES4LYF/images"
 
     def main(self, images, kernel_size):
-        img = images.clone().detach().to('cuda').float()
+        img = images.clone().detach().to(comfy.model_management.get_torch_device()).float()
         
         # (b, h, w, c) to (b, c, h, w)
         img = img.permute(0, 3, 1, 2)
@@ -908,7 +1026,7 @@ class FastSmudgeBlur:
         # (b, c, h, w) to (b, h, w, c)
         blurred_img = blurred_img.permute(0, 2, 3, 1)
 
-        return (blurred_img,)
+        return (blurred_img.to(images.device),)
 
 
 
@@ -1140,35 +1258,28 @@ def read_swatch_colors(
     4. Sort the remaining by their first y-position (top→bottom).
     """
     H, W, _ = img.shape
-    flat = img.reshape(-1,3)
-    
-    # count all colors
-    colors, counts = np.unique(flat, axis=0, return_counts=True)
-    # build list of (color, count), skipping white
-    cc = [
-        (tuple(c.tolist()), cnt)
-        for c, cnt in zip(colors, counts)
-        if tuple(c.tolist()) != ignore
-    ]
-    if not cc:
+    flat = img.reshape(-1,3).astype(np.int64)
+
+    # count all colors on packed 0xRRGGBB keys (sorted like np.unique(axis=0))
+    keys = (flat[:,0] << 16) | (flat[:,1] << 8) | flat[:,2]
+    uniq, first_idx, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    # skip the ignored color
+    ignore_key = (int(ignore[0]) << 16) | (int(ignore[1]) << 8) | int(ignore[2])
+    if all(0 <= v <= 255 for v in ignore):
+        valid = uniq != ignore_key
+        uniq, first_idx, counts = uniq[valid], first_idx[valid], counts[valid]
+    if uniq.size == 0:
         return []
-    
-    # find largest band size
-    max_cnt = max(cnt for _,cnt in cc)
+
     # filter by relative size
-    kept = [c for c,cnt in cc if cnt >= max_cnt * min_fraction]
-    
-    # find first‐y for each kept color
-    first_y = {}
-    for color in kept:
-        # mask of where that color lives
-        mask = np.all(img == color, axis=-1)
-        ys, xs = np.nonzero(mask)
-        first_y[color] = int(np.min(ys))
-    
-    # sort top→bottom
-    kept.sort(key=lambda c: first_y[c])
-    return kept
+    kept     = counts >= counts.max() * min_fraction
+    uniq     = uniq     [kept]
+    first_y  = first_idx[kept] // W    # first occurrence in row-major order is the topmost one
+
+    # sort top→bottom (stable, so ties keep color order)
+    order = np.argsort(first_y, kind="stable")
+    return [(int(k >> 16) & 0xFF, int(k >> 8) & 0xFF, int(k) & 0xFF) for k in uniq[order]]
 
 
 
@@ -1206,12 +1317,17 @@ def build_masks_from_swatch(
     img = img.clip(0,255).astype(np.uint8)
 
     H, W, _ = img.shape
+    C       = len(swatch_colors)
+    if C == 0:
+        return []
 
-    # --- 2) bin into tol-sized buckets ---
-    binned = (img // tol) * tol  # still uint8
+    # --- 2) bin into tol-sized buckets, packed into one integer key per pixel ---
+    levels = 255 // tol + 1
+    q      = (img // tol).reshape(-1,3).astype(np.int64)            # (H*W)×3 bucket indices
+    keys   = (q[:,0] * levels + q[:,1]) * levels + q[:,2]          # (H*W,)
 
     # --- 3) painted region mask (non-black) ---
-    painted = np.any(img != 0, axis=2)  # H×W bool
+    painted = np.any(img != 0, axis=2).reshape(-1)                  # (H*W,) bool
 
     # --- snap swatch colors into same buckets ---
     snapped = np.array([
@@ -1219,34 +1335,44 @@ def build_masks_from_swatch(
         for c in swatch_colors
     ])  # C×3
 
-    claimed = np.zeros((H, W), dtype=bool)
-    masks   = []
+    # unique bucket keys + per-pixel index into them (dense lookup table when the key space is small)
+    n_keys = levels ** 3
+    if n_keys <= 1 << 22:
+        uniq   = np.flatnonzero(np.bincount(keys, minlength=n_keys))
+        lut    = np.empty(n_keys, dtype=np.int64)
+        lut[uniq] = np.arange(uniq.size)
+        inv    = lut[keys]
+    else:
+        uniq, inv = np.unique(keys, return_inverse=True)
+        inv    = inv.reshape(-1)
 
-    # --- 4) first-pass exact matches ---
-    for s in snapped:
-        m = (
-            (binned[:,:,0] == s[0]) &
-            (binned[:,:,1] == s[1]) &
-            (binned[:,:,2] == s[2])
-        )
-        m &= ~claimed
-        masks.append(torch.from_numpy(m))
-        claimed |= m
+    # --- 4) exact matches, first swatch wins ---
+    exact = np.full(uniq.size, -1, dtype=np.int64)
+    for i in range(C - 1, -1, -1):
+        s = snapped[i].astype(np.int64)
+        if np.any(s % tol):     # wrapped out of the bucket grid, cannot match exactly
+            continue
+        s_key = ((s[0] // tol) * levels + s[1] // tol) * levels + s[2] // tol
+        j = np.searchsorted(uniq, s_key)
+        if j < uniq.size and uniq[j] == s_key:
+            exact[j] = i
 
-    # --- 5) fill-in only within painted & unclaimed pixels ---
-    miss = painted & (~claimed)
-    if miss.any():
-        flat       = binned.reshape(-1,3).astype(int)  # (H*W)×3
-        flat_miss  = miss.reshape(-1)                 # (H*W,)
-        # squared RGB distances to each swatch: → (H*W)×C
-        d2         = np.sum((flat[:,None,:] - snapped[None,:,:])**2, axis=2)
-        nearest    = np.argmin(d2, axis=1)            # (H*W,)
+    # --- 5) nearest swatch for bucket colors without an exact match, in chunks ---
+    nearest  = exact.copy()
+    todo     = np.flatnonzero((exact < 0) & (np.bincount(inv, weights=painted, minlength=uniq.size) > 0))
+    if todo.size:
+        u_q      = np.stack([uniq[todo] // (levels*levels), (uniq[todo] // levels) % levels, uniq[todo] % levels], axis=1)
+        u_rgb    = u_q * tol                                        # binned color of each bucket
+        sw       = snapped.astype(np.int64)
+        chunk    = max(1, (1 << 22) // C)
+        for start in range(0, todo.size, chunk):
+            d2 = np.sum((u_rgb[start:start+chunk,None,:] - sw[None,:,:])**2, axis=2)
+            nearest[todo[start:start+chunk]] = np.argmin(d2, axis=1)
 
-        for i in range(len(masks)):
-            assign = (flat_miss & (nearest == i)).reshape(H, W)
-            masks[i] = masks[i] | torch.from_numpy(assign)
+    # single label map: exact match anywhere, nearest fill only within painted pixels
+    label = np.where(painted, nearest[inv], exact[inv]).reshape(H, W)
 
-    return masks
+    return [torch.from_numpy(label == i) for i in range(C)]
 
 
 
@@ -1254,7 +1380,33 @@ def build_masks_from_swatch(
 import numpy as np
 import torch
 from typing import List
-from collections import deque
+def _remove_small_components_batch(
+    masks: np.ndarray,
+    rel_thresh: float = 0.01
+) -> np.ndarray:
+    """
+    Remove connected components smaller than rel_thresh * max_component_size, per mask.
+    4-connectivity. masks: C×H×W bool -> C×H×W bool.
+    All masks are labeled in one pass: they are stacked vertically with a blank separator row, so no component
+    can span two masks.
+    """
+    C, H, W = masks.shape
+    stacked = np.zeros((C, H+1, W), dtype=np.uint8)
+    stacked[:, :H] = masks != 0
+
+    n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(stacked.reshape(C*(H+1), W), connectivity=4)
+    labels = labels.reshape(C, H+1, W)[:, :H]
+
+    sizes    = stats[:, cv2.CC_STAT_AREA].astype(np.float64)
+    owner    = stats[:, cv2.CC_STAT_TOP] // (H+1)    # which mask each component belongs to
+    sizes[0] = 0                                     # background
+
+    max_size = np.zeros(C, dtype=np.float64)
+    np.maximum.at(max_size, owner[1:], sizes[1:])
+
+    keep    = sizes >= max_size[owner] * rel_thresh
+    keep[0] = False
+    return keep[labels].astype(masks.dtype)
 
 def _remove_small_components(
     mask: np.ndarray,
@@ -1264,43 +1416,7 @@ def _remove_small_components(
     Remove connected components smaller than rel_thresh * max_component_size.
     4-connectivity.
     """
-    H, W = mask.shape
-    visited = np.zeros_like(mask, bool)
-    comps = []  # list of (size, pixels_list)
-
-    # 1) find all components
-    for y in range(H):
-        for x in range(W):
-            if mask[y,x] and not visited[y,x]:
-                q = deque([(y,x)])
-                visited[y,x] = True
-                pix = [(y,x)]
-                while q:
-                    cy,cx = q.popleft()
-                    for dy,dx in ((1,0),(-1,0),(0,1),(0,-1)):
-                        ny,nx = cy+dy, cx+dx
-                        if 0<=ny<H and 0<=nx<W and mask[ny,nx] and not visited[ny,nx]:
-                            visited[ny,nx] = True
-                            q.append((ny,nx))
-                            pix.append((ny,nx))
-                comps.append(pix)
-
-    if not comps:
-        return np.zeros_like(mask)
-
-    # 2) compute threshold
-    sizes = [len(c) for c in comps]
-    max_size = max(sizes)
-    min_size = max_size * rel_thresh
-
-    # 3) build a new mask keeping only large comps
-    out = np.zeros_like(mask)
-    for pix in comps:
-        if len(pix) >= min_size:
-            for (y,x) in pix:
-                out[y,x] = True
-
-    return out
+    return _remove_small_components_batch(mask[None], rel_thresh)[0]
 
 def cleanup_and_fill_masks(
     masks: List[torch.Tensor],
@@ -1314,9 +1430,8 @@ def cleanup_and_fill_masks(
     np_masks = np.stack([m.cpu().numpy() for m in masks], axis=0)
     C, H, W = np_masks.shape
 
-    # 1) component pruning
-    for c in range(C):
-        np_masks[c] = _remove_small_components(np_masks[c], rel_thresh)
+    # 1) component pruning, all masks in one labeling pass
+    np_masks = _remove_small_components_batch(np_masks, rel_thresh)
 
     # 2) figure out what’s still unclaimed
     claimed = np_masks.any(axis=0)  # H×W
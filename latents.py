@@ -616,7 +616,7 @@ def get_edge_mask_slug(mask: torch.Tensor, dilation: int = 3) -> torch.Tensor:
 def get_edge_mask(mask: torch.Tensor, dilation: int = 3) -> torch.Tensor:
     if dilation == 0:                                                         # safeguard for zero kernel size...
         return mask
-    mask_tmp = mask.squeeze().to('cuda')
+    mask_tmp = mask.squeeze()
     mask_tmp = mask_tmp.float()
     
     eroded = -F.max_pool2d(-mask_tmp.unsqueeze(0).unsqueeze(0), kernel_size=3, stride=1, padding=1)
@@ -632,6 +632,32 @@ def get_edge_mask(mask: torch.Tensor, dilation: int = 3) -> torch.Tensor:
 
 
 
+def get_edge_masks(masks: List[torch.Tensor], dilations: List[int]) -> List[torch.Tensor]:
+    """
+    Batched get_edge_mask(): all masks are eroded in one pass and dilated in one pass per distinct dilation, on the masks' own device.
+    Falls back to per-mask calls if the masks are not all 2D with the same shape.
+    """
+    masks_tmp = [mask.squeeze() for mask in masks]
+    if len(set(mask.shape for mask in masks_tmp)) != 1 or masks_tmp[0].ndim != 2:
+        return [get_edge_mask(mask, dilation) for mask, dilation in zip(masks, dilations)]
+    
+    h, w     = masks_tmp[0].shape
+    mask_tmp = torch.stack(masks_tmp).float().unsqueeze(1)                    # N,1,H,W
+    
+    eroded = -F.max_pool2d(-mask_tmp, kernel_size=3, stride=1, padding=1)
+    edge   = (mask_tmp - eroded > 0).float()
+    
+    edge_masks = list(masks)                                                  # dilation == 0 returns the mask, as with get_edge_mask()
+    for dilation in set(dilations) - {0}:
+        idx          = [i for i, d in enumerate(dilations) if d == dilation]
+        dilated_edge = F.max_pool2d(edge[idx], kernel_size=dilation, stride=1, padding=dilation//2)[..., :h, :w]
+        for i, dilated in zip(idx, dilated_edge):
+            edge_masks[i] = dilated.view_as(masks[i])
+    
+    return edge_masks
+
+
+
 def checkerboard_variable(widths, dtype=torch.float16, device='cpu'):
     total = sum(widths)
     mask = torch.zeros((total, total), dtype=dtype, device=device)
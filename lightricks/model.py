@@ -9,7 +9,7 @@ import math
 from typing import Dict, Optional, Tuple, List
 
 from .symmetric_patchifier import SymmetricPatchifier, latent_to_pixel_coords
-from ..helper  import ExtraOptions
+from ..helper  import ExtraOptions, get_module_pinv
 
 
 def get_timestep_embedding(
@@ -562,41 +562,11 @@ class ReLTXVModel(torch.nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or torch.norm(self.y0_adain_embed - y0_adain_embed) > 0:
-                    self.y0_adain_embed = y0_adain_embed
-                    
-                    f_s          = y0_adain_embed[0].clone()
-                    self.mu_s    = f_s.mean(dim=0, keepdim=True)
-                    f_s_centered = f_s - self.mu_s
-                    
-                    cov = (f_s_centered.T.double() @ f_s_centered.double()) / (f_s_centered.size(0) - 1)
-
-                    S_eig, U_eig = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    S_eig_sqrt    = S_eig.clamp(min=0).sqrt() # eigenvalues -> singular values
-                    
-                    whiten = U_eig @ torch.diag(S_eig_sqrt) @ U_eig.T
-                    self.y0_color  = whiten.to(f_s_centered)
-
-                for wct_i in range(eps.shape[0]):
-                    f_c          = denoised_embed[wct_i].clone()
-                    mu_c         = f_c.mean(dim=0, keepdim=True)
-                    f_c_centered = f_c - mu_c
-                    
-                    cov = (f_c_centered.T.double() @ f_c_centered.double()) / (f_c_centered.size(0) - 1)
-
-                    S_eig, U_eig  = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    inv_sqrt_eig  = S_eig.clamp(min=0).rsqrt() 
-                    
-                    whiten = U_eig @ torch.diag(inv_sqrt_eig) @ U_eig.T
-                    whiten = whiten.to(f_c_centered)
-
-                    f_c_whitened = f_c_centered @ whiten.T
-                    f_cs         = f_c_whitened @ self.y0_color.T + self.mu_s
-                    
-                    denoised_embed[wct_i] = f_cs
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
+                denoised_embed = self.StyleWCT.get(denoised_embed)
 
             
-            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ torch.linalg.pinv(W).T.to(denoised_embed)
+            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ get_module_pinv(self.patchify_proj, W.dtype, denoised_embed.device).T.to(denoised_embed)
             denoised_approx = denoised_approx.to(eps)
             
 
@@ -653,40 +623,10 @@ class ReLTXVModel(torch.nn.Module):
                     denoised_embed = adain_seq_inplace(denoised_embed, y0_adain_embed)
                     
             elif transformer_options['y0_style_method'] == "WCT":
-                if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or torch.norm(self.y0_adain_embed - y0_adain_embed) > 0:
-                    self.y0_adain_embed = y0_adain_embed
-                    
-                    f_s          = y0_adain_embed[0].clone()
-                    self.mu_s    = f_s.mean(dim=0, keepdim=True)
-                    f_s_centered = f_s - self.mu_s
-                    
-                    cov = (f_s_centered.T.double() @ f_s_centered.double()) / (f_s_centered.size(0) - 1)
-
-                    S_eig, U_eig = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    S_eig_sqrt    = S_eig.clamp(min=0).sqrt() # eigenvalues -> singular values
-                    
-                    whiten = U_eig @ torch.diag(S_eig_sqrt) @ U_eig.T
-                    self.y0_color  = whiten.to(f_s_centered)
-
-                for wct_i in range(eps.shape[0]):
-                    f_c          = denoised_embed[wct_i].clone()
-                    mu_c         = f_c.mean(dim=0, keepdim=True)
-                    f_c_centered = f_c - mu_c
-                    
-                    cov = (f_c_centered.T.double() @ f_c_centered.double()) / (f_c_centered.size(0) - 1)
-
-                    S_eig, U_eig  = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
-                    inv_sqrt_eig  = S_eig.clamp(min=0).rsqrt() 
-                    
-                    whiten = U_eig @ torch.diag(inv_sqrt_eig) @ U_eig.T
-                    whiten = whiten.to(f_c_centered)
-
-                    f_c_whitened = f_c_centered @ whiten.T
-                    f_cs         = f_c_whitened @ self.y0_color.T + self.mu_s
-                    
-                    denoised_embed[wct_i] = f_cs
+                self.StyleWCT.set(y0_adain_embed, use_newton_schulz=EO("wct_newton_schulz"))
+                denoised_embed = self.StyleWCT.get(denoised_embed)
 
-            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ torch.linalg.pinv(W).T.to(denoised_embed)
+            denoised_approx = (denoised_embed - b.to(denoised_embed)) @ get_module_pinv(self.patchify_proj, W.dtype, denoised_embed.device).T.to(denoised_embed)
             denoised_approx = denoised_approx.to(eps)
             
             #denoised_approx = rearrange(denoised_approx, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:,:,:h,:w]
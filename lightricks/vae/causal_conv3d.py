@@ -44,6 +44,8 @@ class CausalConv3d(nn.Module):
         )
 
     def forward(self, x, causal: bool = True):
+        if getattr(self, "stream", None) is not None:
+            return self.forward_stream(x, causal)
         if causal:
             first_frame_pad = x[:, :, :1, :, :].repeat(
                 (1, 1, self.time_kernel_size - 1, 1, 1)
@@ -60,6 +62,37 @@ class CausalConv3d(nn.Module):
         x = self.conv(x)
         return x
 
+    def forward_stream(self, x, causal: bool = True):
+        """Run on one temporal chunk of a longer clip. Frames still needed by the next chunk are carried in self.stream_buf,
+        so the concatenated outputs equal a single forward over the whole clip. The edge padding is applied only at the ends of the clip."""
+        pad_first = self.time_kernel_size - 1 if causal else (self.time_kernel_size - 1) // 2
+        pad_last  = 0                         if causal else (self.time_kernel_size - 1) // 2
+
+        if self.stream_buf is None:
+            if x.shape[2] == 0:
+                return self.empty_output(x)
+            x = torch.concatenate((x[:, :, :1, :, :].repeat((1, 1, pad_first, 1, 1)), x), dim=2)
+        else:
+            x = torch.concatenate((self.stream_buf, x), dim=2)
+        if self.stream["last"]:
+            x = torch.concatenate((x, x[:, :, -1:, :, :].repeat((1, 1, pad_last, 1, 1))), dim=2)
+
+        stride   = self.conv.stride[0]
+        kernel_t = self.conv.dilation[0] * (self.time_kernel_size - 1) + 1
+        frames   = (x.shape[2] - kernel_t) // stride + 1 if x.shape[2] >= kernel_t else 0
+
+        self.stream_buf = None if self.stream["last"] else x[:, :, frames * stride:, :, :]
+        if frames == 0:
+            return self.empty_output(x)
+        return self.conv(x[:, :, :(frames - 1) * stride + kernel_t, :, :])
+
+    def empty_output(self, x):
+        h, w = [
+            (x.shape[i] + 2 * self.conv.padding[i - 2] - self.conv.dilation[i - 2] * (self.conv.kernel_size[i - 2] - 1) - 1) // self.conv.stride[i - 2] + 1
+            for i in (3, 4)
+        ]
+        return x.new_empty((x.shape[0], self.out_channels, 0, h, w))
+
     @property
     def weight(self):
         return self.conv.weight
@@ -6,6 +6,8 @@ import math
 from einops import rearrange
 from typing import List, Optional, Tuple, Union
 from .conv_nd_factory import make_conv_nd, make_linear_nd
+from .causal_conv3d import CausalConv3d
+from .dual_conv3d import DualConv3d
 from .pixel_norm import PixelNorm
 from ..model import PixArtAlphaCombinedTimestepSizeEmbeddings
 import comfy.ops
@@ -606,10 +608,12 @@ class SpaceToDepthDownsample(nn.Module):
         )
 
     def forward(self, x, causal: bool = True):
-        if self.stride[0] == 2:
+        if self.stride[0] == 2 and getattr(self, "stream_first", True):
             x = torch.cat(
                 [x[:, :, :1, :, :], x], dim=2
             )  # duplicate first frames for padding
+            if getattr(self, "stream", None) is not None:
+                self.stream_first = False
 
         # skip connection
         x_in = rearrange(
@@ -665,10 +669,18 @@ class DepthToSpaceUpsample(nn.Module):
         self.out_channels_reduction_factor = out_channels_reduction_factor
 
     def forward(self, x, causal: bool = True, timestep: Optional[torch.Tensor] = None):
+        x_skip = x
+        x = self.conv(x, causal=causal)
+        drop_first = self.stride[0] == 2 and getattr(self, "stream_first", True)
+        if getattr(self, "stream", None) is not None:
+            x_skip = stream_align(self, x_skip, x.shape[2])
+            if x.shape[2] > 0:
+                self.stream_first = False
+        
         if self.residual:
             # Reshape and duplicate the input to match the output shape
             x_in = rearrange(
-                x,
+                x_skip,
                 "b (c p1 p2 p3) d h w -> b c (d p1) (h p2) (w p3)",
                 p1=self.stride[0],
                 p2=self.stride[1],
@@ -676,9 +688,8 @@ class DepthToSpaceUpsample(nn.Module):
             )
             num_repeat = math.prod(self.stride) // self.out_channels_reduction_factor
             x_in = x_in.repeat(1, num_repeat, 1, 1, 1)
-            if self.stride[0] == 2:
+            if drop_first:
                 x_in = x_in[:, :, 1:, :, :]
-        x = self.conv(x, causal=causal)
         x = rearrange(
             x,
             "b (c p1 p2 p3) d h w -> b c (d p1) (h p2) (w p3)",
@@ -686,7 +697,7 @@ class DepthToSpaceUpsample(nn.Module):
             p2=self.stride[1],
             p3=self.stride[2],
         )
-        if self.stride[0] == 2:
+        if drop_first:
             x = x[:, :, 1:, :, :]
         if self.residual:
             x = x + x_in
@@ -874,6 +885,11 @@ class ResnetBlock3D(nn.Module):
                 hidden_states, self.per_channel_scale2.to(device=hidden_states.device, dtype=hidden_states.dtype)
             )
 
+        if getattr(self, "stream", None) is not None:
+            input_tensor = stream_align(self, input_tensor, hidden_states.shape[2])
+            if hidden_states.shape[2] == 0:
+                return hidden_states
+
         input_tensor = self.norm3(input_tensor)
 
         batch_size = input_tensor.shape[0]
@@ -885,6 +901,24 @@ class ResnetBlock3D(nn.Module):
         return output_tensor
 
 
+def stream_align(module, x, frames):
+    """Streaming: hold back skip-path frames until the lagging main path (non-causal convs) has produced them."""
+    if module.stream_buf is not None:
+        x = torch.cat((module.stream_buf, x), dim=2)
+    module.stream_buf = x[:, :, frames:, :, :]
+    return x[:, :, :frames, :, :]
+
+
+def get_temporal_scale(module):
+    scale = 1
+    for m in module.modules():
+        if isinstance(m, (SpaceToDepthDownsample, DepthToSpaceUpsample)):
+            scale *= m.stride[0]
+        elif isinstance(m, CausalConv3d):
+            scale *= m.conv.stride[0]
+    return scale
+
+
 def patchify(x, patch_size_hw, patch_size_t=1):
     if patch_size_hw == 1 and patch_size_t == 1:
         return x
@@ -1078,6 +1112,73 @@ class VideoVAE(nn.Module):
             }
         return config
 
+    def set_stream(self, stream=None):
+        for m in self.modules():
+            if isinstance(m, (CausalConv3d, ResnetBlock3D, SpaceToDepthDownsample, DepthToSpaceUpsample)):
+                m.stream       = stream
+                m.stream_buf   = None
+                m.stream_first = True
+
+    def can_stream(self, module):
+        """Streaming is exact only with per-frame norms and CausalConv3d. GroupNorm statistics span the whole clip."""
+        return not any(isinstance(m, (nn.GroupNorm, DualConv3d)) for m in module.modules())
+
+    def run_stream(self, fn, x, chunks, out_frames, output_device=None):
+        stream = {"last": False}
+        self.set_stream(stream)
+        try:
+            out, t_pos = None, 0
+            for start, end in chunks:
+                stream["last"] = end == x.shape[2]
+                out_ = fn(x[:, :, start:end])
+                if out is None:
+                    device = out_.device if output_device is None else torch.device(output_device)
+                    pin    = device.type == "cpu" and out_.device.type == "cuda"
+                    out    = torch.empty((*out_.shape[:2], out_frames, *out_.shape[3:]), dtype=out_.dtype, device=device, pin_memory=pin)
+                out[:, :, t_pos:t_pos + out_.shape[2]] = out_.to(out.device, non_blocking=out.is_pinned())
+                t_pos += out_.shape[2]
+            if out.is_pinned():
+                torch.cuda.synchronize(x.device)
+        finally:
+            self.set_stream(None)
+        return out[:, :, :t_pos]
+
+    def encode_streaming(self, x, chunk_frames=32, output_device=None):
+        """encode() over temporal chunks with the causal conv state carried between them. Peak memory follows chunk_frames, not clip length."""
+        frames_count = x.shape[2]
+        if ((frames_count - 1) % 8) != 0:
+            raise ValueError("Invalid number of frames: Encode input must have 1 + 8 * x frames (e.g., 1, 9, 17, ...). Please check your input.")
+        if not self.can_stream(self.encoder):
+            return self.encode(x)
+        
+        scale        = get_temporal_scale(self.encoder)
+        chunk_frames = max(scale, chunk_frames // scale * scale)
+        chunks = [(0, min(frames_count, 1 + chunk_frames))]
+        chunks += [(t, min(frames_count, t + chunk_frames)) for t in range(chunks[0][1], frames_count, chunk_frames)]
+        
+        def encode_chunk(x_chunk):
+            means, logvar = torch.chunk(self.encoder(x_chunk), 2, dim=1)
+            return self.per_channel_statistics.normalize(means)
+        
+        return self.run_stream(encode_chunk, x, chunks, 1 + (frames_count - 1) // scale, output_device)
+
+    def decode_streaming(self, x, timestep=0.05, noise_scale=0.025, chunk_frames=4, output_device=None, seed=None):
+        """decode() over temporal latent chunks. Non-causal convs lag by their lookahead and catch up on the last chunk.
+        seed makes the timestep conditioning noise reproducible (drawn on the CPU, as ComfyUI does); None uses the global RNG."""
+        if self.timestep_conditioning:
+            if seed is None:
+                noise = torch.randn_like(x)
+            else:
+                noise = torch.randn(x.shape, generator=torch.Generator().manual_seed(seed), dtype=x.dtype).to(x.device)
+            x = noise * noise_scale + (1.0 - noise_scale) * x
+        x = self.per_channel_statistics.un_normalize(x)
+        if not self.can_stream(self.decoder):
+            return self.decoder(x, timestep=timestep)
+        
+        scale  = get_temporal_scale(self.decoder)
+        chunks = [(t, min(x.shape[2], t + chunk_frames)) for t in range(0, x.shape[2], chunk_frames)]
+        return self.run_stream(lambda x_chunk: self.decoder(x_chunk, timestep=timestep), x, chunks, 1 + (x.shape[2] - 1) * scale, output_device)
+
     def encode(self, x):
         frames_count = x.shape[2]
         if ((frames_count - 1) % 8) != 0:
@@ -81,11 +81,14 @@ async def log_message(request):
 original_calculate_sigmas = comfy.samplers.calculate_sigmas
 
 def calculate_sigmas_RES4LYF(model_sampling, scheduler_name, steps):
-    if scheduler_name == "beta57":
-        sigmas = comfy.samplers.beta_scheduler(model_sampling, steps, alpha=0.5, beta=0.7)
-    else:
+    from .helper import get_sigmas_cached   # helper imports this module
+    
+    def calculate():
+        if scheduler_name == "beta57":
+            return comfy.samplers.beta_scheduler(model_sampling, steps, alpha=0.5, beta=0.7)
         return original_calculate_sigmas(model_sampling, scheduler_name, steps)
-    return sigmas
+    
+    return get_sigmas_cached(model_sampling, ("calculate_sigmas", scheduler_name, steps), calculate)
 
 def init(check_imports=None):
     RESplain("Init")
@@ -817,10 +817,10 @@ class ReUNetModel(nn.Module):
                     if hasattr(transformer_options['AttnMask'], "mask_down2"):
                         mask_down2 = transformer_options['AttnMask'].mask_down2.to('cuda')
                     if weight == 0:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
+                        context = transformer_options['RegContext'].cast('context', context)
                         mask, mask_up, mask_down, mask_down2 = None, None, None, None
                     else:
-                        context = transformer_options['RegContext'].context.to(context.dtype).to(context.device)
+                        context = transformer_options['RegContext'].cast('context', context)
                     
                     txt_len = context.shape[1]
                     if mask_zero is None:
@@ -845,10 +845,10 @@ class ReUNetModel(nn.Module):
                     if hasattr(transformer_options['AttnMask_neg'], "mask_down2"):
                         mask_down2 = transformer_options['AttnMask_neg'].mask_down2.to('cuda')
                     if weight == 0:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
+                        context = transformer_options['RegContext_neg'].cast('context', context)
                         mask, mask_up, mask_down, mask_down2 = None, None, None, None
                     else:
-                        context = transformer_options['RegContext_neg'].context.to(context.dtype).to(context.device)
+                        context = transformer_options['RegContext_neg'].cast('context', context)
                         
                     txt_len = context.shape[1]
                     if mask_zero is None:
@@ -1206,7 +1206,6 @@ class ReUNetModel(nn.Module):
             y0_style_pos_mask = transformer_options.get("y0_style_pos_mask")
             y0_style_pos_mask_edge = transformer_options.get("y0_style_pos_mask_edge")
 
-            y0_style_pos = y0_style_pos.to(dtype)
             #x   = x.to(dtype)
             x   = x_orig.clone().to(torch.float64) * ((SIGMA ** 2 + 1) ** 0.5)
             eps = eps.to(dtype)
@@ -1216,7 +1215,7 @@ class ReUNetModel(nn.Module):
             denoised = x - sigma * eps
             
             denoised_embed = self.Retrojector.embed(denoised)     # 2,4,96,168 -> 2,16128,320
-            y0_adain_embed = self.Retrojector.embed(y0_style_pos)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_pos, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
@@ -1379,7 +1378,6 @@ class ReUNetModel(nn.Module):
             y0_style_neg_mask = transformer_options.get("y0_style_neg_mask")
             y0_style_neg_mask_edge = transformer_options.get("y0_style_neg_mask_edge")
             
-            y0_style_neg = y0_style_neg.to(dtype)
             #x   = x.to(dtype)
             x   = x_orig.clone().to(torch.float64) * ((SIGMA ** 2 + 1) ** 0.5)
             eps = eps.to(dtype)
@@ -1389,7 +1387,7 @@ class ReUNetModel(nn.Module):
             denoised = x - sigma * eps
 
             denoised_embed = self.Retrojector.embed(denoised)
-            y0_adain_embed = self.Retrojector.embed(y0_style_neg)
+            y0_adain_embed = self.Retrojector.embed_reference(y0_style_neg, dtype)
             
             if transformer_options['y0_style_method'] == "scattersort":
                 tile_h, tile_w = transformer_options.get('y0_style_tile_height'), transformer_options.get('y0_style_tile_width')
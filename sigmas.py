@@ -2,12 +2,13 @@ import torch
 import numpy as np
 from math import *
 import builtins
-from scipy.interpolate import CubicSpline
+from scipy.interpolate import CubicSpline, PchipInterpolator
 from scipy import special, stats
 import torch.nn.functional as F
 import torch.nn as nn
 import torch.optim as optim
 import math
+import copy
 
 
 from comfy.k_diffusion.sampling import get_sigmas_polyexponential, get_sigmas_karras
@@ -17,7 +18,7 @@ from torch import Tensor, nn
 from typing import Optional, Callable, Tuple, Dict, Any, Union, TYPE_CHECKING, TypeVar
 
 from .res4lyf import RESplain
-from .helper  import get_res4lyf_scheduler_list
+from .helper  import get_res4lyf_scheduler_list, tensor_hash, TensorCache, get_sigmas_cached
 
 
 def rescale_linear(input, input_min, input_max, output_min, output_max):
@@ -98,22 +99,30 @@ def train_interpolator(model, sigma_schedule, steps, epochs=5000, lr=0.01):
 
     return model
 
+SIGMA_INTERPOLATOR_CACHE = TensorCache(max_entries=32)   # (sigmas hash, target steps, mode) -> fitted schedule
+
 def interpolate_sigma_schedule_model(sigma_schedule, target_steps):
-    model = SimpleInterpolator()
     sigma_schedule = sigma_schedule.float().detach()
+    key = (tensor_hash(sigma_schedule), target_steps, "model")
+    
+    interpolated_sigma = SIGMA_INTERPOLATOR_CACHE.get(key)
+    if interpolated_sigma is None:
+        model = SimpleInterpolator()
 
-    # train on original sigma schedule
-    trained_model = train_interpolator(model, sigma_schedule, len(sigma_schedule))
+        # train on original sigma schedule
+        trained_model = train_interpolator(model, sigma_schedule, len(sigma_schedule))
 
-    # generate target steps for interpolation
-    x_interpolated = torch.linspace(0, 1, target_steps).unsqueeze(1)
+        # generate target steps for interpolation
+        x_interpolated = torch.linspace(0, 1, target_steps).unsqueeze(1)
 
-    # inference w/o gradients
-    trained_model.eval()
-    with torch.no_grad():
-        interpolated_sigma = trained_model(x_interpolated).squeeze()
+        # inference w/o gradients
+        trained_model.eval()
+        with torch.no_grad():
+            interpolated_sigma = trained_model(x_interpolated).squeeze()
+        
+        SIGMA_INTERPOLATOR_CACHE.set(key, interpolated_sigma)
 
-    return interpolated_sigma
+    return interpolated_sigma.clone()
 
 
 
@@ -128,7 +137,7 @@ class sigmas_interpolate:
             "required": {
                 "sigmas_0": ("SIGMAS", {"forceInput": True}),
                 "sigmas_1": ("SIGMAS", {"forceInput": True}),
-                "mode": (["linear", "nearest", "polynomial", "exponential", "power", "model"],),
+                "mode": (["linear", "nearest", "pchip", "polynomial", "exponential", "power", "model"],),
                 "order": ("INT", {"default": 8, "min": 1,"max": 64,"step": 1}),
             }
         }
@@ -160,6 +169,18 @@ class sigmas_interpolate:
         interpolated_sigma = torch.tensor(interpolated_sigma_np, device=sigma_schedule.device, dtype=sigma_schedule.dtype)
         return interpolated_sigma
 
+    def interpolate_sigma_schedule_pchip(self, sigma_schedule, target_steps):
+        sigma_schedule_np = sigma_schedule.cpu().to(torch.float64).numpy()
+
+        original_steps  = np.linspace(0, 1, len(sigma_schedule_np))
+        target_steps_np = np.linspace(0, 1, target_steps)
+
+        # monotone piecewise cubic (PCHIP): passes through every sigma and never overshoots, so a descending schedule stays descending
+        interpolated_sigma_np = PchipInterpolator(original_steps, sigma_schedule_np)(target_steps_np)
+
+        interpolated_sigma = torch.tensor(interpolated_sigma_np, device=sigma_schedule.device, dtype=sigma_schedule.dtype)
+        return interpolated_sigma
+
     def interpolate_sigma_schedule_constrained(self, sigma_schedule, target_steps):
         sigma_schedule_np = sigma_schedule.cpu().numpy()
 
@@ -250,6 +271,8 @@ class sigmas_interpolate:
             interpolate = self.interpolate_sigma_schedule_linear
         if   mode == "nearest": 
             interpolate = self.interpolate_nearest_neighbor
+        elif mode == "pchip":
+            interpolate = self.interpolate_sigma_schedule_pchip
         elif mode == "polynomial":
             interpolate = self.interpolate_sigma_schedule_poly
         elif mode == "exponential":
@@ -1389,6 +1412,15 @@ extra_schedulers = {
 
 
 
+def get_shifted_model_sampling(model_sampling, shift):
+    # shallow copy with its own buffer dicts: set_parameters() re-registers the shifted sigma table on the copy only, no deepcopy of the module
+    model_sampling_shifted = copy.copy(model_sampling)
+    model_sampling_shifted._buffers    = model_sampling._buffers   .copy()
+    model_sampling_shifted._parameters = model_sampling._parameters.copy()
+    model_sampling_shifted._modules    = model_sampling._modules   .copy()
+    model_sampling_shifted.set_parameters(shift=shift)
+    return model_sampling_shifted
+
 def get_sigmas(model, scheduler, steps, denoise, shift=0.0, lq_inflection_percent=0.5, lq_threshold_noise=0.025): #adapted from comfyui
     total_steps = steps
     if denoise < 1.0:
@@ -1407,19 +1439,20 @@ def get_sigmas(model, scheduler, steps, denoise, shift=0.0, lq_inflection_percen
             raise Exception("get_sigmas: Could not get model_sampling")
 
     if shift > 1e-6:
-        import copy
-        model_sampling = copy.deepcopy(model_sampling)
-        model_sampling.set_parameters(shift=shift)
+        model_sampling = get_shifted_model_sampling(model_sampling, shift)
         RESplain("model_sampling shift manually set to " + str(shift), debug=True)
     
-    if scheduler == "beta57":
-        sigmas = comfy.samplers.beta_scheduler(model_sampling, total_steps, alpha=0.5, beta=0.7).cpu()
-    elif scheduler == "linear_quadratic":
-        linear_steps = int(total_steps * lq_inflection_percent)
-        sigmas = comfy.samplers.linear_quadratic_schedule(model_sampling, total_steps, threshold_noise=lq_threshold_noise, linear_steps=linear_steps).cpu()
-    else:
-        sigmas = comfy.samplers.calculate_sigmas(model_sampling, scheduler, total_steps).cpu()
+    def calculate():
+        if scheduler == "beta57":
+            return comfy.samplers.beta_scheduler(model_sampling, total_steps, alpha=0.5, beta=0.7).cpu()
+        elif scheduler == "linear_quadratic":
+            linear_steps = int(total_steps * lq_inflection_percent)
+            return comfy.samplers.linear_quadratic_schedule(model_sampling, total_steps, threshold_noise=lq_threshold_noise, linear_steps=linear_steps).cpu()
+        else:
+            return comfy.samplers.calculate_sigmas(model_sampling, scheduler, total_steps).cpu()
     
+    # keyed on the (shifted) sigma table, so shift is part of the key
+    sigmas = get_sigmas_cached(model_sampling, ("get_sigmas", scheduler, total_steps, lq_inflection_percent, lq_threshold_noise), calculate)
     sigmas = sigmas[-(steps + 1):]
     return sigmas
 
@@ -8,10 +8,13 @@ from typing import Optional, Callable, Tuple, Dict, List, Any, Union
 import einops 
 from einops import rearrange
 import copy
+import math
+import weakref
 import comfy
 
 
 from .latents import gaussian_blur_2d, median_blur_2d
+from .helper  import get_pinv_cached, get_module_pinv, TensorCache
 
 # WIP... not yet in use...
 class StyleTransfer:  
@@ -115,7 +118,7 @@ class StyleTransfer:
     def invert_linear(self, x : torch.Tensor,) -> torch.Tensor:
         x = x.to(self.pinv_dtype)
         #x = (x - self.B.to(self.dtype)) @ torch.linalg.pinv(self.W.to(self.pinv_dtype)).T.to(self.dtype)
-        x = (x - self.B) @ torch.linalg.pinv(self.W).T
+        x = (x - self.B) @ get_module_pinv(self.embedder_method, self.pinv_dtype, x.device).T
         
         return x.to(self.dtype)
 
@@ -133,8 +136,7 @@ class StyleTransfer:
         b = conv.bias.view(1, C_out, 1, 1).to(z)
         z_nobias = z - b
 
-        W_flat = conv.weight.view(C_out, -1).to(z)  
-        W_pinv = torch.linalg.pinv(W_flat)    
+        W_pinv = get_module_pinv(conv, z.dtype, z.device)
 
         Bz, Co, Hp, Wp = z_nobias.shape
         z_flat = z_nobias.reshape(Bz, Co, -1)  
@@ -194,8 +196,7 @@ class StyleTransfer:
         w3 = conv.weight         # [C_out, C_in, 1, pH, pW]
         w2 = w3.squeeze(2)                       # [C_out, C_in, pH, pW]
         out_ch, in_ch, kH, kW = w2.shape
-        W_flat = w2.view(out_ch, -1)            # [C_out, in_ch*pH*pW]
-        W_pinv = torch.linalg.pinv(W_flat)      # [in_ch*pH*pW, C_out]
+        W_pinv = get_module_pinv(conv, z.dtype, z.device)             # [in_ch*pH*pW, C_out]
 
         # merge depth for 2D unfold wackiness
         z2 = z_nobias.permute(0,2,1,3,4).reshape(B*Dp, C_out, Hp, Wp)
@@ -234,34 +235,68 @@ class StyleTransfer:
 
 
 class StyleWCT:  
-    def __init__(self, dtype=torch.float64, use_svd=False,):
-        self.dtype          = dtype
-        self.use_svd        = use_svd
-        self.y0_adain_embed = None
-        self.mu_s           = None
-        self.y0_color       = None
-        self.spatial_shape  = None
+    def __init__(self, dtype=torch.float64, use_svd=False, use_newton_schulz=False, ns_iters=24, ns_tol=1e-3):
+        self.dtype             = dtype
+        self.use_svd           = use_svd
+        self.use_newton_schulz = use_newton_schulz   # float32 iterative inverse sqrt for the content side, avoids float64 eigh per step
+        self.ns_iters          = ns_iters
+        self.ns_tol            = ns_tol              # max RMS residual of Z cov Z - I before falling back to eigh
+        self.y0_adain_embed    = None
+        self.mu_s              = None
+        self.y0_color          = None
+        self.spatial_shape     = None
+        
+    def covariance(self, f_centered: torch.Tensor, dtype=torch.float64):
+        """Batched channel covariance of [..., N, C] features, with the usual 1e-5 ridge. -> [..., C, C]"""
+        f_centered = f_centered.to(dtype)
+        cov = (f_centered.mT @ f_centered) / (f_centered.size(-2) - 1)
+        return cov + 1e-5 * torch.eye(cov.size(-1), dtype=cov.dtype, device=cov.device)
+        
+    def newton_schulz_inv_sqrt(self, cov: torch.Tensor):
+        """Coupled Newton-Schulz iteration for cov^-1/2 on [..., C, C], in float32 (matmuls only, GPU friendly).
+        Returns (cov^-1/2, RMS residual of Z cov Z - I per matrix). Ill-conditioned covariances may not converge in ns_iters."""
+        cov  = cov.float()
+        I    = torch.eye(cov.size(-1), dtype=cov.dtype, device=cov.device).expand_as(cov)
+        norm = cov.norm(dim=(-2,-1), keepdim=True)
+        Y0   = cov / norm
+        Y    = Y0
+        Z    = I.clone()
+        for _ in range(self.ns_iters):
+            T = 0.5 * (3.0 * I - Z @ Y)
+            Y = Y @ T
+            Z = T @ Z
+        residual = (Z @ Y0 @ Z - I).norm(dim=(-2,-1)) / cov.size(-1) ** 0.5
+        return Z / norm.sqrt(), residual
         
     def whiten(self, f_s_centered: torch.Tensor, set=False):
-        cov = (f_s_centered.T.double() @ f_s_centered.double()) / (f_s_centered.size(0) - 1)
+        """Whitening (cov^-1/2) or, if set, coloring (cov^1/2) transform of [..., N, C] features. Batched over leading dims."""
+        if self.use_newton_schulz and not set:
+            whiten, residual = self.newton_schulz_inv_sqrt(self.covariance(f_s_centered, torch.float32))
+            if (residual <= self.ns_tol).all():
+                return whiten.to(f_s_centered)
+            # not converged (ill-conditioned covariance): fall through to the exact decomposition
+        
+        cov = self.covariance(f_s_centered)
 
         if self.use_svd:
-            U_svd, S_svd, Vh_svd = torch.linalg.svd(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
+            U_svd, S_svd, Vh_svd = torch.linalg.svd(cov)
             S_eig = S_svd
             U_eig = U_svd
         else:
-            S_eig, U_eig = torch.linalg.eigh(cov + 1e-5 * torch.eye(cov.size(0), dtype=cov.dtype, device=cov.device))
+            S_eig, U_eig = torch.linalg.eigh(cov)
         
         if set:
             S_eig_root = S_eig.clamp(min=0).sqrt() # eigenvalues -> singular values
         else:
             S_eig_root = S_eig.clamp(min=0).rsqrt() # inverse square root
         
-        whiten = U_eig @ torch.diag(S_eig_root) @ U_eig.T
+        whiten = (U_eig * S_eig_root.unsqueeze(-2)) @ U_eig.mT
         return whiten.to(f_s_centered)
 
-    def set(self, y0_adain_embed: torch.Tensor, spatial_shape=None):
-        if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or torch.norm(self.y0_adain_embed - y0_adain_embed) > 0:
+    def set(self, y0_adain_embed: torch.Tensor, spatial_shape=None, use_newton_schulz=None):
+        if use_newton_schulz is not None:
+            self.use_newton_schulz = bool(use_newton_schulz)
+        if self.y0_adain_embed is None or self.y0_adain_embed.shape != y0_adain_embed.shape or not torch.equal(self.y0_adain_embed, y0_adain_embed):
             self.y0_adain_embed = y0_adain_embed.clone()
             if spatial_shape is not None:
                 self.spatial_shape = spatial_shape
@@ -270,21 +305,18 @@ class StyleWCT:
             self.mu_s    = f_s.mean(dim=0, keepdim=True)
             f_s_centered = f_s - self.mu_s
             
-            self.y0_color = self.whiten(f_s_centered, set=True)
+            self.y0_color = self.whiten(f_s_centered, set=True)   # style side is cached until the reference changes
             
     def get(self, denoised_embed: torch.Tensor):
-        for wct_i in range(denoised_embed.shape[0]):
-            f_c          = denoised_embed[wct_i]
-            mu_c         = f_c.mean(dim=0, keepdim=True)
-            f_c_centered = f_c - mu_c
+        mu_c         = denoised_embed.mean(dim=-2, keepdim=True)
+        f_c_centered = denoised_embed - mu_c
 
-            whiten = self.whiten(f_c_centered)
-
-            f_c_whitened = f_c_centered @ whiten.T
-            f_cs         = f_c_whitened @ self.y0_color.T + self.mu_s
-            
-            denoised_embed[wct_i] = f_cs
-            
+        whiten = self.whiten(f_c_centered)                         # [B, C, C], all items in one batched decomposition
+        
+        transfer = whiten.mT @ self.y0_color.T.to(whiten)           # fold whiten + color so the N x C features are multiplied once
+        f_cs     = f_c_centered @ transfer + self.mu_s
+        
+        denoised_embed.copy_(f_cs)
         return denoised_embed
 
 
@@ -414,6 +446,8 @@ class StyleFeatures:
 
 
 
+RETROJECTORS = weakref.WeakSet()    # live Retrojectors, so clear_style_reference_caches() can reach their reference caches
+
 class Retrojector:  
     def __init__(self, proj=None, patch_size=2, pinv_dtype=torch.float64, dtype=torch.float64, ENDO=False):
         self.proj       = proj
@@ -425,36 +459,65 @@ class Retrojector:
         self.CONV2D     = isinstance(proj, nn.Conv2d)
         self.CONV3D     = isinstance(proj, nn.Conv3d)
         self.ENDO       = ENDO
-        self.W          = proj.weight.data.to(dtype=pinv_dtype).cuda()
+        self.W          = proj.weight.data.to(dtype=pinv_dtype)   # cast before anything hashes it (float8 weights)
+        self.W_inv      = None
         
         if self.LINEAR:
-            self.W_inv = torch.linalg.pinv(self.W.cuda())
+            self.W_inv = get_pinv_cached(self.W, pinv_dtype)
         elif self.CONV2D:
             C_out, _, kH, kW = proj.weight.shape
-            W_flat = proj.weight.view(C_out, -1).to(dtype=pinv_dtype)
-            self.W_inv = torch.linalg.pinv(W_flat.cuda())
+            self.W_inv = get_pinv_cached(self.W.view(C_out, -1), pinv_dtype)
         
         if proj.bias is None:
             if self.LINEAR:
                 bias_size = proj.out_features
             else:
                 bias_size = proj.out_channels
-            self.b = torch.zeros(bias_size, dtype=pinv_dtype, device=self.W_inv.device)
+            self.b = torch.zeros(bias_size, dtype=pinv_dtype, device=self.W.device)
         else:
-            self.b = proj.bias.data.to(dtype=pinv_dtype).to(self.W_inv.device)
+            self.b = proj.bias.data.to(dtype=pinv_dtype).to(self.W.device)
+        
+        self.device_weights = {}    # device -> (W, W_inv, b), so embed/unembed run where the latent is
+        
+        self.reference_cache = []   # [(input key, input, embedding)] for fixed style references, most recent last
+        RETROJECTORS.add(self)
+        
+    def get_weights(self, device):
+        """(W, W_inv, b) on device. The pinv is computed wherever the weights were; the copies are moved once per device."""
+        device = torch.device(device)
+        if device not in self.device_weights:
+            self.device_weights[device] = tuple(None if t is None else t.to(device) for t in (self.W, self.W_inv, self.b))
+        return self.device_weights[device]
+        
+    def embed_reference(self, img: torch.Tensor, dtype=None, max_entries=4):
+        """embed(img.to(dtype)) for style reference latents, which are fixed for the whole sampling run. Pass the sampler's
+        tensor uncast: the embedding is reused while img is the same tensor (storage pointer, shape, strides; the entry keeps
+        img alive, so the pointer cannot be reused), across cond/uncond, substeps and steps. No version counter: references
+        are inference tensors. Cleared per run by clear_style_reference_caches(). Treat the result as read-only."""
+        key = (img.data_ptr(), tuple(img.shape), img.stride(), img.dtype, img.device, dtype)
+        for ref_key, ref, ref_embed in self.reference_cache:
+            if ref_key == key:
+                self.h = img.shape[-2] // self.patch_size
+                self.w = img.shape[-1] // self.patch_size
+                return ref_embed
+        
+        img_embed = self.embed(img if dtype is None else img.to(dtype))
+        self.reference_cache = [entry for entry in self.reference_cache if entry[0] != key][-(max_entries-1):] + [(key, img, img_embed)]
+        return img_embed
         
     def embed(self, img: torch.Tensor):
         self.h = img.shape[-2] // self.patch_size
         self.w = img.shape[-1] // self.patch_size
         
         img = comfy.ldm.common_dit.pad_to_patch_size(img, (self.patch_size, self.patch_size))
+        W, W_inv, b = self.get_weights(img.device)
         
         if   self.CONV2D:
             self.orig_shape = img.shape  # for unembed
             img_embed = F.conv2d(
-                img.to(self.W), 
-                weight=self.W, 
-                bias=self.b, 
+                img.to(W), 
+                weight=W, 
+                bias=b, 
                 stride=self.proj.stride, 
                 padding=self.proj.padding
             )
@@ -465,9 +528,9 @@ class Retrojector:
             if img.ndim == 4:
                 img = rearrange(img, "b c (h ph) (w pw) -> b (h w) (c ph pw)", ph=self.patch_size, pw=self.patch_size) 
             if self.ENDO:
-                img_embed = F.linear(img.to(self.b) - self.b, self.W_inv)
+                img_embed = F.linear(img.to(b) - b, W_inv)
             else:
-                img_embed = F.linear(img.to(self.W), self.W, self.b)
+                img_embed = F.linear(img.to(W), W, b)
         
         return img_embed.to(img)
     
@@ -478,10 +541,11 @@ class Retrojector:
             img = self.invert_conv2d(img_embed)
         
         elif self.LINEAR:
+            W, W_inv, b = self.get_weights(img_embed.device)
             if self.ENDO:
-                img = F.linear(img_embed.to(self.W), self.W, self.b)
+                img = F.linear(img_embed.to(W), W, b)
             else:
-                img = F.linear(img_embed.to(self.b) - self.b, self.W_inv)
+                img = F.linear(img_embed.to(b) - b, W_inv)
             if img.ndim == 3:
                 img = rearrange(img, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=self.h, w=self.w, ph=self.patch_size, pw=self.patch_size)
         
@@ -506,7 +570,7 @@ class Retrojector:
         Bz, Co, Hp, Wp = z_nobias.shape
         z_flat = z_nobias.reshape(Bz, Co, -1)  
 
-        x_patches = self.W_inv @ z_flat   
+        x_patches = self.get_weights(z.device)[1] @ z_flat   
 
         x_sum = F.fold(
             x_patches,
@@ -557,8 +621,7 @@ class Retrojector:
         w3 = self.patch_embedding.weight         # [C_out, C_in, 1, pH, pW]
         w2 = w3.squeeze(2)                       # [C_out, C_in, pH, pW]
         out_ch, in_ch, kH, kW = w2.shape
-        W_flat = w2.view(out_ch, -1)            # [C_out, in_ch*pH*pW]
-        W_pinv = torch.linalg.pinv(W_flat)      # [in_ch*pH*pW, C_out]
+        W_pinv = get_module_pinv(self.patch_embedding, z.dtype, z.device)   # [in_ch*pH*pW, C_out]
 
         # merge depth for 2D unfold wackiness
         z2 = z_nobias.permute(0,2,1,3,4).reshape(B*Dp, C_out, Hp, Wp)
@@ -603,8 +666,7 @@ def invert_conv2d(
     else:
         z_nobias = z
 
-    W_flat = conv.weight.view(C_out, -1).to(z)  
-    W_pinv = torch.linalg.pinv(W_flat)    
+    W_pinv = get_module_pinv(conv, z.dtype, z.device)
 
     Bz, Co, Hp, Wp = z_nobias.shape
     z_flat = z_nobias.reshape(Bz, Co, -1)  
@@ -653,6 +715,39 @@ def adain_seq(content: torch.Tensor, style: torch.Tensor, eps: float = 1e-7) ->
 
 
 
+SCATTERSORT_REF_CACHE = TensorCache(max_entries=4)    # pos/neg reference x plain/low-pass; cleared per sampler run
+
+def get_sorted_reference(y: torch.Tensor, source: torch.Tensor, key, dim=-2):
+    """y.sort(dim).values for a y derived from the style reference source, reused across cond/uncond, substeps and steps for
+    as long as source is the same tensor. The entry keeps source alive, so its storage pointer identifies it (views of the
+    same reference embedding hit too; no compare or sync per call). No version counter: references are inference tensors."""
+    key    = (key, tuple(y.shape), dim, source.data_ptr(), tuple(source.shape), source.stride(), source.dtype, source.device)
+    cached = SCATTERSORT_REF_CACHE.get(key)
+    if cached is not None:
+        return cached[1]
+    
+    ref_sorted = y.sort(dim=dim)[0]
+    SCATTERSORT_REF_CACHE.set(key, (source, ref_sorted))
+    return ref_sorted
+
+def clear_style_reference_caches():
+    """Called by the sampler at the start and end of a run, so cached style references never outlive it."""
+    SCATTERSORT_REF_CACHE.clear()
+    for retrojector in list(RETROJECTORS):
+        retrojector.reference_cache = []
+
+def unfold_tiles(x: torch.Tensor, tile_h: int, tile_w: int, pad: int = 0) -> torch.Tensor:
+    """(B, C, H+2*pad, W+2*pad) -> (B, C, nH, nW, (tile_h+2*pad) * (tile_w+2*pad)) copy of the (overlapping) tiles, for one batched sort."""
+    B, C = x.shape[:2]
+    tiles = x.unfold(2, tile_h + 2*pad, tile_h).unfold(3, tile_w + 2*pad, tile_w)
+    return tiles.reshape(B, C, tiles.shape[2], tiles.shape[3], -1)
+
+def fold_tiles(tiles: torch.Tensor, tile_h: int, tile_w: int, pad: int = 0) -> torch.Tensor:
+    """Inverse of unfold_tiles for the tile interiors: (B, C, nH, nW, L) -> (B, C, nH*tile_h, nW*tile_w)"""
+    B, C, nH, nW, _ = tiles.shape
+    tiles = tiles.view(B, C, nH, nW, tile_h + 2*pad, tile_w + 2*pad)[..., pad:pad+tile_h, pad:pad+tile_w]
+    return tiles.permute(0, 1, 2, 4, 3, 5).reshape(B, C, nH * tile_h, nW * tile_w)
+
 def apply_scattersort_tiled(
     denoised_spatial : torch.Tensor, 
     y0_adain_spatial : torch.Tensor, 
@@ -677,29 +772,16 @@ def apply_scattersort_tiled(
     denoised_padded = F.pad(denoised_spatial, (pad, pad, pad, pad), mode='reflect')
     y0_padded       = F.pad(y0_adain_spatial, (pad, pad, pad, pad), mode='reflect')
 
-    denoised_padded_out = denoised_padded.clone()
-    _, _, h_len, w_len = denoised_spatial.shape
+    tiles      = unfold_tiles(denoised_padded, tile_h, tile_w, pad)      # all tiles sorted at once
+    ref_sorted = get_sorted_reference(unfold_tiles(y0_padded, tile_h, tile_w, pad), y0_adain_spatial, ("apply_scattersort_tiled", tile_h, tile_w, pad), dim=-1)
 
-    for ix in range(pad, h_len, tile_h):
-        for jx in range(pad, w_len, tile_w):
-            tile    = denoised_padded[:, :, ix - pad:ix + tile_h + pad, jx - pad:jx + tile_w + pad]
-            y0_tile = y0_padded[:, :, ix - pad:ix + tile_h + pad, jx - pad:jx + tile_w + pad]
-
-            tile    = rearrange(tile,    "b c h w -> b c (h w)", h=tile_h + pad * 2, w=tile_w + pad * 2)
-            y0_tile = rearrange(y0_tile, "b c h w -> b c (h w)", h=tile_h + pad * 2, w=tile_w + pad * 2)
-
-            src_sorted, src_idx =    tile.sort(dim=-1)
-            ref_sorted, ref_idx = y0_tile.sort(dim=-1)
-
-            new_tile = tile.scatter(dim=-1, index=src_idx, src=ref_sorted.expand(src_sorted.shape))
-            new_tile = rearrange(new_tile, "b c (h w) -> b c h w", h=tile_h + pad * 2, w=tile_w + pad * 2)
-
-            denoised_padded_out[:, :, ix:ix + tile_h, jx:jx + tile_w] = (
-                new_tile if pad == 0 else new_tile[:, :, pad:-pad, pad:-pad]
-            )
-
-    denoised_padded_out = denoised_padded_out if pad == 0 else denoised_padded_out[:, :, pad:-pad, pad:-pad]
-    return denoised_padded_out
+    src_idx  = tiles.argsort(dim=-1)
+    tiles    = tiles.scatter(dim=-1, index=src_idx, src=ref_sorted.expand(src_idx.shape))
+    
+    out       = denoised_spatial.clone()
+    out_tiled = fold_tiles(tiles, tile_h, tile_w, pad)
+    out[..., :out_tiled.shape[-2], :out_tiled.shape[-1]] = out_tiled
+    return out
 
 
 
@@ -841,181 +923,156 @@ def apply_adain_spatial(
 
 
 
-def adain_patchwise(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
-    # this one is really slow
-    B, C, H, W = content.shape
-    device     = content.device
-    dtype      = content.dtype
-
+def get_patchwise_kernel_size(sigma, kernel_size=None):
     if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * sigma) + 1)
+        kernel_size = int(2 * math.ceil(3 * abs(sigma)) + 1)
     if kernel_size % 2 == 0:
         kernel_size += 1
+    return kernel_size
 
-    pad    = kernel_size // 2
-    coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-    gauss  = torch.exp(-0.5 * (coords / sigma) ** 2)
-    gauss /= gauss.sum()
-    kernel_2d = (gauss[:, None] * gauss[None, :]).to(dtype=dtype)
 
-    weight = kernel_2d.view(1, 1, kernel_size, kernel_size)
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded   = F.pad(style,   (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    for i in range(H):
-        for j in range(W):
-            c_patch = content_padded[:, :, i:i + kernel_size, j:j + kernel_size]
-            s_patch =   style_padded[:, :, i:i + kernel_size, j:j + kernel_size]
-            w = weight.expand_as(c_patch)
-
-            c_mean =  (c_patch              * w).sum(dim=(-1, -2), keepdim=True)
-            c_std  = ((c_patch - c_mean)**2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-            s_mean =  (s_patch              * w).sum(dim=(-1, -2), keepdim=True)
-            s_std  = ((s_patch - s_mean)**2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-            normed =  (c_patch[:, :, pad:pad+1, pad:pad+1] - c_mean) / c_std
-            stylized = normed * s_std + s_mean
-            result[:, :, i, j] = stylized.squeeze(-1).squeeze(-1)
-
-    return result
-
-
-def adain_patchwise_row_batch(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
-
-    B, C, H, W = content.shape
-    device, dtype = content.device, content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * sigma) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad = kernel_size // 2
-    coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
+def get_gaussian_kernel_1d(sigma, kernel_size, dtype, device):
+    """Normalized 1D gaussian taps. sigma may be a float -> [k], or a tensor of per-position sigmas [H,W] -> [H,W,k]."""
+    coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - kernel_size // 2
+    if isinstance(sigma, torch.Tensor):
+        sigma = sigma.to(device=device, dtype=torch.float64).unsqueeze(-1)
     gauss = torch.exp(-0.5 * (coords / sigma) ** 2)
-    gauss = (gauss / gauss.sum()).to(dtype)
-    kernel_2d = (gauss[:, None] * gauss[None, :])
+    return (gauss / gauss.sum(dim=-1, keepdim=True)).to(dtype)
 
-    weight = kernel_2d.view(1, 1, kernel_size, kernel_size)
 
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded = F.pad(style, (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
+def local_gaussian_stats(x: torch.Tensor, gauss: torch.Tensor, eps: float = 1e-5):
+    """Gaussian weighted local mean and std of x [B,C,H,W] over reflect padded k x k windows.
+    gauss [k]: one kernel for the whole map, first and second moments via a single separable depthwise conv.
+    gauss [H,W,k]: a kernel per position, accumulated over the k*k window offsets on the whole map at once."""
+    B, C, H, W = x.shape
+    k   = gauss.shape[-1]
+    pad = k // 2
+    x_pad = F.pad(x, (pad, pad, pad, pad), mode='reflect')
+    
+    if gauss.ndim == 1:
+        moments = torch.cat([x_pad, x_pad * x_pad], dim=1)
+        moments = F.conv2d(moments, gauss.view(1, 1, 1, k).expand(2*C, 1, 1, k), groups=2*C)
+        moments = F.conv2d(moments, gauss.view(1, 1, k, 1).expand(2*C, 1, k, 1), groups=2*C)
+        mean, mean_sq = moments.chunk(2, dim=1)
+    else:
+        mean    = torch.zeros_like(x)
+        mean_sq = torch.zeros_like(x)
+        for u in range(k):
+            for v in range(k):
+                w     = gauss[..., u] * gauss[..., v]         # [H,W]
+                patch = x_pad[..., u:u+H, v:v+W]
+                mean    += w * patch
+                mean_sq += w * patch * patch
+    
+    std = (mean_sq - mean * mean).clamp(min=0).sqrt() + eps
+    return mean, std
 
-    for i in range(H):
-        c_row_patches = torch.stack([
-            content_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            for j in range(W)
-        ], dim=0)  # [W, B, C, k, k]
 
-        s_row_patches = torch.stack([
-            style_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            for j in range(W)
-        ], dim=0)
+def local_median_stats(x: torch.Tensor, kernel_size: int, eps: float = 1e-5, mad=False, max_bytes=2**28):
+    """Local median (and optionally mean absolute deviation from it) of x [B,C,H,W] over reflect padded k x k windows.
+    Patches are unfolded a band of rows at a time so the k*k copy stays under max_bytes."""
+    B, C, H, W = x.shape
+    pad   = kernel_size // 2
+    x_pad = F.pad(x, (pad, pad, pad, pad), mode='reflect')
+    
+    median = torch.empty_like(x)
+    dev    = torch.empty_like(x) if mad else None
+    rows   = max(1, max_bytes // max(1, B * C * W * kernel_size * kernel_size * x.element_size()))
+    for r0 in range(0, H, rows):
+        r1      = min(H, r0 + rows)
+        patches = x_pad[:, :, r0:r1+2*pad].unfold(2, kernel_size, 1).unfold(3, kernel_size, 1).reshape(B, C, r1-r0, W, -1)
+        median[:, :, r0:r1] = patches.median(dim=-1).values
+        if mad:
+            dev[:, :, r0:r1] = (patches - median[:, :, r0:r1, :, None]).abs().mean(dim=-1) + eps
+    return median, dev
+
+
+def get_patchwise_mask_scaling(mask: torch.Tensor, kernel_size: int):
+    """Soft edge weight from a mask: 0 on mask boundaries, 1 in flat regions. [B,1,H,W]"""
+    pad = kernel_size // 2
+    with torch.no_grad():
+        padded_mask    = F.pad(mask.float(), (pad, pad, pad, pad), mode="reflect")
+        blurred_mask   = F.avg_pool2d(padded_mask, kernel_size=kernel_size, stride=1, padding=pad)
+        blurred_mask   = blurred_mask[..., pad:-pad, pad:-pad]
+        edge_proximity = blurred_mask * (1.0 - blurred_mask)
+        return 1.0 - (edge_proximity / 0.25).clamp(0.0, 1.0)
+
+
+def adain_patchwise_local(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5, mask: torch.Tensor = None, use_median_blur: bool = False, lowpass_weight=1.0, highpass_weight=1.0, median_norm=False) -> torch.Tensor:
+    """Per pixel AdaIN against local k x k window statistics, computed over the whole map at once.
+    Gaussian mode matches each pixel's local mean/std to the style's. Median mode swaps the local median (lowpass) and keeps
+    the residual (highpass), or with median_norm normalizes the residual by the local mean absolute deviation.
+    A mask narrows the gaussian near mask edges and fades the transfer out there."""
+    B, C, H, W  = content.shape
+    dtype       = content.dtype
+    stat_dtype  = torch.promote_types(dtype, torch.float32)
+    kernel_size = get_patchwise_kernel_size(sigma, kernel_size)
+    
+    content = content.to(stat_dtype)
+    style   = style  .to(stat_dtype)
+    
+    scaling = None
+    if mask is not None:
+        scaling = get_patchwise_mask_scaling(mask, kernel_size).to(stat_dtype)
 
-        w = weight.expand_as(c_row_patches[0])
+    if use_median_blur:
+        c_median, c_dev = local_median_stats(content, kernel_size, eps, mad=median_norm)
+        s_median, s_dev = local_median_stats(style,   kernel_size, eps, mad=median_norm)
+        if median_norm:
+            stylized = (content - c_median) / c_dev * s_dev + s_median
+        else:
+            stylized = lowpass_weight * s_median + (content - c_median) * highpass_weight
+    else:
+        if scaling is None:
+            sig = max(sigma + eps, 1e-3)
+        else:
+            sig = (sigma * scaling[0, 0] + eps).clamp(min=1e-3)    # per position sigma, narrower near mask edges
+        gauss = get_gaussian_kernel_1d(sig, kernel_size, stat_dtype, content.device)
+        
+        c_mean, c_std = local_gaussian_stats(content, gauss, eps)
+        s_mean, s_std = local_gaussian_stats(style,   gauss, eps)
+        stylized = (content - c_mean) / c_std * s_std + s_mean
+    
+    if scaling is not None:
+        stylized = content * (1 - scaling) + stylized * scaling
 
-        c_mean = (c_row_patches * w).sum(dim=(-1, -2), keepdim=True)
-        c_std  = ((c_row_patches - c_mean) ** 2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-        s_mean = (s_row_patches * w).sum(dim=(-1, -2), keepdim=True)
-        s_std  = ((s_row_patches - s_mean) ** 2 * w).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
+    return stylized.to(dtype)
 
-        center = kernel_size // 2
-        central = c_row_patches[:, :, :, center:center+1, center:center+1]
-        normed = (central - c_mean) / c_std
-        stylized = normed * s_std + s_mean
 
-        result[:, :, i, :] = stylized.squeeze(-1).squeeze(-1).permute(1, 2, 0)  # [B,C,W]
+def adain_patchwise(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
+    return adain_patchwise_local(content, style, sigma=sigma, kernel_size=kernel_size, eps=eps)
 
-    return result
 
+def adain_patchwise_row_batch(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5) -> torch.Tensor:
+    return adain_patchwise_local(content, style, sigma=sigma, kernel_size=kernel_size, eps=eps)
 
 
 def adain_patchwise_row_batch_med(content: torch.Tensor, style: torch.Tensor, sigma: float = 1.0, kernel_size: int = None, eps: float = 1e-5, mask: torch.Tensor = None, use_median_blur: bool = False, lowpass_weight=1.0, highpass_weight=1.0) -> torch.Tensor:
-    B, C, H, W = content.shape
-    device, dtype = content.device, content.dtype
-
-    if kernel_size is None:
-        kernel_size = int(2 * math.ceil(3 * abs(sigma)) + 1)
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    pad = kernel_size // 2
-
-    content_padded = F.pad(content, (pad, pad, pad, pad), mode='reflect')
-    style_padded = F.pad(style, (pad, pad, pad, pad), mode='reflect')
-    result = torch.zeros_like(content)
-
-    scaling = torch.ones((B, 1, H, W), device=device, dtype=dtype)
-    sigma_scale = torch.ones((H, W), device=device, dtype=torch.float32)
-    if mask is not None:
-        with torch.no_grad():
-            padded_mask = F.pad(mask.float(), (pad, pad, pad, pad), mode="reflect")
-            blurred_mask = F.avg_pool2d(padded_mask, kernel_size=kernel_size, stride=1, padding=pad)
-            blurred_mask = blurred_mask[..., pad:-pad, pad:-pad]
-            edge_proximity = blurred_mask * (1.0 - blurred_mask)
-            scaling = 1.0 - (edge_proximity / 0.25).clamp(0.0, 1.0)
-            sigma_scale = scaling[0, 0]  # assuming single-channel mask broadcasted across B, C
-
-    if not use_median_blur:
-        coords = torch.arange(kernel_size, dtype=torch.float64, device=device) - pad
-        base_gauss = torch.exp(-0.5 * (coords / sigma) ** 2)
-        base_gauss = (base_gauss / base_gauss.sum()).to(dtype)
-        gaussian_table = {}
-        for s in sigma_scale.unique():
-            sig = float((sigma * s + eps).clamp(min=1e-3))
-            gauss_local = torch.exp(-0.5 * (coords / sig) ** 2)
-            gauss_local = (gauss_local / gauss_local.sum()).to(dtype)
-            kernel_2d = gauss_local[:, None] * gauss_local[None, :]
-            gaussian_table[s.item()] = kernel_2d
-
-    for i in range(H):
-        row_result = torch.zeros(B, C, W, dtype=dtype, device=device)
-        for j in range(W):
-            c_patch = content_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-            s_patch = style_padded[:, :, i:i+kernel_size, j:j+kernel_size]
-
-            if use_median_blur:
-                # Median blur with residual restoration
-                unfolded_c = c_patch.reshape(B, C, -1)
-                unfolded_s = s_patch.reshape(B, C, -1)
-
-                c_median = unfolded_c.median(dim=-1, keepdim=True).values
-                s_median = unfolded_s.median(dim=-1, keepdim=True).values
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center, center].view(B, C, 1)
-                residual = central - c_median
-                stylized = lowpass_weight * s_median + residual * highpass_weight
-            else:
-                k = gaussian_table[float(sigma_scale[i, j].item())]
-                local_weight = k.view(1, 1, kernel_size, kernel_size).expand(B, C, kernel_size, kernel_size)
-
-                c_mean = (c_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                c_std = ((c_patch - c_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-                s_mean = (s_patch * local_weight).sum(dim=(-1, -2), keepdim=True)
-                s_std = ((s_patch - s_mean) ** 2 * local_weight).sum(dim=(-1, -2), keepdim=True).sqrt() + eps
-
-                center = kernel_size // 2
-                central = c_patch[:, :, center:center+1, center:center+1]
-                normed = (central - c_mean) / c_std
-                stylized = normed * s_std + s_mean
-
-            local_scaling = scaling[:, :, i, j].view(B, 1, 1)
-            stylized = central * (1 - local_scaling) + stylized * local_scaling
+    return adain_patchwise_local(content, style, sigma=sigma, kernel_size=kernel_size, eps=eps, mask=mask, use_median_blur=use_median_blur, lowpass_weight=lowpass_weight, highpass_weight=highpass_weight)
 
-            row_result[:, :, j] = stylized.squeeze(-1)
-        result[:, :, i, :] = row_result
 
-    return result
 
 
 
 
 
+WEIGHTED_MIX_SLOTS_CACHE = TensorCache(max_entries=64)
 
+def get_weighted_mix_slots(length, ratios, offset=0, device=None):
+    """Source index for each of length positions, interleaving len(ratios) sources in proportion to ratios.
+    Source j's k-th position falls where its running share ratio_j * n crosses k + 0.5, so every prefix stays within
+    about one position of its quota. Positions are counted from offset."""
+    key = (length, tuple(float(r) for r in ratios), offset, device)
+    if key in WEIGHTED_MIX_SLOTS_CACHE:
+        return WEIGHTED_MIX_SLOTS_CACHE.get(key)
+    
+    ratios  = torch.tensor(ratios, dtype=torch.float64)
+    n_total = length + offset
+    k       = torch.arange(n_total, dtype=torch.float64)
+    events  = (k[None, :] + 0.5) / ratios[:, None].clamp(min=1e-12)     # [n_src, n_total] crossing times, ties go to the lower source index
+    source  = torch.arange(len(ratios)).repeat_interleave(n_total)
+    slots   = source[events.flatten().argsort(stable=True)[:n_total]][offset:]
+    return WEIGHTED_MIX_SLOTS_CACHE.set(key, slots.to(device))
 
 def weighted_mix_n(tensor_list, weight_list, dim=-1, offset=0):
     assert all(t.shape == tensor_list[0].shape for t in tensor_list)
@@ -1024,35 +1081,16 @@ def weighted_mix_n(tensor_list, weight_list, dim=-1, offset=0):
     total_weight = sum(weight_list)
     ratios = [w / total_weight for w in weight_list]
 
+    dim    = dim % tensor_list[0].dim()
     length = tensor_list[0].shape[dim]
-    idx = torch.arange(length)
-
-    # Create a bin index tensor based on weighted slots
-    float_bins = (idx + offset) * len(ratios) / length
-    bin_idx = torch.floor(float_bins).long() % len(ratios)
-
-    # Allocate slots based on ratio using a cyclic pattern
-    counters = [0.0 for _ in ratios]
-    slots = torch.empty_like(idx)
-
-    for i in range(length):
-        # Assign to the group that's most under-allocated
-        expected = [r * (i + 1) for r in ratios]
-        errors = [expected[j] - counters[j] for j in range(len(ratios))]
-        k = max(range(len(errors)), key=lambda j: errors[j])
-        slots[i] = k
-        counters[k] += 1
-
-    # Create mask for each tensor
-    out = tensor_list[0].clone()
-    for i, tensor in enumerate(tensor_list):
-        mask = slots == i
-        while mask.dim() < tensor.dim():
-            mask = mask.unsqueeze(0)
-        mask = mask.expand_as(tensor)
-        out = torch.where(mask, tensor, out)
+    slots  = get_weighted_mix_slots(length, ratios, offset, tensor_list[0].device)
     
-    return out
+    shape = [1] * (tensor_list[0].dim() + 1)
+    shape[dim + 1] = length
+    
+    stacked = torch.stack(tensor_list, dim=0)
+    index   = slots.view(shape).expand(1, *tensor_list[0].shape)
+    return stacked.gather(0, index).squeeze(0)
 
 
 
@@ -1265,7 +1303,7 @@ class Stylizer:
         if weights_all_one and methods_all_scattersort and len(weight_list) > 1 and masks_all_none:
             buf = Stylizer.buffer
             buf['src_idx']   = x[0:1].argsort(dim=-2)
-            buf['ref_sorted'], buf['ref_idx'] = x[1:].reshape(1, -1, x.shape[-1]).sort(dim=-2)
+            buf['ref_sorted'] = x[1:].reshape(1, -1, x.shape[-1]).sort(dim=-2)[0]
             buf['src'] = buf['ref_sorted'][:,::len(weight_list)].expand_as(buf['src_idx'])    #            interleave_stride = len(weight_list)
             
             x[0:1] = x[0:1].scatter_(dim=-2, index=buf['src_idx'], src=buf['src'],)
@@ -1444,8 +1482,8 @@ class Stylizer:
     @staticmethod
     def scattersort_(x, y, slc=slice(None)):
         buf = Stylizer.buffer
-        buf['src_idx']                    = x.argsort(dim=-2)
-        buf['ref_sorted'], buf['ref_idx'] = y   .sort(dim=-2)
+        buf['src_idx']    = x.argsort(dim=-2)
+        buf['ref_sorted'] = y.sort(dim=-2)[0]
 
         return x.scatter_(dim=-2, index=buf['src_idx'][...,slc,:], src=buf['ref_sorted'][...,slc,:].expand_as(buf['src_idx'][...,slc,:]))
     
@@ -1469,14 +1507,8 @@ class Stylizer:
         return x
     
     def scattersort(self, x, idx=1, slc=slice(None)):
-        if x.shape[0] != 2:
-            x[0:1] = Stylizer.scattersort_(x[0:1], x[idx:idx+1], slc)
-            return x
-        
-        buf = Stylizer.buffer
-        buf['sorted'], buf['idx'] = x.sort(dim=-2)
-
-        return x.scatter_(dim=-2, index=buf['idx'][0:1][...,slc,:], src=buf['sorted'][1:2][...,slc,:].expand_as(buf['idx'][0:1][...,slc,:]))
+        x[0:1] = Stylizer.scattersort_(x[0:1], x[idx:idx+1], slc)
+        return x
     
 
     
@@ -1490,25 +1522,19 @@ class Stylizer:
         #w_tile = self.w_tile[idx-1] if w_tile is None else w_tile
         
         C = x.shape[-1]
+        h_tile, w_tile = self.h_tile[idx-1], self.w_tile[idx-1]
         den   = x[0:1]      [:,self.img_slice,:].reshape(-1, C, self.h_len, self.w_len)
         style = x[idx:idx+1][:,self.img_slice,:].reshape(-1, C, self.h_len, self.w_len)
         
-        tiles     = Stylizer.get_tiles_as_strided(den,   self.h_tile[idx-1], self.w_tile[idx-1])
-        ref_tile  = Stylizer.get_tiles_as_strided(style, self.h_tile[idx-1], self.w_tile[idx-1])
+        tiles      = Stylizer.get_tiles_as_strided(den, h_tile, w_tile)                      # (B, C, nH, nW, tile_h, tile_w) view into x
+        tiles_flat = tiles.flatten(-2, -1)                                                   # copy, one batched sort over every tile
+        ref_sorted = Stylizer.get_tiles_as_strided(style, h_tile, w_tile).flatten(-2, -1).sort(dim=-1)[0]
 
-        # rearrange for vmap to run on (nH, nW) ( as outer axes)
-        tiles_v    = tiles   .permute(2, 3, 0, 1, 4, 5) # (nH, nW, B, C, tile_h, tile_w)
-        ref_tile_v = ref_tile.permute(2, 3, 0, 1, 4, 5) # (nH, nW, B, C, tile_h, tile_w)
-
-        # vmap over spatial dimms (nH, nW)... num of tiles high, num tiles wide
-        vmap2   = torch.vmap(torch.vmap(Stylizer.apply_scattersort_per_tile, in_dims=0), in_dims=0)
-        result  = vmap2(tiles_v, ref_tile_v)  # (nH, nW, B, C, tile_h, tile_w)
-
-        # --> (B, C, nH, nW, tile_h, tile_w)
-        result = result.permute(2, 3, 0, 1, 4, 5)  #( B, C, nH, nW, tile_h, tile_w)
+        src_idx = tiles_flat.argsort(dim=-1)
+        result  = tiles_flat.scatter_(dim=-1, index=src_idx, src=ref_sorted.expand_as(src_idx))
 
         # in-place copy, werx if result has same shape/strides as tiles... overwrites same mem location "content" is using
-        tiles.copy_(result)
+        tiles.copy_(result.view_as(tiles))
 
         return x
     
@@ -1958,7 +1984,7 @@ class Style_Model(Stylizer):
         if weights_all_one and methods_all_scattersort and len(weight_list) > 1 and masks_all_none:
             buf = Stylizer.buffer
             buf['src_idx']   = x[0:1].argsort(dim=-2)
-            buf['ref_sorted'], buf['ref_idx'] = x[1:].reshape(1, -1, x.shape[-1]).sort(dim=-2)
+            buf['ref_sorted'] = x[1:].reshape(1, -1, x.shape[-1]).sort(dim=-2)[0]
             buf['src'] = buf['ref_sorted'][:,::len(weight_list)].expand_as(buf['src_idx'])    #            interleave_stride = len(weight_list)
             
             x[0:1] = x[0:1].scatter_(dim=-2, index=buf['src_idx'], src=buf['src'],)
@@ -2112,7 +2138,7 @@ class Style_Model(Stylizer):
             return denoised
         y0_style = self.guides if y0_style is None else y0_style
         
-        y0_style_embed = self.Retrojector.embed(y0_style)
+        y0_style_embed = self.Retrojector.embed_reference(y0_style)
         denoised_embed = self.Retrojector.embed(denoised)
         B,HW,C = y0_style_embed.shape
         embed  = torch.cat([denoised_embed, y0_style_embed.view(1,B*HW,C)[:,::B,:]], dim=0)
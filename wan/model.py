@@ -16,7 +16,7 @@ import comfy.ldm.common_dit
 import comfy.model_management
 
 from ..latents import interpolate_spd
-from ..helper  import ExtraOptions
+from ..helper  import ExtraOptions, TensorCache
 
 
 def sinusoidal_embedding_1d(dim, position):
@@ -100,6 +100,50 @@ def attention_weights(q, k):
 
 
 
+FRAME_WINDOW_CACHE = TensorCache(max_entries=16)
+
+def get_frame_windows(total_frames, window_size, window_type="standard"):
+    """Sliding key/value frame windows, with consecutive query frames that share a window merged.
+    Returns [(q_frame_start, q_frame_end, [(kv_frame_start, kv_frame_end), ...]), ...] with the windows as runs of contiguous frames."""
+    key = (total_frames, window_size, window_type)
+    if key in FRAME_WINDOW_CACHE:
+        return FRAME_WINDOW_CACHE.get(key)
+    
+    half_window = window_size // 2
+    groups = []
+    for center in range(total_frames):
+        if window_type == "standard":
+            start = max(0, center - half_window)
+            end   = min(total_frames, center + half_window + 1)
+            # Shift window if it would be too short
+            if end - start < window_size:
+                if start == 0:
+                    end = min(total_frames, start + window_size)
+                elif end == total_frames:
+                    start = max(0, end - window_size)
+
+            window_indices = list(range(start, end))
+        elif window_type == "circular":
+            window_indices = [(center + offset) % total_frames for offset in range(-half_window, half_window + 1)]
+        else:
+            raise ValueError(f"Unknown sliding window type: {window_type}")
+        
+        runs = []
+        for frame in window_indices:
+            if runs and runs[-1][1] == frame:
+                runs[-1] = (runs[-1][0], frame + 1)
+            else:
+                runs.append((frame, frame + 1))
+        
+        if groups and groups[-1][2] == runs:
+            groups[-1] = (groups[-1][0], center + 1, runs)
+        else:
+            groups.append((center, center + 1, runs))
+    
+    return FRAME_WINDOW_CACHE.set(key, groups)
+
+
+
 
 
 class ReWanSlidingSelfAttention(nn.Module):
@@ -153,46 +197,24 @@ class ReWanSlidingSelfAttention(nn.Module):
         img_len = grid_sizes[1] * grid_sizes[2]
         total_frames = int(q.shape[1] // img_len)
 
-        window_size = self.winderz
-        half_window = window_size // 2
-
         q_ = q.view(b, s, n * d)
         k_ = k.view(b, s, n * d)
         x_list = []
 
-        for i in range(total_frames):
-            q_start =  i      * img_len
-            q_end   = (i + 1) * img_len
-
-            # circular frame indices for key/value window
-            center = i
-            #window_indices = [(center + offset) % total_frames for offset in range(-half_window, half_window + 1)]
-            if self.winderz_type == "standard":
-                start = max(0, center - half_window)
-                end   = min(total_frames, center + half_window + 1)
-                # Shift window if it would be too short
-                if end - start < window_size:
-                    if start == 0:
-                        end = min(total_frames, start + window_size)
-                    elif end == total_frames:
-                        start = max(0, end - window_size)
-
-                window_indices = list(range(start, end))
-            elif self.winderz_type == "circular":
-                window_indices = [(center + offset) % total_frames for offset in range(-half_window, half_window + 1)]
-            
-            # frame indices to token indices
-            token_indices = []
-            for frame in window_indices:
-                start = frame * img_len
-                token_indices.extend(range(start, start + img_len))
-
-            token_indices = torch.tensor(token_indices, device=q.device)
+        # one call per distinct window: frames sharing a window share the call, and windows are slices of k/v unless they wrap around
+        for q_frame_start, q_frame_end, kv_runs in get_frame_windows(total_frames, self.winderz, self.winderz_type):
+            kv_slices = [slice(kv_start * img_len, kv_end * img_len) for kv_start, kv_end in kv_runs]
+            if len(kv_slices) == 1:
+                k_window = k_[:, kv_slices[0], :]
+                v_window = v [:, kv_slices[0], :]
+            else:
+                k_window = torch.cat([k_[:, kv_slice, :] for kv_slice in kv_slices], dim=1)
+                v_window = torch.cat([v [:, kv_slice, :] for kv_slice in kv_slices], dim=1)
 
             x = optimized_attention(
-                q_[:, q_start:q_end, :],           # [B, img_len, C]
-                k_.index_select(1, token_indices), # [B, window_size * img_len, C]
-                v .index_select(1, token_indices),
+                q_[:, q_frame_start * img_len : q_frame_end * img_len, :],     # [B, frames * img_len, C]
+                k_window,                                                       # [B, window_size * img_len, C]
+                v_window,
                 heads=self.num_heads,
             )
 
@@ -223,55 +245,14 @@ class ReWanT2VSlidingCrossAttention(ReWanSlidingSelfAttention):
         img_len = grid_sizes[1] * grid_sizes[2]
         total_frames = int(q.shape[1] // img_len)
 
-        window_size = self.winderz
-        half_window = window_size // 2
-        
-        b, s, n, d = *x.shape[:2], self.num_heads, self.head_dim
-        q_, k_ = q, k
-        #q_ = q.view(b, s, n * d)
-        #k_ = k.view(b, s, n * d)
-        x_list = []
-
-        for i in range(total_frames):
-            q_start =  i      * img_len
-            q_end   = (i + 1) * img_len
-
-            # circular frame indices for key/value window
-            center = i
-            #window_indices = [(center + offset) % total_frames for offset in range(-half_window, half_window + 1)]
-            if self.winderz_type == "standard":
-                start = max(0, center - half_window)
-                end   = min(total_frames, center + half_window + 1)
-                # Shift window if it would be too short
-                if end - start < window_size:
-                    if start == 0:
-                        end = min(total_frames, start + window_size)
-                    elif end == total_frames:
-                        start = max(0, end - window_size)
-
-                window_indices = list(range(start, end))
-            elif self.winderz_type == "circular":
-                window_indices = [(center + offset) % total_frames for offset in range(-half_window, half_window + 1)]
-            
-            # frame indices to token indices
-            token_indices = []
-            for frame in window_indices:
-                start = frame * img_len
-                token_indices.extend(range(start, start + img_len))
-
-            token_indices = torch.tensor(token_indices, device=q.device)
-
-            x = optimized_attention(
-                q_[:, q_start:q_end, :],           # [B, img_len, C]
-                k_, #.index_select(1, token_indices), # [B, window_size * img_len, C]
-                v , #.index_select(1, token_indices),
-                heads=self.num_heads,
-            )
-
-            x_list.append(x)
-
-        x = torch.cat(x_list, dim=1)
-        del x_list, q, k, v, q_, k_
+        # every frame attends to the full context, so the per-frame loop collapses into a single call
+        x = optimized_attention(
+            q[:, :total_frames * img_len, :],   # [B, total_frames * img_len, C]
+            k,
+            v,
+            heads=self.num_heads,
+        )
+        del q, k, v
 
         x = self.o(x)
         return x
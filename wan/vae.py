@@ -467,6 +467,28 @@ def count_conv3d(model):
     return count
 
 
+def get_tile_starts(length, tile_size, tile_overlap):
+    if length <= tile_size:
+        return [0]
+    stride = max(1, tile_size - tile_overlap)
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def get_tile_ramp(size, ramp, start_edge, end_edge, device=None):
+    """1D blend weights for one tile: linear ramps on sides that overlap a neighbour, flat against the frame border."""
+    weight = torch.ones(size, device=device)
+    ramp = min(ramp, size)
+    if ramp > 0:
+        r = torch.arange(1, ramp + 1, device=device, dtype=weight.dtype) / (ramp + 1)
+        if not start_edge:
+            weight[:ramp] = r
+        if not end_edge:
+            weight[-ramp:] = torch.minimum(weight[-ramp:], r.flip(0))
+    return weight
+
+
 class WanVAE(nn.Module):
 
     def __init__(self,
@@ -500,16 +522,29 @@ class WanVAE(nn.Module):
         x_recon = self.decode(z)
         return x_recon, mu, log_var
 
-    def encode(self, x):
+    def alloc_output(self, chunk, frames, output_device=None):
+        """Output buffer sized from the first chunk. Pinned when streaming from an accelerator to the CPU."""
+        shape = (*chunk.shape[:2], frames, *chunk.shape[3:])
+        device = chunk.device if output_device is None else torch.device(output_device)
+        pin = device.type == "cpu" and chunk.device.type == "cuda"
+        return torch.empty(shape, dtype=chunk.dtype, device=device, pin_memory=pin)
+
+    def write_output(self, out, chunk, t_start):
+        t_end = t_start + chunk.shape[2]
+        out[:, :, t_start:t_end] = chunk.to(out.device, non_blocking=out.is_pinned())
+        return t_end
+
+    def encode(self, x, output_device=None):
         self.clear_cache()
         ## cache
         t = x.shape[2]
         iter_ = 1 + (t - 1) // 4
+        t_out = 1 + (iter_ - 1) * (4 // 2 ** sum(self.temperal_downsample))
         ## 对encode输入的x，按时间拆分为1、4、4、4....
         for i in range(iter_):
             self._enc_conv_idx = [0]
             if i == 0:
-                out = self.encoder(
+                out_ = self.encoder(
                     x[:, :, :1, :, :],
                     feat_cache=self._enc_feat_map,
                     feat_idx=self._enc_conv_idx)
@@ -518,32 +553,79 @@ class WanVAE(nn.Module):
                     x[:, :, 1 + 4 * (i - 1):1 + 4 * i, :, :],
                     feat_cache=self._enc_feat_map,
                     feat_idx=self._enc_conv_idx)
-                out = torch.cat([out, out_], 2)
-        mu, log_var = self.conv1(out).chunk(2, dim=1)
+            mu_, log_var_ = self.conv1(out_).chunk(2, dim=1)     # conv1 is pointwise, so it can run per chunk
+            if i == 0:
+                mu = self.alloc_output(mu_, t_out, output_device)
+                t_pos = 0
+            t_pos = self.write_output(mu, mu_, t_pos)
+        if mu.is_pinned():
+            torch.cuda.synchronize(x.device)
         self.clear_cache()
-        return mu
+        return mu[:, :, :t_pos]
 
-    def decode(self, z):
+    def decode(self, z, output_device=None):
         self.clear_cache()
         # z: [b,c,t,h,w]
 
         iter_ = z.shape[2]
+        t_out = 1 + (iter_ - 1) * 2 ** sum(self.temperal_upsample)
         x = self.conv2(z)
         for i in range(iter_):
             self._conv_idx = [0]
+            out_ = self.decoder(
+                x[:, :, i:i + 1, :, :],
+                feat_cache=self._feat_map,
+                feat_idx=self._conv_idx)
             if i == 0:
-                out = self.decoder(
-                    x[:, :, i:i + 1, :, :],
-                    feat_cache=self._feat_map,
-                    feat_idx=self._conv_idx)
-            else:
-                out_ = self.decoder(
-                    x[:, :, i:i + 1, :, :],
-                    feat_cache=self._feat_map,
-                    feat_idx=self._conv_idx)
-                out = torch.cat([out, out_], 2)
+                out = self.alloc_output(out_, t_out, output_device)
+                t_pos = 0
+            t_pos = self.write_output(out, out_, t_pos)
+        if out.is_pinned():
+            torch.cuda.synchronize(z.device)
         self.clear_cache()
-        return out
+        return out[:, :, :t_pos]
+
+    def tiled(self, fn, x, tile_size, tile_overlap, in_scale, out_scale, output_device=None):
+        """Run fn over overlapping spatial tiles and blend the seams. Sizes are in latent cells.
+        fn is encode/decode, which reset the causal feat_cache per call, so every tile carries its own cache through all temporal chunks.
+        Tiles are blended in float32 and the result is cast back to the tile dtype once, so bf16 tiles don't band at the seams."""
+        if x.shape[-2] % in_scale or x.shape[-1] % in_scale:
+            raise ValueError(f"Invalid input size: tiled encode needs height and width divisible by {in_scale}, got {x.shape[-2]}x{x.shape[-1]}.")
+        h, w = x.shape[-2] // in_scale, x.shape[-1] // in_scale
+        out, weight, dtype = None, None, None
+        for y0 in get_tile_starts(h, tile_size, tile_overlap):
+            for x0 in get_tile_starts(w, tile_size, tile_overlap):
+                th, tw = min(tile_size, h - y0), min(tile_size, w - x0)
+                tile = fn(x[..., y0 * in_scale:(y0 + th) * in_scale, x0 * in_scale:(x0 + tw) * in_scale])
+                
+                if out is None:
+                    device = tile.device if output_device is None else torch.device(output_device)
+                    dtype  = tile.dtype
+                    out    = torch.zeros((*tile.shape[:3], h * out_scale, w * out_scale), dtype=torch.float32, device=device)
+                    weight = torch.zeros((h * out_scale, w * out_scale), dtype=torch.float32, device=device)
+                
+                ramp   = tile_overlap * out_scale
+                wy     = get_tile_ramp(th * out_scale, ramp, y0 == 0, y0 + th == h, device=out.device)
+                wx     = get_tile_ramp(tw * out_scale, ramp, x0 == 0, x0 + tw == w, device=out.device)
+                tile_w = (wy[:, None] * wx[None, :]).to(torch.float32)
+                
+                ys = slice(y0 * out_scale, (y0 + th) * out_scale)
+                xs = slice(x0 * out_scale, (x0 + tw) * out_scale)
+                out[..., ys, xs] += tile.to(out.device, torch.float32) * tile_w
+                weight[ys, xs]   += tile_w
+                del tile
+        
+        return out.div_(weight).to(dtype)
+
+    def tiled_encode(self, x, tile_size=256, tile_overlap=64, output_device=None):
+        """Spatially tiled encode. tile_size and tile_overlap are in pixels and are rounded down to the downscale factor."""
+        scale = 2 ** (len(self.dim_mult) - 1)
+        return self.tiled(self.encode, x, tile_size // scale, tile_overlap // scale, scale, 1, output_device)
+
+    def tiled_decode(self, z, tile_size=32, tile_overlap=8, output_device=None):
+        """Spatially tiled decode. tile_size and tile_overlap are in latent cells."""
+        scale = 2 ** (len(self.dim_mult) - 1)
+        return self.tiled(self.decode, z, tile_size, tile_overlap, 1, scale, output_device)
 
     def reparameterize(self, mu, log_var):
         std = torch.exp(0.5 * log_var)
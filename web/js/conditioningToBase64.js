@@ -6,12 +6,16 @@ app.registerExtension({
 	name: "res4lyf.ConditioningToBase64",
 	async beforeRegisterNodeDef(nodeType, nodeData, app) {
 		if (nodeData.name === "ConditioningToBase64") {
+			// display widgets are appended after the node's own input widgets (format, dtype)
 			function populate(text) {
 				if (this.widgets) {
-					for (let i = 1; i < this.widgets.length; i++) {
-						this.widgets[i].onRemove?.();
+					const pos = this.widgets.findIndex((w) => w.name === "text2");
+					if (pos !== -1) {
+						for (let i = pos; i < this.widgets.length; i++) {
+							this.widgets[i].onRemove?.();
+						}
+						this.widgets.length = pos;
 					}
-					this.widgets.length = 1;
 				}
 
 				const v = [...text];
@@ -49,7 +53,15 @@ app.registerExtension({
 			nodeType.prototype.onConfigure = function () {
 				onConfigure?.apply(this, arguments);
 				if (this.widgets_values?.length) {
-					populate.call(this, this.widgets_values.slice(+this.widgets_values.length > 1));
+					const inputs = this.widgets?.filter((w) => w.name !== "text2") ?? [];
+					// workflows saved before the format/dtype widgets existed only hold the text
+					const legacy = inputs.length && !inputs[0].options?.values?.includes(this.widgets_values[0]);
+					if (legacy) {
+						for (const w of inputs) {
+							w.value = w.options.values[0];
+						}
+					}
+					populate.call(this, this.widgets_values.slice(legacy ? 0 : inputs.length));
 				}
 			};
 		}